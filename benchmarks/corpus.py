@@ -0,0 +1,258 @@
+"""
+Deterministic generator of synthetic torch-heavy Python modules for benchmarks.
+
+The same seed and parameters always produce byte-identical files,
+so benchmark results from different checkouts are comparable.
+"""
+
+import argparse
+import hashlib
+import os
+import random
+from typing import Callable, List
+
+IMPORTS = [
+    "import torch",
+    "import torch as th",
+    "import torch.nn as nn",
+    "import torch.nn.functional as F",
+    "from torch import nn as tnn",
+    "from torch.utils.data import DataLoader",
+    "from torch.utils.checkpoint import checkpoint",
+    "import torchvision",
+    "import torchvision.models as models",
+    "from torchvision import transforms",
+    "from torchvision.models import resnet50",
+    "import functorch",
+    "from functorch import vmap, grad",
+    "from torch.cuda.amp import autocast",
+    "import numpy as np",
+    "import os",
+]
+
+# Deprecated symbols from `deprecated_symbols.yaml`, through different aliases.
+DEPRECATED_CALLS = [
+    "torch.solve({a}, {b})",
+    "torch.qr({a})",
+    "torch.symeig({a})",
+    "torch.chain_matmul({a}, {b}, {a})",
+    "torch.cholesky({a})",
+    "th.ger({a}, {b})",
+    "torch.lu_solve({a}, {b}, {a})",
+    "torch.norm({a})",
+    "torch.range(0, {n})",
+    "th.svd({a})",
+    "torch.triangular_solve({a}, {b})",
+    "torch.matrix_rank({a})",
+    "torch.lstsq({a}, {b})",
+    "nn.UpsamplingNearest2d(scale_factor={n})",
+    "torch.nn.UpsamplingBilinear2d(scale_factor={n})",
+    "torch.testing.assert_allclose({a}, {b})",
+    "torch.nn.utils.weight_norm({a})",
+    "torch.cuda.amp.autocast()",
+    "autocast(dtype=torch.float16)",
+    "torch.cpu.amp.autocast()",
+    "functorch.vmap({f})({a})",
+    "vmap({f}, in_dims=0)({a})",
+    "grad({f})({a})",
+    "functorch.jacrev({f})({a})",
+]
+
+# Calls that are fine or only reported by some of the rules.
+OTHER_CALLS = [
+    "torch.log(1 + {a})",
+    "torch.exp({a}) - 1",
+    "torch.log(torch.sum(torch.exp({a}), dim=1))",
+    "torch.matmul({a}, {b})",
+    "F.relu({a})",
+    "th.cat([{a}, {b}], dim=0)",
+    "torch.zeros({n}, {n})",
+    "{a}.sum(dim=-1)",
+    "np.mean({a})",
+    "os.path.join('a', 'b')",
+]
+
+OPERATIONS = [
+    "torch.add",
+    "torch.mul",
+    "torch.sub",
+    "th.maximum",
+    "torch.where",
+    "F.softplus",
+]
+
+
+class _ModuleWriter:
+    def __init__(self, rng: random.Random) -> None:
+        self.rng = rng
+        self.lines: List[str] = []
+        self.counter = 0
+
+    def name(self, prefix: str) -> str:
+        self.counter += 1
+        return f"{prefix}_{self.counter}"
+
+    def var(self) -> str:
+        return self.rng.choice(["x", "y", "weights", "self.buffer", "batch[0]"])
+
+    def fill(self, template: str) -> str:
+        return template.format(
+            a=self.var(),
+            b=self.var(),
+            n=self.rng.randint(1, 64),
+            f=self.rng.choice(["model", "loss_fn", "torch.sin", "F.relu"]),
+        )
+
+    def nested_expression(self, depth: int) -> str:
+        if depth == 0:
+            if self.rng.random() < 0.1:
+                return self.fill("torch.exp({a}) - 1")
+            return self.var()
+        operation = self.rng.choice(OPERATIONS)
+        left = self.nested_expression(depth - 1)
+        right = self.nested_expression(self.rng.randint(0, depth - 1))
+        if operation == "F.softplus":
+            return f"{operation}({left})"
+        return f"{operation}({left}, {right})"
+
+    def function(self, max_depth: int) -> None:
+        name = self.name("compute")
+        self.lines.append(f"def {name}(x, y, weights, batch, model, loss_fn):")
+        for _ in range(self.rng.randint(2, 8)):
+            target = self.name("t")
+            kind = self.rng.random()
+            if kind < 0.3:
+                value = self.fill(self.rng.choice(DEPRECATED_CALLS))
+            elif kind < 0.7:
+                value = self.fill(self.rng.choice(OTHER_CALLS))
+            else:
+                value = self.nested_expression(self.rng.randint(1, max_depth))
+            self.lines.append(f"    {target} = {value}")
+        self.lines.append(f"    return {target}")
+        self.lines.append("")
+
+    def data_loading(self) -> None:
+        name = self.name("load")
+        weights_only = self.rng.choice(["", ", weights_only=True", ", mmap=True"])
+        workers = self.rng.choice(["", ", num_workers=4", ", pin_memory=True"])
+        self.lines += [
+            f"def {name}(path, dataset):",
+            f"    state = torch.load(path{weights_only})",
+            f"    loader = DataLoader(dataset, batch_size=32{workers})",
+            "    for batch in loader:",
+            "        yield state, batch",
+            "",
+        ]
+
+    def model_class(self, max_depth: int) -> None:
+        name = self.name("Model").title().replace("_", "")
+        pretrained = self.rng.choice(["pretrained=True", "weights=None", ""])
+        self.lines += [
+            f"class {name}(nn.Module):",
+            "    def __init__(self):",
+            "        super().__init__()",
+            f"        self.backbone = models.resnet18({pretrained})",
+            f"        self.head = resnet50({pretrained})",
+            "        self.upsample = nn.UpsamplingNearest2d(scale_factor=2)",
+            "        self.buffer = torch.zeros(10)",
+            "        self.buffer.require_grad = True",
+            "",
+            "    def forward(self, x):",
+            f"        y = {self.nested_expression(max_depth)}",
+            "        return checkpoint(self.head, y)",
+            "",
+            "    def train_step(self, optimizer, x):",
+            "        optimizer.zero_grad()",
+            "        for p in self.parameters():",
+            "            p.grad = None",
+            "        return self(x)",
+            "",
+        ]
+
+    def plain_code(self) -> None:
+        name = self.name("helper")
+        self.lines += [
+            f"def {name}(items):",
+            "    result = {}",
+            "    for index, item in enumerate(items):",
+            "        if index % 2 == 0:",
+            "            result[item] = [i * 2 for i in range(index)]",
+            "        else:",
+            '            result[item] = f"{item}-{index}"',
+            "    return result",
+            "",
+        ]
+
+
+def generate_module(seed: int, lines: int = 300, max_depth: int = 6) -> str:
+    """
+    Generate a module of roughly `lines` lines, with nested expressions
+    up to `max_depth` calls deep.
+    """
+    rng = random.Random(seed)
+    writer = _ModuleWriter(rng)
+    writer.lines.append(f'"""Synthetic benchmark module {seed}."""')
+    writer.lines += rng.sample(IMPORTS, rng.randint(6, len(IMPORTS)))
+    writer.lines += [
+        # The generated code always uses these names.
+        "import torch",
+        "import torch as th",
+        "import torch.nn as nn",
+        "import torch.nn.functional as F",
+        "import numpy as np",
+        "import os",
+        "",
+    ]
+    blocks: List[Callable[[], None]] = [
+        lambda: writer.function(max_depth),
+        lambda: writer.function(max_depth),
+        writer.data_loading,
+        lambda: writer.model_class(max_depth),
+        writer.plain_code,
+    ]
+    while len(writer.lines) < lines:
+        rng.choice(blocks)()
+    return "\n".join(writer.lines) + "\n"
+
+
+def generate_corpus(
+    directory: str, files: int = 40, lines: int = 300, seed: int = 0
+) -> List[str]:
+    """
+    Write `files` generated modules to `directory` and return their paths.
+    File sizes vary between a quarter and twice `lines`, in a fixed order.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(files):
+        file_lines = rng.randint(max(lines // 4, 1), lines * 2)
+        path = os.path.join(directory, f"module_{i:05}.py")
+        with open(path, "w") as f:
+            f.write(generate_module(seed * 1_000_003 + i, file_lines))
+        paths.append(path)
+    return paths
+
+
+def corpus_digest(paths: List[str]) -> str:
+    """Digest of the corpus content, to check that results are comparable."""
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("directory")
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--lines", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = generate_corpus(args.directory, args.files, args.lines, args.seed)
+    print(f"Generated {len(paths)} files, digest {corpus_digest(paths)}")
+
+
+if __name__ == "__main__":
+    main()
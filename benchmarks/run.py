@@ -0,0 +1,268 @@
+"""
+Throughput benchmarks for the TorchFix flake8 plugin and codemod paths.
+
+Each harness runs in a separate process over a generated corpus
+(see `benchmarks.corpus`) and reports files per second, peak RSS
+and time per processing phase. Results are written as JSON, which can be
+compared against a baseline from another checkout:
+
+    python -m benchmarks.run --output main.json          # on main
+    python -m benchmarks.run --compare main.json         # on the PR branch
+"""
+
+import argparse
+import ast
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+HARNESSES = ["checker", "codemod"]
+
+# Relative slowdown of files per second, or growth of peak RSS,
+# reported as a regression by `--compare`.
+DEFAULT_THRESHOLD = 0.10
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    if sys.platform == "darwin":
+        peak //= 1024
+    return peak / 1024
+
+
+def _add_phase(phases: Dict[str, float], name: str, seconds: float) -> None:
+    phases[name] = phases.get(name, 0.0) + seconds
+
+
+def run_checker(paths: List[str]) -> Dict[str, Any]:
+    """
+    Run the flake8 plugin entry point the way flake8 calls it,
+    with the `ast` tree that flake8 has already parsed, outside the timing.
+    """
+    from torchfix.executor import warm_up
+    from torchfix.torchfix import TorchChecker
+
+    warm_up()
+    phases: Dict[str, float] = {}
+    violations = 0
+    started_at = time.perf_counter()
+    for path in paths:
+        with open(path) as f:
+            lines = f.readlines()
+        parse_started_at = time.perf_counter()
+        tree = ast.parse("".join(lines))
+        # Not part of the plugin's time.
+        started_at += time.perf_counter() - parse_started_at
+        phase_started_at = time.perf_counter()
+        checker = TorchChecker(tree, lines)
+        _add_phase(phases, "init", time.perf_counter() - phase_started_at)
+        phase_started_at = time.perf_counter()
+        violations += len(list(checker.run()))
+        _add_phase(phases, "run", time.perf_counter() - phase_started_at)
+    return {
+        "seconds": time.perf_counter() - started_at,
+        "violations": violations,
+        "phases": phases,
+    }
+
+
+def run_codemod(paths: List[str]) -> Dict[str, Any]:
+    """
+    Run `TorchCodemod` in-process, with the default `torchfix` settings
+    except for caching. Phase times come from `--profile` instrumentation.
+    """
+    import libcst.codemod as codemod
+
+    from torchfix.executor import DIFF_CONTEXT, execute_code, warm_up
+    from torchfix.torchfix import (
+        process_error_code_str,
+        TorchCodemod,
+        TorchCodemodConfig,
+    )
+
+    warm_up()
+    config = TorchCodemodConfig(select=list(process_error_code_str(None)), profile=True)
+    transformer = TorchCodemod(codemod.CodemodContext(), config)
+    phases: Dict[str, float] = {}
+    violations = 0
+    started_at = time.perf_counter()
+    for path in paths:
+        with open(path, "rb") as f:
+            code = f.read()
+        result = execute_code(transformer, path, code, DIFF_CONTEXT)
+        if result.status == "failure":
+            raise RuntimeError(f"Failed to process {path}")
+        violations += len(result.violations)
+        assert result.profile is not None
+        for name, seconds in result.profile["phases"].items():
+            _add_phase(phases, name, seconds)
+    return {
+        "seconds": time.perf_counter() - started_at,
+        "violations": violations,
+        "phases": phases,
+    }
+
+
+def _run_harness_process(name: str, corpus: str) -> Dict[str, Any]:
+    """Run a harness in a fresh process, so that peak RSS is not shared."""
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "--harness", name, corpus],
+        cwd=REPO_ROOT,
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    return json.loads(output)
+
+
+def _corpus_paths(corpus: str) -> List[str]:
+    return sorted(
+        os.path.join(corpus, name)
+        for name in os.listdir(corpus)
+        if name.endswith(".py")
+    )
+
+
+def run_benchmarks(corpus: str, harnesses: List[str]) -> Dict[str, Any]:
+    import libcst
+
+    from benchmarks.corpus import corpus_digest
+    from torchfix.torchfix import __version__
+
+    paths = _corpus_paths(corpus)
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    results: Dict[str, Any] = {
+        "meta": {
+            "torchfix": __version__,
+            "libcst": getattr(libcst, "__version__", "unknown"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus_digest": corpus_digest(paths),
+            "files": len(paths),
+            "bytes": total_bytes,
+        },
+        "harnesses": {},
+    }
+    for name in harnesses:
+        result = _run_harness_process(name, corpus)
+        result["files_per_sec"] = len(paths) / result["seconds"]
+        result["bytes_per_sec"] = total_bytes / result["seconds"]
+        results["harnesses"][name] = result
+    return results
+
+
+def print_results(results: Dict[str, Any]) -> None:
+    meta = results["meta"]
+    print(f"Corpus: {meta['files']} files, {meta['bytes']} bytes")
+    for name, result in results["harnesses"].items():
+        print(
+            f"{name}: {result['files_per_sec']:.2f} files/s, "
+            f"{result['seconds']:.3f}s, peak RSS {result['peak_rss_mb']:.1f} MiB, "
+            f"{result['violations']} violations"
+        )
+        total = sum(result["phases"].values()) or 1.0
+        for phase, seconds in sorted(result["phases"].items(), key=lambda p: -p[1]):
+            print(f"  {phase:<50} {seconds:10.3f}s {seconds / total:7.1%}")
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], threshold: float
+) -> bool:
+    """Print the differences from `baseline` and return whether any regressed."""
+    if results["meta"]["corpus_digest"] != baseline["meta"]["corpus_digest"]:
+        print("WARNING: the baseline was measured on a different corpus.")
+    regressed = False
+    for name, result in results["harnesses"].items():
+        base = baseline["harnesses"].get(name)
+        if base is None:
+            continue
+        speed = result["files_per_sec"] / base["files_per_sec"] - 1
+        rss = result["peak_rss_mb"] / base["peak_rss_mb"] - 1
+        flags = []
+        if speed < -threshold:
+            flags.append("SLOWER")
+        if rss > threshold:
+            flags.append("MORE MEMORY")
+        if result["violations"] != base["violations"]:
+            flags.append("DIFFERENT VIOLATIONS")
+        regressed = regressed or bool(flags)
+        print(
+            f"{name}: files/s {speed:+.1%}, peak RSS {rss:+.1%}, "
+            f"violations {base['violations']} -> {result['violations']} "
+            f"{' '.join(flags)}"
+        )
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "corpus",
+        nargs="?",
+        help="Directory with the corpus. Generated in a temporary directory "
+        "if not provided.",
+    )
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--lines", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--harnesses",
+        default=",".join(HARNESSES),
+        help="Comma-separated list of harnesses to run.",
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument(
+        "--compare",
+        metavar="BASELINE",
+        help="Compare with the results in this JSON file, "
+        "and exit with 1 if there are regressions.",
+    )
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--harness", choices=HARNESSES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.harness is not None:
+        # Internal: run a single harness in this process.
+        run = run_checker if args.harness == "checker" else run_codemod
+        result = run(_corpus_paths(os.path.abspath(args.corpus)))
+        result["peak_rss_mb"] = _peak_rss_mb()
+        json.dump(result, sys.stdout)
+        return
+
+    harnesses = [name.strip() for name in args.harnesses.split(",")]
+    for name in harnesses:
+        if name not in HARNESSES:
+            parser.error(f"Unknown harness: {name}, available: {HARNESSES}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus = args.corpus and os.path.abspath(args.corpus)
+        if corpus is None:
+            from benchmarks.corpus import generate_corpus
+
+            corpus = tmp_dir
+            generate_corpus(corpus, args.files, args.lines, args.seed)
+        results = run_benchmarks(corpus, harnesses)
+
+    print_results(results)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@ torchvision.models.detection.ssdlite320_mobilenet_v3_large(pretrained=True, pret
 pretrained = random.choice([False, True])
 # can't codemod, but can report
 torchvision.models.resnet50(pretrained=pretrained)
+torchvision.models.resnet50(pretrained=random.random() > 0.5)
 
 # ok
 from torchvision.models import ResNet50_Weights
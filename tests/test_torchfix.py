@@ -1,18 +1,65 @@
+import ast
+import io
+import json
 import logging
 import subprocess
+import sys
+import time
+from dataclasses import replace
 from pathlib import Path
+from typing import List, Set, Tuple, Union
 
+import pytest
+import yaml
+
+import libcst as cst
 import libcst.codemod as codemod
+from libcst.codemod.visitors import ImportItem
+from libcst.metadata import QualifiedNameProvider, WhitespaceInclusivePositionProvider
+from benchmarks.corpus import corpus_digest, generate_corpus
+from torchfix.api import lint_sources
+from torchfix.cache import ResultCache
+from torchfix.ast_checker import AstContext, visit_ast
+from torchfix.common import deep_multi_replace, TorchError, TorchNamesVisitor
+from torchfix.client import request
+from torchfix.dispatch import visit_cst
+from torchfix.executor import (
+    execute_blobs,
+    execute_code,
+    execute_file,
+    execute_files,
+    looks_generated,
+    SERIAL_MAX_FILES,
+    WorkerLimits,
+)
+from torchfix.git import changed_files, staged_blobs, tree_blobs
+from torchfix.names import TORCH_ROOTS, TorchQualifiedNameProvider
+from torchfix.plan import apply_file_plan
+from torchfix.prefilter import filter_files, MMAP_THRESHOLD
+from torchfix.report import SarifReporter
+from torchfix.rules import compile_rules
+from torchfix.rewrite import OverlappingEdits, replace_nodes, splice_fixes
+from torchfix.shard import shard_files
 from torchfix.torchfix import (
     DISABLED_BY_DEFAULT,
     expand_error_codes,
     GET_ALL_ERROR_CODES,
     GET_ALL_VISITORS,
+    get_visitors,
     process_error_code_str,
     TorchChecker,
     TorchCodemod,
     TorchCodemodConfig,
+    TriggerMatcher,
+)
+from torchfix.visitors import (
+    TorchExpm1Visitor,
+    TorchLog1pVisitor,
+    TorchUnsafeLoadVisitor,
+    TorchVisionDeprecatedPretrainedVisitor,
+    TorchVisionSingletonImportVisitor,
 )
+from torchfix.watch import create_watcher, PollingWatcher, violations_delta, watch
 
 FIXTURES_PATH = Path(__file__).absolute().parent / "fixtures"
 LOGGER = logging.getLogger(__name__)
@@ -86,6 +133,15 @@ def test_checker_fixtures(checker_source_path: Path):
     assert results == expected_results
 
 
+def test_checker_backends(checker_source_path: Path):
+    # The plugin detects violations on `ast` trees, libcst must agree.
+    checker = TorchChecker(None, checker_source_path.read_text().splitlines(True))
+    if checker.module is not None:
+        ast_results = [v.flake8_result() for v in checker._ast_violations()]
+        cst_results = [v.flake8_result() for v in checker._cst_violations()]
+        assert ast_results == cst_results
+
+
 def test_codemod_fixtures(codemod_source_path: Path):
     expected_path = codemod_source_path.with_stem(
         codemod_source_path.stem.replace(".in", ".out")
@@ -104,6 +160,78 @@ def test_errorcodes_distinct():
             seen.add(e.error_code)
 
 
+def test_torch_qualified_name_provider():
+    # Same names as from `QualifiedNameProvider` for all torch names.
+    for path in sorted(FIXTURES_PATH.glob("**/*.py")):
+        module = cst.parse_module(path.read_text())
+        wrapper = cst.MetadataWrapper(module, unsafe_skip_copy=True)
+        names = wrapper.resolve(TorchQualifiedNameProvider)
+
+        class Checker(cst.BatchableCSTVisitor):
+            METADATA_DEPENDENCIES = (QualifiedNameProvider,)
+
+            def check(self, node: cst.CSTNode) -> None:
+                expected = set(self.get_metadata(QualifiedNameProvider, node))
+                if node in names:
+                    assert set(names[node]) == expected, module.code_for_node(node)
+                else:
+                    assert all(
+                        name.name.split(".")[0] not in TORCH_ROOTS for name in expected
+                    )
+
+            def visit_Call(self, node: cst.Call) -> None:
+                self.check(node)
+
+            def visit_Attribute(self, node: cst.Attribute) -> None:
+                self.check(node)
+
+        wrapper.visit_batched([Checker()])
+
+
+def test_trigger_tokens():
+    matcher = TriggerMatcher(
+        [
+            TorchExpm1Visitor,
+            TorchLog1pVisitor,
+            TorchUnsafeLoadVisitor,
+            TorchVisionSingletonImportVisitor,
+        ]
+    )
+    assert matcher.match(b"import torch\n") == set()
+    assert matcher.match(b"import torchvision\ntorch.load(x, exp)") == {
+        TorchExpm1Visitor,
+        TorchUnsafeLoadVisitor,
+        TorchVisionSingletonImportVisitor,
+    }
+    # Only whole identifiers.
+    assert matcher.match(b"catalog = exp_log(log)") == {TorchLog1pVisitor}
+
+    # No visitor to run, so nothing is parsed.
+    checker = TorchChecker(None, ["import torch\n", "def (\n"])
+    assert checker.module is None and list(checker.run()) == []
+
+
+def test_checker_selection(monkeypatch):
+    # Only the visitors for codes enabled in flake8 are run.
+    from flake8.options.parse_args import parse_args  # type: ignore[import-untyped]
+
+    monkeypatch.setattr(TorchChecker, "enabled_visitor_classes", None)
+    lines = ["import torch\n", "torch.load(f)\n", "a.require_grad = True\n"]
+    parse_args(["--isolated", "--select=TOR1", "x.py"])
+    assert [result.split()[1] for result in _checker_results(lines)] == ["TOR102"]
+    parse_args(["--isolated", "--select=E,W", "x.py"])
+    assert TorchChecker(None, lines).module is None
+
+
+def test_reusable_visitors():
+    # Visitors are reused across modules, without the previous results.
+    first = _checker_results(["import torch\n", "torch.load(f)\n"])
+    (visitor,) = get_visitors({TorchUnsafeLoadVisitor})
+    assert visitor.violations == []
+    assert get_visitors({TorchUnsafeLoadVisitor}) == [visitor]
+    assert _checker_results(["import torch\n", "torch.load(f)\n"]) == first
+
+
 def test_parse_error_code_str(case, expected):
     assert process_error_code_str(case) == expected
 
@@ -121,3 +249,752 @@ def test_no_python_files(tmp_path):
     )
     # Check that the script exits successfully
     assert result.returncode == 0
+
+
+def test_result_cache(tmp_path):
+    cache = ResultCache(str(tmp_path), salt="test", max_size=0)
+    assert cache.load(b"import torch") is None
+    cache.store(b"import torch", [], None, "utf-8")
+    assert cache.load(b"import torch") == {
+        "violations": [],
+        "code": None,
+        "encoding": "utf-8",
+        "warnings": [],
+    }
+    assert ResultCache(str(tmp_path), salt="other").load(b"import torch") is None
+
+    cache.prune()
+    assert cache.load(b"import torch") is None
+
+
+def test_cached_run(tmp_path):
+    source_path = FIXTURES_PATH / "security" / "checker" / "load.py"
+    (tmp_path / "load.py").write_text(source_path.read_text())
+    cache_dir = tmp_path / "cache"
+
+    def run():
+        return subprocess.run(
+            ["python3", "-m", "torchfix", "--cache-dir", str(cache_dir), "load.py"],
+            capture_output=True,
+            text=True,
+            cwd=tmp_path,
+        )
+
+    first = run()
+    assert any(cache_dir.iterdir())
+    second = run()
+    assert first.returncode == second.returncode == 0
+    assert "TOR102" in first.stdout
+    assert sorted(first.stdout.splitlines()) == sorted(second.stdout.splitlines())
+    assert first.stderr == second.stderr
+
+
+def test_filter_files(tmp_path):
+    (tmp_path / "a.py").write_text("import torch\n")
+    (tmp_path / "b.py").write_text("import numpy\n")
+    (tmp_path / "c.py").write_text("#" * MMAP_THRESHOLD + "\nimport functorch\n")
+    (tmp_path / "d.py").write_text("#" * MMAP_THRESHOLD + "\n")
+    files = [str(tmp_path / name) for name in ("a.py", "b.py", "c.py", "d.py")]
+    assert list(filter_files(files)) == [files[0], files[2]]
+
+
+def test_execute_files_scheduling(tmp_path):
+    files = []
+    for i in range(SERIAL_MAX_FILES * 3):
+        files.append(str(tmp_path / f"{i}.py"))
+        Path(files[-1]).write_text("import torch\ntorch.load(f)\n")
+    config = TorchCodemodConfig(select=["TOR102"])
+    transformer = TorchCodemod(codemod.CodemodContext(), config)
+
+    # Small input, processed in the current process,
+    # largest remembered timing first.
+    timings = {files[0]: 0.1, files[1]: 0.5, files[2]: 0.3}
+    results = list(
+        execute_files(transformer, files[:3], jobs=2, unified_diff=1, timings=timings)
+    )
+    assert [r.filename for r in results] == [files[1], files[2], files[0]]
+
+    results = list(execute_files(transformer, files, jobs=2, unified_diff=1))
+    assert sorted(r.filename for r in results) == sorted(files)
+    assert all(len(r.violations) == 1 for r in results)
+
+    # Workers are replaced after every file.
+    for limits in [WorkerLimits(max_files=1), WorkerLimits(max_rss=1)]:
+        results = list(
+            execute_files(
+                transformer, files, jobs=2, unified_diff=1, worker_limits=limits
+            )
+        )
+        assert sorted(r.filename for r in results) == sorted(files)
+        assert all(len(r.violations) == 1 for r in results)
+        assert all((r.worker_rss is not None) == bool(limits.max_rss) for r in results)
+
+
+def test_file_limits(tmp_path, monkeypatch):
+    code = b"import torch\ntorch.load(f)\n"
+    config = TorchCodemodConfig(select=["TOR102"], max_file_bytes=len(code) - 1)
+    transformer = TorchCodemod(codemod.CodemodContext(), config)
+    result = execute_code(transformer, "test.py", code)
+    assert result.status == "limit"
+    assert result.over_limit == f"larger than {len(code) - 1} bytes"
+
+    # Files over the limit aren't read.
+    class UnreadableFile(io.FileIO):
+        def read(self, *args):
+            raise AssertionError("read")
+
+    path = tmp_path / "test.py"
+    path.write_bytes(code)
+    monkeypatch.setattr("torchfix.executor.open", UnreadableFile, raising=False)
+    result = execute_file(transformer, str(path))
+    assert result.over_limit == f"larger than {len(code) - 1} bytes"
+    monkeypatch.undo()
+
+    config.max_file_bytes = None
+    config.file_timeout = 1e-6
+    result = execute_code(transformer, "test.py", code * 100)
+    assert result.status == "limit"
+    assert result.over_limit is not None and "took longer" in result.over_limit
+
+    config.file_timeout = None
+    assert execute_code(transformer, "test.py", code).status == "success"
+
+    assert not looks_generated(code)
+    assert looks_generated(b"# Generated by the protocol buffer compiler.\n" + code)
+    assert looks_generated(b"import torch; " * 1000)
+    result = execute_code(transformer, "test.py", b"import torch; " * 1000)
+    assert result.status == "limit"
+    assert result.over_limit == "generated or minified"
+
+    # Hand-written comments like this don't mark files as generated.
+    code = b"# NOTE: do not edit the default below without updating docs\n" + code
+    assert not looks_generated(code)
+    result = execute_code(transformer, "test.py", code)
+    assert [r["error_code"] for r in result.violations] == ["TOR102"]
+
+
+def test_report_only(tmp_path, monkeypatch):
+    select = list(GET_ALL_ERROR_CODES())
+    transformer = TorchCodemod(
+        codemod.CodemodContext(), TorchCodemodConfig(select=select)
+    )
+    report_config = TorchCodemodConfig(
+        select=select, cache_dir=str(tmp_path), report_only=True
+    )
+    report_transformer = TorchCodemod(codemod.CodemodContext(), report_config)
+    cached = 0
+    for path in sorted(FIXTURES_PATH.glob("**/*.py")):
+        code = path.read_bytes()
+        expected = execute_code(transformer, str(path), code, unified_diff=1)
+        # The second time from the cache, unless the file wasn't parsed.
+        for _ in range(2):
+            result = execute_code(report_transformer, str(path), code, unified_diff=1)
+            assert result.status == expected.status
+            transform_result = result.transform_result
+            if isinstance(transform_result, codemod.TransformSuccess):
+                assert transform_result.code == ""
+            assert result.violations == [
+                {k: v for k, v in r.items() if k != "replacement"}
+                for r in expected.violations
+            ]
+        cached += result.cached
+    assert cached
+
+    # No replacement is made, but fixable violations are still marked.
+    def fail(*args):
+        raise AssertionError("replacement made")
+
+    monkeypatch.setattr(cst.Call, "with_changes", fail)
+    code = b"import torch\ntorch.range(1, 5)\ntorch.qr(a)\ntorch.ger(a, b)\n"
+    result = execute_code(report_transformer, "a.py", code)
+    assert [(r["error_code"], r["fixable"]) for r in result.violations] == [
+        ("TOR101", True)
+    ] * 3
+
+
+def test_changed_files(tmp_path):
+    def git(*args):
+        subprocess.run(
+            ["git", "-c", "user.name=test", "-c", "user.email=test", *args],
+            cwd=tmp_path,
+            check=True,
+            capture_output=True,
+        )
+
+    for name in ("changed.py", "renamed.py", "deleted.py", "same.py"):
+        (tmp_path / name).write_text("import torch\n")
+    git("init")
+    git("add", ".")
+    git("commit", "-m", "initial")
+
+    (tmp_path / "changed.py").write_text("import torch.nn\n")
+    (tmp_path / "added.py").write_text("import torch\n")
+    (tmp_path / "untracked.py").write_text("import torch\n")
+    (tmp_path / "notes.txt").write_text("torch\n")
+    git("mv", "renamed.py", "new_name.py")
+    git("rm", "deleted.py")
+    git("add", "added.py")
+
+    expected = ["added.py", "changed.py", "new_name.py", "untracked.py"]
+    assert changed_files([str(tmp_path)], rev="HEAD") == [
+        str(tmp_path / name) for name in expected
+    ]
+    assert changed_files([str(tmp_path)], staged=True) == [
+        str(tmp_path / name) for name in ("added.py", "new_name.py")
+    ]
+    assert changed_files([str(tmp_path / "changed.py")], rev="HEAD") == [
+        str(tmp_path / "changed.py")
+    ]
+
+    # Staged content is read from git, not the working tree.
+    (tmp_path / "added.py").write_text("import torch\ntorch.solve(a, b)\n")
+    git("add", "added.py")
+    (tmp_path / "added.py").write_text("import torch\n")
+    blobs = staged_blobs([str(tmp_path)])
+    assert [blob.path for blob in blobs] == [
+        str(tmp_path / name) for name in ("added.py", "new_name.py")
+    ]
+    transformer = TorchCodemod(
+        codemod.CodemodContext(), TorchCodemodConfig(select=["TOR001"])
+    )
+    results = list(execute_blobs(transformer, blobs))
+    assert [r.violations[0]["error_code"] for r in results if r.violations] == [
+        "TOR001"
+    ]
+
+    # Identical blobs are processed once, but reported for each path.
+    blobs = tree_blobs([str(tmp_path)], "HEAD")
+    assert len(blobs) == 4 and len({blob.sha for blob in blobs}) == 1
+    results = list(execute_blobs(transformer, blobs, jobs=1))
+    assert sorted(r.filename for r in results) == [blob.path for blob in blobs]
+
+    # Only the violations are printed with --no-diff, without a diff.
+    (tmp_path / "added.py").write_text("import torch\nx = torch.load(f)\n")
+    git("add", "added.py")
+    git("commit", "-m", "load")
+    for option in (["--staged"], ["--tree", "HEAD"]):
+        if option == ["--staged"]:
+            (tmp_path / "added.py").write_text("import torch\ny = torch.load(f)\n")
+            git("add", "added.py")
+        result = subprocess.run(
+            [sys.executable, "-m", "torchfix", "--no-cache", "--no-diff", *option, "."],
+            cwd=tmp_path,
+            capture_output=True,
+            text=True,
+        )
+        assert result.stdout.splitlines() == [
+            "added.py:2:5: TOR102 [*] `torch.load` without `weights_only` parameter"
+            " is unsafe. Explicitly set `weights_only` to False only if you trust"
+            " the data you load and full pickle functionality is needed,"
+            " otherwise set `weights_only=True`."
+        ], option
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Unix domain sockets only")
+def test_daemon(tmp_path):
+    socket_path = str(tmp_path / "torchfix.sock")
+    daemon = subprocess.Popen(
+        ["python3", "-m", "torchfix", "--daemon", "--socket", socket_path, "-j", "1"],
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(100):
+            if Path(socket_path).exists():
+                break
+            time.sleep(0.1)
+
+        source = "import torch\ntorch.load(f)\n"
+        responses = list(
+            request(
+                socket_path,
+                {
+                    "command": "check",
+                    "fix": True,
+                    "no_cache": True,
+                    "sources": [{"filename": "test.py", "source": source}],
+                },
+            )
+        )
+        assert [r["type"] for r in responses] == ["result", "summary"]
+        assert (
+            responses[0]["code"] == "import torch\ntorch.load(f, weights_only=True)\n"
+        )
+        assert [v["error_code"] for v in responses[0]["violations"]] == ["TOR102"]
+
+        # Files skipped as generated are listed in the summary.
+        (tmp_path / "a.py").write_text(source)
+        (tmp_path / "g.py").write_text(f"# @{''}generated\n{source}")
+        *_, summary = request(
+            socket_path,
+            {"command": "check", "no_cache": True, "paths": [str(tmp_path)]},
+        )
+        assert summary["successes"] == 1
+        assert summary["over_limit"] == [
+            [str(tmp_path / "g.py"), "generated or minified"]
+        ]
+
+        (stats,) = request(socket_path, {"command": "stats"})
+        assert stats["stats"]["requests"] == {"check": 2}
+        assert sum(stats["stats"]["latency"]["check"].values()) == 2
+
+        list(request(socket_path, {"command": "shutdown"}))
+        assert daemon.wait(timeout=10) == 0
+    finally:
+        daemon.kill()
+
+
+def test_machine_readable_formats():
+    source_path = str(FIXTURES_PATH / "security" / "checker" / "load.py")
+    expected = ["TOR102", "TOR102"]
+
+    def run(output_format):
+        return subprocess.run(
+            ["python3", "-m", "torchfix", "--no-cache", "--format", output_format]
+            + [source_path],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+
+    records = [json.loads(line) for line in run("jsonl").splitlines()]
+    assert [r["error_code"] for r in records] == expected
+    assert all(r["path"].endswith("load.py") for r in records)
+    assert any(r["fixable"] and r["replacement"] for r in records)
+
+    sarif = json.loads(run("sarif"))
+    results = sarif["runs"][0]["results"]
+    assert [r["ruleId"] for r in results] == expected
+
+    stream = io.StringIO()
+    SarifReporter("0.0", [("TOR102", "message")], stream).close()
+    sarif = json.loads(stream.getvalue())
+    assert sarif["version"] == "2.1.0"
+    assert sarif["runs"] == [
+        {
+            "tool": {
+                "driver": {
+                    "name": "TorchFix",
+                    "version": "0.0",
+                    "informationUri": "https://github.com/pytorch-labs/torchfix",
+                    "rules": [
+                        {"id": "TOR102", "shortDescription": {"text": "message"}}
+                    ],
+                }
+            },
+            "results": [],
+        }
+    ]
+
+
+def test_profile(tmp_path):
+    source_path = str(FIXTURES_PATH / "security" / "checker" / "load.py")
+    profile_path = tmp_path / "profile.json"
+    subprocess.run(
+        ["python3", "-m", "torchfix", "--profile-json", str(profile_path)]
+        + [source_path],
+        capture_output=True,
+        check=True,
+    )
+    profile = json.loads(profile_path.read_text())
+    assert {"parse", "visitors", "metadata:TorchQualifiedNameProvider"} <= set(
+        profile["phases"]
+    )
+    assert list(profile["files"]) == [source_path]
+    calls = profile["visitors"]["TorchUnsafeLoadVisitor"]["qualified_Call"]["calls"]
+    assert calls > 0
+
+
+def test_benchmark_corpus(tmp_path):
+    paths = generate_corpus(str(tmp_path / "a"), files=3, lines=50)
+    assert corpus_digest(paths) == corpus_digest(
+        generate_corpus(str(tmp_path / "b"), files=3, lines=50)
+    )
+    for path in paths:
+        checker = TorchChecker(None, Path(path).read_text().splitlines(True))
+        assert list(checker.run())
+
+
+@pytest.mark.parametrize("watcher_factory", [create_watcher, PollingWatcher])
+def test_watch(tmp_path, watcher_factory):
+    (tmp_path / "a.py").write_text("import torch\n")
+    (tmp_path / ".git").mkdir()
+    watcher = watcher_factory([str(tmp_path)])
+    if isinstance(watcher, PollingWatcher):
+        watcher.interval = 0.01
+    try:
+        assert watcher.wait(0.05) == set()
+        (tmp_path / "a.py").write_text("import torch\ntorch.solve(a, b)\n")
+        (tmp_path / ".git" / "hidden.py").write_text("")
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "sub" / "b.py").write_text("")
+        changed: Set[str] = set()
+        deadline = time.monotonic() + 5
+        while len(changed) < 2 and time.monotonic() < deadline:
+            changed |= watcher.wait(0.1)
+        assert changed == {str(tmp_path / "a.py"), str(tmp_path / "sub" / "b.py")}
+    finally:
+        watcher.close()
+
+    def record(line, code):
+        return {"line": line, "column": 1, "error_code": code, "message": code}
+
+    # Violations that only moved are not reported.
+    old = [record(1, "TOR001"), record(2, "TOR101")]
+    new = [record(1, "TOR002"), record(3, "TOR001"), record(4, "TOR101")]
+    assert violations_delta(old, new) == ([record(1, "TOR002")], [])
+    assert violations_delta(new, old[:1]) == (
+        [],
+        [record(1, "TOR002"), record(4, "TOR101")],
+    )
+
+
+def test_watch_doesnt_fix(tmp_path, monkeypatch, capsys):
+    source_path = tmp_path / "a.py"
+    source = b"import torch\ntorch.load(f)\n"
+    source_path.write_bytes(source)
+
+    class OneChangeWatcher:
+        def __init__(self):
+            self.changes = [{str(source_path)}, set()]
+
+        def wait(self, timeout=None):
+            if not self.changes:
+                raise KeyboardInterrupt
+            return self.changes.pop(0)
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(
+        "torchfix.watch.create_watcher", lambda paths: OneChangeWatcher()
+    )
+    config = TorchCodemodConfig(select=["TOR102"])
+    with pytest.raises(KeyboardInterrupt):
+        watch([str(tmp_path)], TorchCodemod(codemod.CodemodContext(), config), jobs=1)
+    assert "TOR102" in capsys.readouterr().out
+    # The fixable violation is reported, and the file is left as is.
+    assert source_path.read_bytes() == source
+    assert not config.report_only
+
+
+def test_api():
+    paths = sorted(FIXTURES_PATH.glob("**/codemod/*.in.py"))
+    sources: List[Tuple[str, Union[str, bytes]]] = [
+        (str(path), path.read_text()) for path in paths
+    ]
+    sources.append(("no_marker.py", "x = 1\n"))
+    sources.append(("invalid.py", b"import torch\ntorch.load(\n"))
+    results = list(lint_sources(iter(sources), select="ALL", jobs=2))
+    assert [result.filename for result in results] == [f for f, _ in sources]
+    for path, result in zip(paths, results):
+        expected = path.with_name(path.name.replace(".in.py", ".out.py"))
+        assert result.ok
+        assert (result.fixed_source or path.read_text()) == expected.read_text()
+        assert result.fixed_source is None or any(v.fixable for v in result.violations)
+    assert results[-2].ok and not results[-2].violations
+    assert not results[-1].ok and "ParserSyntaxError" in str(results[-1].error)
+
+    # Serial, with a rule selection.
+    (result,) = lint_sources([("a.py", "import torch\ntorch.qr(a)\n")], ["TOR0"])
+    assert result.violations == () and result.fixed_source is None
+
+    # Fixable violations are marked as such without making the fixes.
+    source = [("a.py", "import torch\ntorch.load(f)\n")]
+    (fixed,) = lint_sources(source)
+    (reported,) = lint_sources(source, config=TorchCodemodConfig(report_only=True))
+    assert [v.fixable for v in fixed.violations] == [True]
+    assert reported.violations == (replace(fixed.violations[0], replacement=None),)
+    assert fixed.fixed_source is not None and reported.fixed_source is None
+
+
+def test_replace_nodes():
+    wrapper = cst.MetadataWrapper(
+        cst.parse_module("a = f(g(1))\nb = [h(2), k(3)]\nc = 3\n"),
+        unsafe_skip_copy=True,
+    )
+    calls = {
+        cst.ensure_type(node.func, cst.Name).value: node
+        for node in wrapper.resolve(WhitespaceInclusivePositionProvider)
+        if isinstance(node, cst.Call)
+    }
+    replacements = [
+        (calls[name], cst.parse_expression(f"{name}2()"))
+        for name in ["g", "f", "k", "h", "k"]
+    ]
+    positions = wrapper.resolve(WhitespaceInclusivePositionProvider)
+    new_module = replace_nodes(wrapper.module, positions, replacements)
+    # The replacement of `g` is inside the replaced `f`.
+    assert new_module.code == "a = f2()\nb = [h2(), k2()]\nc = 3\n"
+    assert new_module.code == (
+        deep_multi_replace(
+            wrapper.module, {id(node): new for node, new in replacements}
+        ).code
+    )
+    # Unchanged statements are reused.
+    assert new_module.body[2] is wrapper.module.body[2]
+
+    imports = [ImportItem("torch", "nn")]
+    spliced = splice_fixes(
+        codemod.CodemodContext(),
+        wrapper.module,
+        wrapper.module.bytes,
+        positions,
+        replacements,
+        imports,
+    )
+    assert spliced == b"from torch import nn\n\n" + new_module.bytes
+
+    # The expression statement and its call have the same range.
+    wrapper = cst.MetadataWrapper(cst.parse_module("f(x)\n"), unsafe_skip_copy=True)
+    line = cst.ensure_type(wrapper.module.body[0], cst.SimpleStatementLine)
+    statement = cst.ensure_type(line.body[0], cst.Expr)
+    with pytest.raises(OverlappingEdits):
+        splice_fixes(
+            codemod.CodemodContext(),
+            wrapper.module,
+            wrapper.module.bytes,
+            wrapper.resolve(WhitespaceInclusivePositionProvider),
+            [
+                (statement, cst.Expr(cst.parse_expression("g()"))),
+                (statement.value, cst.parse_expression("h()")),
+            ],
+            [],
+        )
+
+
+def test_splice_fixes(tmp_path, monkeypatch):
+    select = list(GET_ALL_ERROR_CODES())
+    config = TorchCodemodConfig(select=select)
+    transformer = TorchCodemod(codemod.CodemodContext(), config)
+    splice_config = TorchCodemodConfig(
+        select=select, splice_fixes=True, verify_fixes=True
+    )
+    splice_transformer = TorchCodemod(codemod.CodemodContext(), splice_config)
+    for path in sorted(FIXTURES_PATH.glob("**/*.py")):
+        code = path.read_bytes()
+        expected = execute_code(transformer, str(path), code)
+        result = execute_code(splice_transformer, str(path), code)
+        assert result.status == expected.status
+        assert getattr(result.transform_result, "code", None) == getattr(
+            expected.transform_result, "code", None
+        )
+        assert not result.transform_result.warning_messages
+
+    # Fixes made by regenerating the module are not cached as spliced fixes.
+    config.cache_dir = splice_config.cache_dir = str(tmp_path)
+    cache = transformer.get_result_cache()
+    splice_cache = splice_transformer.get_result_cache()
+    assert cache is not None and splice_cache is not None
+    assert cache.salt != splice_cache.salt
+
+    # Warnings are replayed from the cache.
+    def overlapping(*args):
+        raise OverlappingEdits("Overlapping fixes")
+
+    monkeypatch.setattr("torchfix.torchfix.splice_fixes", overlapping)
+    code = b"import torch\ntorch.load(f)\n"
+    for cached in [False, True]:
+        result = execute_code(splice_transformer, "a.py", code)
+        assert result.cached == cached
+        assert result.transform_result.warning_messages == [
+            "Overlapping fixes, regenerating the module instead"
+        ]
+
+
+def test_rules():
+    class RulesVisitor(TorchNamesVisitor):
+        ERRORS = [TorchError("TOR999", "Use {new} instead of {old}")]
+        RULES = compile_rules(
+            yaml.safe_load(
+                """
+                - name: torch.old
+                  error: TOR999
+                  message: {old: "{name}", new: torch.new}
+                  args: {mode: {position: 1, value: fast}}
+                  rename: torch.new
+                  replace_args:
+                    mode: {position: 1, keyword: method, values: {fast: "None"}}
+                - name: [torch.old, torch.nn.old]
+                  error: TOR999
+                  message: {old: "{name}", new: "torch.nn.new"}
+                  replace_args:
+                    flag: {keyword: weights, values: {true: "nn.Weights.V1"}}
+                  imports: [torch.nn]
+                """
+            ),
+            ERRORS,
+        )
+
+        def visit_ast_Call(self, node):
+            self.RULES.report_ast(self, node)
+
+    code = (
+        "import torch\n"
+        "torch.old(x, 'fast')\n"
+        "torch.old(x, 'slow', flag=True)\n"
+        "torch.nn.old(flag=1)\n"
+        "torch.other(x, 'fast')\n"
+    )
+    visitor = RulesVisitor()
+    module = cst.parse_module(code)
+    visit_cst(cst.MetadataWrapper(module, unsafe_skip_copy=True), [visitor])
+    assert [(v.line, v.message) for v in visitor.violations] == [
+        (2, "Use torch.new instead of torch.old"),
+        (3, "Use torch.nn.new instead of torch.old"),
+        # `1` is not the literal `True`.
+        (4, "Use torch.nn.new instead of torch.nn.old"),
+    ]
+    replacements = [v.get_replacement() for v in visitor.violations]
+    assert [r and module.code_for_node(r) for r in replacements] == [
+        "torch.new(x, method=None)",
+        "torch.old(x, 'slow', weights=nn.Weights.V1)",
+        None,
+    ]
+    assert visitor.needed_imports == {ImportItem("torch", "nn")}
+
+    ast_visitor = RulesVisitor()
+    lines = code.splitlines(keepends=True)
+    visit_ast(AstContext(ast.parse(code), lines), [ast_visitor])
+    assert [(v.line, v.message) for v in ast_visitor.violations] == [
+        (v.line, v.message) for v in visitor.violations
+    ]
+
+
+def test_pretrained_rules():
+    # The rules made from the weights of the models, as they would be written.
+    expected = compile_rules(
+        yaml.safe_load(
+            """
+            - name: &vgg16 [torchvision.models.vgg16, torchvision.models.vgg.vgg16]
+              error: TOR201
+              message:
+                old_arg_name: pretrained_backbone
+                new_arg_name: weights_backbone
+              args: {pretrained_backbone: {position: 1}}
+              replace_args: &vgg16_args
+                pretrained:
+                  position: 0
+                  keyword: weights
+                  values: {true: models.VGG16_Weights.IMAGENET1K_V1, false: None}
+              imports: [torchvision.models]
+            - name: *vgg16
+              error: TOR201
+              message: {old_arg_name: pretrained, new_arg_name: weights}
+              args: {pretrained: {position: 0}}
+              replace_args: *vgg16_args
+              imports: [torchvision.models]
+            - name: &fcn [torchvision.models.segmentation.fcn_resnet50]
+              error: TOR201
+              message:
+                old_arg_name: pretrained_backbone
+                new_arg_name: weights_backbone
+              args: {pretrained_backbone: {position: 1}}
+              replace_args: &fcn_args
+                pretrained:
+                  position: 0
+                  keyword: weights
+                  values:
+                    true:
+                      models.segmentation.FCN_ResNet50_Weights.COCO_WITH_VOC_LABELS_V1
+                    false: None
+                pretrained_backbone:
+                  position: 1
+                  keyword: weights_backbone
+                  values: {true: models.ResNet50_Weights.IMAGENET1K_V1, false: None}
+              imports: [torchvision.models]
+            - name: *fcn
+              error: TOR201
+              message: {old_arg_name: pretrained, new_arg_name: weights}
+              args: {pretrained: {position: 0}}
+              replace_args: *fcn_args
+              imports: [torchvision.models]
+            """
+        ),
+        TorchVisionDeprecatedPretrainedVisitor.ERRORS,
+    )
+    rules = TorchVisionDeprecatedPretrainedVisitor.RULES.rules
+    for name, name_rules in expected.rules.items():
+        assert rules[name] == name_rules
+    assert all(len(name_rules) == 2 for name_rules in rules.values())
+
+
+def test_plan(tmp_path):
+    config = TorchCodemodConfig(select=list(GET_ALL_ERROR_CODES()), emit_plan=True)
+    transformer = TorchCodemod(codemod.CodemodContext(), config)
+    plans = []
+    for source_path in FIXTURES_PATH.glob("**/codemod/*.in.py"):
+        path = tmp_path / f"{source_path.parent.parent.name}_{source_path.name}"
+        path.write_bytes(source_path.read_bytes())
+        result = execute_code(transformer, str(path), path.read_bytes())
+        assert result.plan is not None
+        plans.append((source_path, result.plan))
+
+    for source_path, plan in plans:
+        # Nothing to apply for other rules, unless fixes can't be separated.
+        assert apply_file_plan(plan, only=["TOR9"])[0] == 0
+        count, reason = apply_file_plan(plan)
+        assert reason is None and count == len(plan["edits"])
+        expected_path = source_path.with_name(
+            source_path.name.replace(".in.py", ".out.py")
+        )
+        assert Path(plan["path"]).read_text() == expected_path.read_text()
+        # Refused, as the file changed.
+        assert apply_file_plan(plan) == (0, "changed since the plan was made")
+
+    # Fixes for selected rules only.
+    path = tmp_path / "only.py"
+    path.write_text("import torch\nx = torch.solve(a, b)\ny = torch.qr(a)\n")
+    only_plan = execute_code(transformer, str(path), path.read_bytes()).plan
+    assert only_plan is not None
+    assert apply_file_plan(only_plan, only=["TOR101"]) == (1, None)
+    assert (
+        path.read_text()
+        == "import torch\nx = torch.solve(a, b)\ny = torch.linalg.qr(a)\n"
+    )
+
+    # Violations of the same deprecated import have a single edit.
+    path.write_text("import torch\nfrom functorch import vmap, grad\ny = torch.qr(a)\n")
+    only_plan = execute_code(transformer, str(path), path.read_bytes()).plan
+    assert only_plan is not None
+    assert [edit["error_codes"] for edit in only_plan["edits"]] == [
+        ["TOR103"],
+        ["TOR101"],
+    ]
+    assert apply_file_plan(only_plan, only=["TOR101"]) == (1, None)
+    assert (
+        path.read_text()
+        == "import torch\nfrom functorch import vmap, grad\ny = torch.linalg.qr(a)\n"
+    )
+
+
+def test_shards(tmp_path, monkeypatch):
+    paths = generate_corpus(str(tmp_path / "corpus"), files=9, lines=16)
+    shards = [shard_files(paths, i, 3) for i in (1, 2, 3)]
+    assert sorted(sum(shards, [])) == sorted(paths)
+    assert shard_files(paths[::-1], 2, 3) == shards[1]
+    sizes = [sum(Path(path).stat().st_size for path in shard) for shard in shards]
+    assert max(sizes) < 1.5 * min(sizes)
+
+    monkeypatch.chdir(tmp_path)
+    outputs = []
+    for shard in ("1/2", "2/2", None):
+        args = ["--shard", shard] if shard else []
+        results = f"{shard or 'all'}.json".replace("/", "_")
+        subprocess.run(
+            [sys.executable, "-m", "torchfix", "--no-cache", "-j", "1", "corpus"]
+            + ["--results-json", results, *args],
+            check=True,
+            capture_output=True,
+        )
+        outputs.append(results)
+    merged, full = (
+        subprocess.run(
+            [sys.executable, "-m", "torchfix", "merge", *files],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        for files in (outputs[:2], outputs[2:])
+    )
+    assert merged.stdout == full.stdout and merged.stderr == full.stderr
+    assert "Finished checking 9 files." in merged.stderr
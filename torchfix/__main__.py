@@ -3,14 +3,34 @@ import argparse
 import contextlib
 import ctypes
 import io
+import itertools
+import os
 import sys
+from typing import Dict, List, Optional, Union
 
 import libcst.codemod as codemod
 
-from .common import CYAN, ENDC
+from .cache import default_cache_dir, load_timings, save_timings
+from .client import default_socket_path
+from .daemon import serve
+from .report import display_path, JsonLinesReporter, print_summary, SarifReporter
+from .executor import (
+    DIFF_CONTEXT,
+    execute_blobs,
+    execute_files,
+    print_execution_result,
+    WorkerLimits,
+)
+from .git import changed_files, GitBlob, GitError, staged_blobs, tree_blobs
+from .prefilter import filter_files
+from .plan import apply_main, write_plan
+from .profiling import ProfileReport
+from .shard import merge_main, parse_shard, shard_files, write_results
+from .watch import watch
 
 from .torchfix import (
     __version__ as TorchFixVersion,
+    GET_ALL_ERRORS,
     DISABLED_BY_DEFAULT,
     GET_ALL_ERROR_CODES,
     process_error_code_str,
@@ -42,12 +62,28 @@ def StderrSilencer(redirect: bool = True):
             libc.close(orig_stderr)
 
 
+SIZE_SUFFIXES = {"K": 2**10, "M": 2**20, "G": 2**30}
+
+
+def parse_size(value: str) -> int:
+    """Parse a size in bytes, with an optional K, M or G suffix."""
+    multiplier = SIZE_SUFFIXES.get(value[-1:].upper(), 1)
+    number = value[:-1] if multiplier != 1 else value
+    try:
+        size = int(float(number) * multiplier)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {value!r}")
+    if size <= 0:
+        raise argparse.ArgumentTypeError(f"size must be positive: {value!r}")
+    return size
+
+
 def _parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
         "path",
-        nargs="+",
+        nargs="*",
         help="Path to check/fix. Can be a directory, a file, or multiple of either.",
     )
     parser.add_argument(
@@ -55,6 +91,22 @@ def _parse_args() -> argparse.Namespace:
         action="store_true",
         help="Fix fixable violations.",
     )
+    parser.add_argument(
+        "--no-diff",
+        action="store_true",
+        help="Only report violations, without making the fixes and printing diffs.",
+    )
+    parser.add_argument(
+        "--splice-fixes",
+        action="store_true",
+        help="Make fixes by splicing the fixed code into the original code, "
+        "instead of regenerating whole files.",
+    )
+    parser.add_argument(
+        "--verify-fixes",
+        action="store_true",
+        help="With --splice-fixes, check that the fixed code parses.",
+    )
     parser.add_argument(
         "-j",
         "--jobs",
@@ -62,6 +114,37 @@ def _parse_args() -> argparse.Namespace:
         type=int,
         default=None,
     )
+    parser.add_argument(
+        "--max-files-per-worker",
+        metavar="N",
+        help="Replace each worker process with a fresh one after it processed "
+        "N files, to bound memory growth in long runs.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--max-worker-rss",
+        metavar="SIZE",
+        help="Replace a worker process with a fresh one once its resident memory "
+        "exceeds SIZE, e.g. 2G or 512M; files after which the limit was exceeded "
+        "are reported.",
+        type=parse_size,
+        default=None,
+    )
+    parser.add_argument(
+        "--max-file-bytes",
+        metavar="SIZE",
+        help="Skip files larger than SIZE, e.g. 1M.",
+        type=parse_size,
+        default=None,
+    )
+    parser.add_argument(
+        "--file-timeout",
+        metavar="SECONDS",
+        help="Stop processing a file after SECONDS and skip it.",
+        type=float,
+        default=None,
+    )
     parser.add_argument(
         "--select",
         help=f"Comma-separated list of rules to enable or 'ALL' to enable all rules. "
@@ -70,6 +153,107 @@ def _parse_args() -> argparse.Namespace:
         type=str,
         default=None,
     )
+    git_group = parser.add_mutually_exclusive_group()
+    git_group.add_argument(
+        "--changed-since",
+        metavar="REV",
+        help="Only check Python files changed, added or renamed since the git "
+        "revision REV, including uncommitted and untracked files.",
+        type=str,
+        default=None,
+    )
+    git_group.add_argument(
+        "--staged",
+        action="store_true",
+        help="Only check Python files changed, added or renamed in the git index. "
+        "Their staged content is checked, read from git, unless --fix is used.",
+    )
+    git_group.add_argument(
+        "--tree",
+        metavar="TREE_ISH",
+        help="Check the Python files in the git tree-ish TREE_ISH, e.g. HEAD "
+        "or a commit, reading them from git instead of the working tree.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory for caching results between runs. "
+        f"Defaults to {default_cache_dir()}",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write cached results.",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Run a daemon serving requests from `torchfix-client` "
+        "with a warm worker pool.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and re-check Python files when they change, "
+        "printing the violations added (+) or removed (-) in each file.",
+    )
+    parser.add_argument(
+        "--socket",
+        help="Unix domain socket path for --daemon. "
+        f"Defaults to {default_socket_path()}",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--format",
+        help="Output format. 'jsonl' prints a JSON object per violation, "
+        "'sarif' prints a SARIF 2.1.0 log. "
+        "In both cases, violations are printed as soon as they are found, "
+        "and diffs are not printed.",
+        choices=["text", "jsonl", "sarif"],
+        default="text",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print the time spent in each processing phase and TorchFix visitor, "
+        "and the slowest files. Implies --no-cache.",
+    )
+    parser.add_argument(
+        "--profile-json",
+        metavar="FILE",
+        help="Write the --profile data, including per-file phase times, "
+        "to FILE as JSON. Implies --profile.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--shard",
+        metavar="i/N",
+        help="Only check the i-th of N shards of the files, e.g. 1/4, "
+        "to split a run across machines. Shards are balanced by file size.",
+        type=parse_shard,
+        default=None,
+    )
+    parser.add_argument(
+        "--results-json",
+        metavar="FILE",
+        help="Write the violations and the summary counts to FILE, "
+        "to be combined with `torchfix merge FILE...`.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--emit-plan",
+        metavar="FILE",
+        help="Write the fixes to FILE as a plan of text edits, "
+        "to be applied later with `torchfix apply FILE`. Implies --no-cache.",
+        type=str,
+        default=None,
+    )
     parser.add_argument("--version", action="version", version=f"{TorchFixVersion}")
 
     # XXX TODO: Get rid of this!
@@ -80,63 +264,229 @@ def _parse_args() -> argparse.Namespace:
         action="store_true",
     )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.path and not args.daemon:
+        parser.error("the following arguments are required: path")
+    if args.watch and (
+        args.fix
+        or args.daemon
+        or args.format != "text"
+        or args.changed_since is not None
+        or args.staged
+        or args.tree is not None
+    ):
+        parser.error(
+            "--watch can't be used with --fix, --daemon, --format, "
+            "--changed-since, --staged or --tree"
+        )
+    if args.no_diff and (args.fix or args.emit_plan is not None):
+        parser.error("--no-diff can't be used with --fix or --emit-plan")
+    if args.verify_fixes and not args.splice_fixes:
+        parser.error("--verify-fixes can only be used with --splice-fixes")
+    if args.tree is not None and args.fix:
+        parser.error("--tree can't be used with --fix")
+    if args.shard is not None and (args.staged or args.tree is not None or args.watch):
+        parser.error("--shard can't be used with --staged, --tree or --watch")
+    if args.emit_plan is not None:
+        if args.fix or args.watch:
+            parser.error("--emit-plan can't be used with --fix or --watch")
+        # Cached results don't have plans.
+        args.no_cache = True
+    if args.max_files_per_worker is not None and args.max_files_per_worker < 1:
+        parser.error("--max-files-per-worker must be at least 1")
+    if args.file_timeout is not None and args.file_timeout <= 0:
+        parser.error("--file-timeout must be positive")
+    if args.profile_json is not None:
+        args.profile = True
+    if args.profile:
+        # Cached results would not be representative.
+        args.no_cache = True
+    return args
 
 
 def main() -> None:
+    if sys.argv[1:2] == ["apply"]:
+        apply_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["merge"]:
+        merge_main(sys.argv[2:])
+        return
+
     args = _parse_args()
-    files = codemod.gather_files(args.path)
-
-    # Filter out files that don't have "torch" string in them.
-    # This avoids expensive parsing.
-    MARKER = "torch"  # this will catch import torch or functorch
-    torch_files = []
-    for file in files:
-        with open(file, errors="replace") as f:
-            for line in f:
-                if MARKER in line:
-                    torch_files.append(file)
-                    break
-
-    if not torch_files:
+    if args.daemon:
+        serve(args.socket, args.jobs)
         return
+
     config = TorchCodemodConfig()
     config.select = list(process_error_code_str(args.select))
+    config.profile = args.profile
+    config.max_file_bytes = args.max_file_bytes
+    config.file_timeout = args.file_timeout
+    config.emit_plan = args.emit_plan is not None
+    config.report_only = args.no_diff
+    config.splice_fixes = args.splice_fixes
+    config.verify_fixes = args.verify_fixes
+    timings: Dict[str, float] = {}
+    if not args.no_cache:
+        config.cache_dir = args.cache_dir or default_cache_dir()
+        timings = load_timings(config.cache_dir)
     command_instance = TorchCodemod(codemod.CodemodContext(), config)
-    DIFF_CONTEXT = 5
+
+    if args.watch:
+        # Status messages bypass the stderr silencer.
+        stderr = sys.stderr
+        try:
+            with StderrSilencer(not args.show_stderr):
+                watch(args.path, command_instance, jobs=args.jobs, stderr=stderr)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # Staged or committed content is read directly from git.
+    blobs: Optional[List[GitBlob]] = None
+    try:
+        if args.tree is not None:
+            blobs = tree_blobs(args.path, args.tree)
+        elif args.staged and not args.fix:
+            blobs = staged_blobs(args.path)
+        elif args.changed_since is not None or args.staged:
+            files = changed_files(args.path, args.changed_since, args.staged)
+        else:
+            files = codemod.gather_files(args.path)
+    except GitError as e:
+        print(f"Failed to get files from git: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    if blobs is None:
+        # Deduplicate to avoid races when writing fixes.
+        files = sorted({os.path.abspath(f) for f in files})
+        if args.shard is not None:
+            files = shard_files(files, *args.shard)
+        torch_files = filter_files(files)
+        first_file = next(torch_files, None)
+        if first_file is None:
+            if args.results_json is not None:
+                write_results(
+                    args.results_json, TorchFixVersion, args.shard, 0, 0, 0, [], []
+                )
+            return
+        torch_files = itertools.chain([first_file], torch_files)
+
+    reporter: Optional[Union[JsonLinesReporter, SarifReporter]] = None
+    if args.format == "jsonl":
+        reporter = JsonLinesReporter()
+    elif args.format == "sarif":
+        rules = [
+            (error.error_code, error.message_template) for error in GET_ALL_ERRORS()
+        ]
+        reporter = SarifReporter(TorchFixVersion, rules)
+
+    worker_limits = None
+    if args.max_files_per_worker is not None or args.max_worker_rss is not None:
+        worker_limits = WorkerLimits(args.max_files_per_worker, args.max_worker_rss)
+
+    profile_report = ProfileReport() if args.profile else None
+    # Fixes are written back, and there's no fixed code to diff with --no-diff.
+    unified_diff = None if args.fix or args.no_diff else DIFF_CONTEXT
+    successes = skips = failures = 0
+    uncached = False
+    # Files after which a worker exceeded --max-worker-rss, with the RSS.
+    over_rss_limit = []
+    # Files skipped over --max-file-bytes or --file-timeout, or as generated,
+    # with the reason.
+    over_limit = []
+    file_plans = []
+    # Violations with file names, for --results-json.
+    violations = []
     try:
         with StderrSilencer(not args.show_stderr):
-            result = codemod.parallel_exec_transform_with_prettyprint(
-                command_instance,
-                torch_files,
-                jobs=args.jobs,
-                unified_diff=(None if args.fix else DIFF_CONTEXT),
-                hide_progress=True,
-                format_code=False,
-                repo_root=None,
-            )
+            on_violation = reporter.report if reporter is not None else None
+            if blobs is not None:
+                results = execute_blobs(
+                    command_instance,
+                    blobs,
+                    jobs=args.jobs,
+                    unified_diff=unified_diff,
+                    on_violation=on_violation,
+                )
+            else:
+                results = execute_files(
+                    command_instance,
+                    torch_files,
+                    jobs=args.jobs,
+                    unified_diff=unified_diff,
+                    on_violation=on_violation,
+                    timings=timings,
+                    worker_limits=worker_limits,
+                )
+            for result in results:
+                print_execution_result(result, text_output=reporter is None)
+                if result.status == "failure":
+                    failures += 1
+                elif result.status == "success":
+                    successes += 1
+                elif result.status == "limit":
+                    assert result.over_limit is not None
+                    over_limit.append((result.filename, result.over_limit))
+                else:
+                    skips += 1
+                if args.results_json is not None:
+                    violations += [(result.filename, r) for r in result.violations]
+                if result.plan is not None:
+                    file_plans.append(result.plan)
+                if profile_report is not None and result.profile is not None:
+                    profile_report.add(result.filename, result.profile)
+                if result.worker_rss is not None:
+                    over_rss_limit.append((result.filename, result.worker_rss))
+                if not result.cached:
+                    uncached = True
+                    if blobs is None:
+                        timings[result.filename] = result.duration
     except KeyboardInterrupt:
         print("Interrupted!", file=sys.stderr)
         sys.exit(2)
 
-    print(
-        f"Finished checking {result.successes + result.skips + result.failures} files.",
-        file=sys.stderr,
-    )
+    if reporter is not None:
+        reporter.close()
 
-    if result.successes > 0:
-        if args.fix:
-            print(
-                f"Transformed {result.successes} files successfully.", file=sys.stderr
-            )
-        else:
+    result_cache = command_instance.get_result_cache()
+    if result_cache is not None and uncached:
+        result_cache.prune()
+        save_timings(str(result_cache.cache_dir), timings)
+
+    if args.emit_plan is not None:
+        write_plan(args.emit_plan, file_plans, TorchFixVersion)
+
+    if args.results_json is not None:
+        write_results(
+            args.results_json,
+            TorchFixVersion,
+            args.shard,
+            successes,
+            skips,
+            failures,
+            over_limit,
+            violations,
+        )
+
+    print_summary(successes, skips, failures, args.fix, over_limit)
+    if over_rss_limit:
+        print(
+            f"Workers exceeded --max-worker-rss and were restarted "
+            f"after {len(over_rss_limit)} files:",
+            file=sys.stderr,
+        )
+        for filename, rss in over_rss_limit:
             print(
-                f"[{CYAN}*{ENDC}] {result.successes} "
-                "potentially fixable with the --fix option",
-                file=sys.stderr,
+                f"  {display_path(filename)} ({rss / 2**20:.0f} MiB)", file=sys.stderr
             )
 
-    if result.failures > 0:
+    if profile_report is not None:
+        profile_report.print()
+        if args.profile_json is not None:
+            profile_report.dump(args.profile_json)
+
+    if failures > 0:
         sys.exit(1)
 
 
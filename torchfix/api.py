@@ -0,0 +1,136 @@
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+import libcst.codemod as codemod
+
+from .executor import create_pool, execute_code, ExecutionResult
+from .prefilter import MARKER
+from .torchfix import process_error_code_str, TorchCodemod, TorchCodemodConfig
+
+# Sources sent to a worker at a time.
+CHUNK_SIZE = 8
+
+
+@dataclass(frozen=True)
+class Violation:
+    error_code: str
+    message: str
+    line: int
+    column: int
+    end_line: int
+    end_column: int
+    # Code replacing the violating node, if the violation is fixable
+    # and the fixes were made (not in `report_only` mode).
+    replacement: Optional[str] = None
+    fixable: bool = False
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "Violation":
+        """Create from a record as returned by `LintViolation.to_record`."""
+        return cls(
+            record["error_code"],
+            record["message"],
+            record["line"],
+            record["column"],
+            record["end_line"],
+            record["end_column"],
+            record.get("replacement"),
+            record["fixable"],
+        )
+
+
+@dataclass(frozen=True)
+class LintResult:
+    filename: str
+    violations: Tuple[Violation, ...] = ()
+    # The source with all fixes applied, None if there is nothing to fix.
+    fixed_source: Optional[str] = None
+    # Traceback if processing failed.
+    error: Optional[str] = None
+    # Why the source was not processed, e.g. it's a generated file.
+    skipped: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _to_lint_result(result: ExecutionResult, report_only: bool) -> LintResult:
+    transform_result = result.transform_result
+    violations = tuple(Violation.from_record(r) for r in result.violations)
+    if isinstance(transform_result, codemod.TransformExit):
+        raise KeyboardInterrupt
+    if isinstance(transform_result, codemod.TransformFailure):
+        return LintResult(
+            result.filename, violations, error=transform_result.traceback_str
+        )
+    if isinstance(transform_result, codemod.TransformSuccess):
+        if report_only:
+            # The fixes were not made.
+            return LintResult(result.filename, violations)
+        return LintResult(result.filename, violations, transform_result.code)
+    assert isinstance(transform_result, codemod.TransformSkip)
+    # Sources without fixes are also skipped by `TorchCodemod`,
+    # but they were processed.
+    if (
+        result.over_limit is not None
+        or transform_result.skip_reason == codemod.SkipReason.GENERATED
+    ):
+        return LintResult(
+            result.filename, violations, skipped=transform_result.skip_description
+        )
+    return LintResult(result.filename, violations)
+
+
+def _execute_source(
+    task: Tuple[TorchCodemod, str, Union[str, bytes]],
+) -> ExecutionResult:
+    transformer, filename, source = task
+    code = source.encode("utf-8") if isinstance(source, str) else source
+    if MARKER not in code:
+        # Nothing to report, don't parse.
+        return ExecutionResult(
+            filename,
+            codemod.TransformSkip(
+                skip_reason=codemod.SkipReason.OTHER, skip_description="No changes"
+            ),
+        )
+    return execute_code(transformer, filename, code)
+
+
+def lint_sources(
+    sources: Iterable[Tuple[str, Union[str, bytes]]],
+    select: Union[str, Iterable[str], None] = None,
+    *,
+    jobs: Optional[int] = None,
+    config: Optional[TorchCodemodConfig] = None,
+) -> Iterator[LintResult]:
+    """
+    Check `(filename, source)` pairs, yielding a `LintResult` per pair,
+    in the input order, as soon as it's ready.
+    File names are only used for reporting; nothing is read or written.
+
+    `select` is the rule selection as for `torchfix --select`, either as
+    a comma-separated string or a list of codes and prefixes, e.g. `["TOR1"]`.
+    By default, the rules enabled by default in `torchfix` are used.
+
+    With `jobs` greater than 1, sources are processed in a pool of `jobs`
+    worker processes, and consumed ahead of the results.
+    Other settings, e.g. `max_file_bytes`, can be provided in `config`;
+    its `select` is ignored.
+    """
+    if select is not None and not isinstance(select, str):
+        select = ",".join(select)
+    config = replace(config) if config is not None else TorchCodemodConfig()
+    config.select = list(process_error_code_str(select))
+    transformer = TorchCodemod(codemod.CodemodContext(), config)
+    tasks = ((transformer, filename, source) for filename, source in sources)
+
+    if jobs is None or jobs <= 1:
+        for task in tasks:
+            yield _to_lint_result(_execute_source(task), config.report_only)
+        return
+
+    with create_pool(jobs) as pool:
+        for result in pool.imap(_execute_source, tasks, chunksize=CHUNK_SIZE):
+            yield _to_lint_result(result, config.report_only)
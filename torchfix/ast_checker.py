@@ -0,0 +1,199 @@
+import ast
+import functools
+import sys
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from libcst.metadata import QualifiedName
+
+from .names import AstQualifiedNames
+
+# Prefix of the methods of visitors detecting violations on `ast` nodes,
+# e.g. `visit_ast_Call`.
+AST_VISIT_PREFIX = "visit_ast_"
+
+
+class UnsupportedAst(Exception):
+    """The results on an `ast` tree could differ from those on the libcst tree."""
+
+
+class AstContext:
+    """
+    Metadata of the nodes of a stdlib `ast` module, matching the metadata
+    of the corresponding libcst nodes used by TorchFix visitors.
+    Raises `UnsupportedAst` where they can't be matched exactly.
+    """
+
+    def __init__(self, module: ast.Module, lines: Sequence[str]) -> None:
+        self.module = module
+        self.lines = lines
+        self._names: Optional[AstQualifiedNames] = None
+        self._parents: Optional[Dict[ast.AST, ast.AST]] = None
+
+    def qualified_names(
+        self, node: ast.AST, all_roots: bool = False
+    ) -> Set[QualifiedName]:
+        """See `AstQualifiedNames`."""
+        if self._names is None:
+            self._names = AstQualifiedNames(self.module)
+        if not self._names.supported:
+            raise UnsupportedAst("Names can't be resolved")
+        return self._names.get(node, all_roots)
+
+    def source(self, node: ast.AST) -> str:
+        """The source code of `node`, without enclosing parentheses."""
+        first, last = node.lineno, node.end_lineno  # type: ignore[attr-defined]
+        assert last is not None
+        start = self._column(first, node.col_offset)  # type: ignore[attr-defined]
+        end = self._column(last, node.end_col_offset)  # type: ignore[attr-defined]
+        if first == last:
+            return self.lines[first - 1][start:end]
+        return "".join(
+            [
+                self.lines[first - 1][start:],
+                *self.lines[first : last - 1],
+                self.lines[last - 1][:end],
+            ]
+        )
+
+    def position(self, node: ast.AST) -> Tuple[int, int]:
+        """
+        The start of `node` as given by `WhitespaceInclusivePositionProvider`
+        for the libcst node: 1-based line and 0-based column in characters.
+        """
+        if not hasattr(node, "lineno"):
+            # E.g. import aliases before Python 3.10.
+            raise UnsupportedAst(f"No position of {type(node).__name__}")
+        if sys.version_info < (3, 12) and any(
+            isinstance(parent, ast.JoinedStr) for parent in self._ancestors(node)
+        ):
+            # Positions in f-strings are not reliable before Python 3.12.
+            raise UnsupportedAst("Node in an f-string")
+        line = node.lineno
+        column = self._column(line, node.col_offset)
+        if isinstance(node, ast.expr):
+            # libcst nodes start with their enclosing parentheses.
+            end_line = node.end_lineno
+            assert end_line is not None
+            end_column = self._column(end_line, node.end_col_offset)
+            closing = self._closing_parens(end_line, end_column)
+            if closing:
+                opening = self._opening_parens(line, column)
+                count = min(len(opening) - self._owned_parens(node), closing)
+                if count > 0:
+                    line, column = opening[count - 1]
+        return line, column
+
+    def _column(self, line: int, offset: Optional[int]) -> int:
+        # `ast` offsets are in UTF-8 bytes.
+        assert offset is not None
+        text = self.lines[line - 1]
+        if text.isascii():
+            return offset
+        return len(text.encode()[:offset].decode(errors="replace"))
+
+    def _ancestors(self, node: ast.AST) -> List[ast.AST]:
+        if self._parents is None:
+            self._parents = {
+                child: parent
+                for parent in ast.walk(self.module)
+                for child in ast.iter_child_nodes(parent)
+            }
+        ancestors = []
+        while node in self._parents:
+            node = self._parents[node]
+            ancestors.append(node)
+        return ancestors
+
+    def _owned_parens(self, node: ast.expr) -> int:
+        """
+        Whether the parentheses right before `node` belong to its parent,
+        e.g. those of a call with `node` as the first argument.
+        """
+        parents = self._ancestors(node)
+        if not parents:
+            return 0
+        parent = parents[0]
+        if isinstance(parent, ast.Call):
+            return int(bool(parent.args) and parent.args[0] is node)
+        if isinstance(parent, ast.ClassDef):
+            return int(bool(parent.bases) and parent.bases[0] is node)
+        if isinstance(parent, ast.withitem):
+            # `with (a):` is parsed by libcst as a parenthesized list of items.
+            statement = parents[1]
+            assert isinstance(statement, (ast.With, ast.AsyncWith))
+            return int(len(statement.items) == 1 and parent.optional_vars is None)
+        return 0
+
+    def _opening_parens(self, line: int, column: int) -> List[Tuple[int, int]]:
+        """Positions of the opening parentheses right before a position."""
+        positions: List[Tuple[int, int]] = []
+        text = self.lines[line - 1]
+        while True:
+            if column == 0:
+                if line == 1:
+                    return positions
+                line -= 1
+                text = self.lines[line - 1].rstrip("\r\n")
+                if "#" in text:
+                    # Could be a comment or not, it takes tokenizing to tell.
+                    raise UnsupportedAst("Comment before a parenthesized node")
+                text = text.removesuffix("\\")
+                column = len(text)
+                continue
+            column -= 1
+            char = text[column]
+            if char == "(":
+                positions.append((line, column))
+            elif char not in " \t\f":
+                return positions
+
+    def _closing_parens(self, line: int, column: int) -> int:
+        """Number of closing parentheses right after a position."""
+        count = 0
+        text = self.lines[line - 1]
+        while True:
+            char = text[column] if column < len(text) else "\n"
+            if char in "#\\\r\n":
+                # A comment, a line continuation or the end of the line.
+                if line == len(self.lines):
+                    return count
+                line += 1
+                text = self.lines[line - 1]
+                column = 0
+                continue
+            if char == ")":
+                count += 1
+            elif char not in " \t\f":
+                return count
+            column += 1
+
+
+@functools.cache
+def _ast_visit_methods(cls: Any) -> List[Tuple[str, type]]:
+    return [
+        (name, getattr(ast, name[len(AST_VISIT_PREFIX) :]))
+        for name in dir(cls)
+        if name.startswith(AST_VISIT_PREFIX)
+    ]
+
+
+def visit_ast(context: AstContext, visitors: Sequence[Any]) -> None:
+    """
+    Call the `visit_ast_*` methods of `visitors` for the nodes of the module
+    of `context`, which is set as `ast_context` of the visitors.
+    Parents are visited before their children, but not necessarily in the order
+    of the source code.
+    Raises `UnsupportedAst` if a visitor doesn't support `ast` nodes.
+    """
+    handlers: Dict[type, List[Callable[[ast.AST], None]]] = defaultdict(list)
+    for visitor in visitors:
+        methods = _ast_visit_methods(visitor.__class__)
+        if not methods:
+            raise UnsupportedAst(f"{type(visitor).__name__} needs libcst")
+        visitor.ast_context = context
+        for name, node_type in methods:
+            handlers[node_type].append(getattr(visitor, name))
+    for node in ast.walk(context.module):
+        for handler in handlers.get(type(node), ()):
+            handler(node)
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+# Upper bound for the total size of the cache directory, in bytes.
+DEFAULT_MAX_CACHE_SIZE = 256 * 1024 * 1024
+
+# Bump when the format of the entries changes.
+CACHE_FORMAT_VERSION = 3
+
+
+def default_cache_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "torchfix")
+
+
+class ResultCache:
+    """
+    On-disk cache of per-file TorchFix results, keyed by file content.
+
+    `salt` must capture everything besides the file content that affects
+    the results (TorchFix version, rules configuration, selected rules),
+    so that entries from incompatible runs are never reused.
+
+    Each entry is a separate JSON file written atomically, so the cache
+    can be populated concurrently from worker processes.
+    Entries are evicted in least-recently-used order, using file
+    modification time as the last use time.
+    """
+
+    def __init__(
+        self, cache_dir: str, salt: str, max_size: int = DEFAULT_MAX_CACHE_SIZE
+    ) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.salt = salt
+        self.max_size = max_size
+
+    def key(self, data: bytes) -> str:
+        digest = hashlib.sha256(f"{CACHE_FORMAT_VERSION}:{self.salt}".encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def load(self, data: bytes) -> Optional[Dict[str, Any]]:
+        path = self._entry_path(self.key(data))
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            # Mark the entry as recently used.
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def store(
+        self,
+        data: bytes,
+        violations: List[Dict[str, Any]],
+        code: Optional[str],
+        encoding: str,
+        warnings: Sequence[str] = (),
+    ) -> None:
+        """
+        Store results for a file with `data` content.
+
+        :param violations: reported violations, as returned by
+            `LintViolation.to_record`.
+        :param code: new file content if there were any fixes, otherwise None.
+        :param warnings: warning messages of the codemod, replayed with the results.
+        """
+        path = self._entry_path(self.key(data))
+        entry = {
+            "violations": violations,
+            "code": code,
+            "encoding": encoding,
+            "warnings": list(warnings),
+        }
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", dir=path.parent, suffix=".tmp", delete=False
+            ) as f:
+                json.dump(entry, f)
+            os.replace(f.name, path)
+        except OSError:
+            # Caching is best-effort.
+            pass
+
+    def prune(self) -> None:
+        """Evict least recently used entries until the cache fits `max_size`."""
+        entries = []
+        total_size = 0
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total_size -= size
+
+
+TIMINGS_FILENAME = "timings.json"
+
+
+def load_timings(cache_dir: str) -> Dict[str, float]:
+    """Load per-file processing times remembered by `save_timings`."""
+    try:
+        with open(os.path.join(cache_dir, TIMINGS_FILENAME)) as f:
+            timings = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return timings if isinstance(timings, dict) else {}
+
+
+def save_timings(cache_dir: str, timings: Dict[str, float]) -> None:
+    """
+    Remember per-file processing times, in seconds, keyed by absolute path.
+    Files that no longer exist are dropped.
+    """
+    timings = {path: t for path, t in timings.items() if os.path.exists(path)}
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=cache_dir, suffix=".tmp", delete=False
+        ) as f:
+            json.dump(timings, f)
+        os.replace(f.name, os.path.join(cache_dir, TIMINGS_FILENAME))
+    except OSError:
+        pass
@@ -0,0 +1,153 @@
+"""
+Thin client for the TorchFix daemon (`torchfix --daemon`).
+
+This module must not import libcst or other heavy dependencies,
+so that the client starts quickly.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+from typing import Any, Dict, Iterator, Optional
+
+from .report import display_path, format_codemod_result, print_summary
+
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"torchfix-{os.getuid()}.sock")
+
+
+def send_message(stream, message: Dict[str, Any]) -> None:
+    """Write a message in the daemon protocol: one JSON object per line."""
+    stream.write(json.dumps(message).encode() + b"\n")
+    stream.flush()
+
+
+def request(socket_path: str, message: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Send a request to the daemon and yield response messages as they arrive."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile("rwb") as stream:
+            send_message(stream, message)
+            for line in stream:
+                yield json.loads(line)
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Submit files or source text to a running TorchFix daemon."
+    )
+    parser.add_argument(
+        "path",
+        nargs="*",
+        help="Path to check/fix. Can be a directory, a file, or multiple of either. "
+        "Use '-' to read source text from stdin.",
+    )
+    parser.add_argument(
+        "--socket",
+        help=f"Daemon socket path. Defaults to {default_socket_path()}",
+        default=None,
+    )
+    parser.add_argument(
+        "--fix",
+        action="store_true",
+        help="Fix fixable violations. "
+        "For stdin, the fixed source is written to stdout.",
+    )
+    parser.add_argument("--select", type=str, default=None)
+    parser.add_argument(
+        "--stdin-filename",
+        help="Filename to report for the source text read from stdin.",
+        default="<stdin>",
+    )
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print daemon request counters and latency histograms.",
+    )
+    parser.add_argument("--shutdown", action="store_true", help="Stop the daemon.")
+    args = parser.parse_args()
+    if not (args.path or args.stats or args.shutdown):
+        parser.error("the following arguments are required: path")
+    return args
+
+
+def main() -> None:
+    args = _parse_args()
+    socket_path = args.socket or default_socket_path()
+
+    message: Dict[str, Any]
+    stdin_source = None
+    if args.stats:
+        message = {"command": "stats"}
+    elif args.shutdown:
+        message = {"command": "shutdown"}
+    else:
+        message = {
+            "command": "check",
+            "select": args.select,
+            "fix": args.fix,
+            "no_cache": args.no_cache,
+        }
+        if args.path == ["-"]:
+            stdin_source = sys.stdin.read()
+            message["sources"] = [
+                {"filename": args.stdin_filename, "source": stdin_source}
+            ]
+        else:
+            message["paths"] = [os.path.abspath(p) for p in args.path]
+
+    exit_code = 0
+    try:
+        for response in request(socket_path, message):
+            exit_code = max(exit_code, _print_response(response, args, stdin_source))
+    except OSError as e:
+        print(f"Failed to connect to the daemon at {socket_path}: {e}", file=sys.stderr)
+        sys.exit(2)
+    sys.exit(exit_code)
+
+
+def _print_response(
+    response: Dict[str, Any], args: argparse.Namespace, stdin_source: Optional[str]
+) -> int:
+    """Print a daemon response message and return the exit code for it."""
+    if response["type"] == "result":
+        # When fixing stdin, stdout is reserved for the resulting source.
+        fix_stdin = stdin_source is not None and args.fix
+        out = sys.stderr if fix_stdin else sys.stdout
+        path = display_path(response["filename"])
+        for record in response["violations"]:
+            print(f"{path}{format_codemod_result(record)}", file=out)
+        if response["status"] == "failure":
+            print(response["error"], file=sys.stderr)
+            print(f"Failed to codemod {path}\n", file=sys.stderr)
+
+        if fix_stdin:
+            fixed = response["status"] == "success"
+            print(response["code"] if fixed else stdin_source, end="")
+        elif response["status"] == "success" and response["code"]:
+            print(response["code"])
+    elif response["type"] == "summary":
+        print_summary(
+            response["successes"],
+            response["skips"],
+            response["failures"],
+            args.fix,
+            [(filename, reason) for filename, reason in response["over_limit"]],
+        )
+        return 1 if response["failures"] > 0 else 0
+    elif response["type"] == "stats":
+        print(json.dumps(response["stats"], indent=2))
+    elif response["type"] == "error":
+        print(f"Daemon error: {response['message']}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    main()
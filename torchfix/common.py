@@ -1,18 +1,41 @@
-import sys
+import ast
 from abc import ABC
 from dataclasses import dataclass
 from os.path import commonprefix
-from typing import List, Optional, Sequence, Set, Tuple, Mapping
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Collection,
+    Container,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TYPE_CHECKING,
+    Union,
+)
 
 import libcst as cst
 from libcst.codemod.visitors import ImportItem
-from libcst.metadata import QualifiedNameProvider, WhitespaceInclusivePositionProvider
+from libcst.metadata import (
+    BaseMetadataProvider,
+    ProviderT,
+    QualifiedName,
+    QualifiedNameProvider,
+    WhitespaceInclusivePositionProvider,
+)
 
-IS_TTY = hasattr(sys.stdout, "isatty") and sys.stdout.isatty()
-CYAN = "\033[96m" if IS_TTY else ""
-RED = "\033[31m" if IS_TTY else ""
-BOLD = "\033[1m" if IS_TTY else ""
-ENDC = "\033[0m" if IS_TTY else ""
+from .ast_checker import AstContext
+from .names import TorchQualifiedNameProvider
+from .report import format_codemod_result
+
+if TYPE_CHECKING:
+    from .rules import RuleSet
 
 
 @dataclass
@@ -21,19 +44,41 @@ class LintViolation:
     message: str
     line: int
     column: int
-    node: cst.CSTNode
+    # None for violations found on `ast` trees.
+    node: Optional[cst.CSTNode]
     replacement: Optional[cst.CSTNode]
+    end_line: Optional[int] = None
+    end_column: Optional[int] = None
+    # Makes the replacement when it's needed, for fixes that are always available.
+    make_replacement: Optional[Callable[[], cst.CSTNode]] = None
+
+    @property
+    def fixable(self) -> bool:
+        return self.replacement is not None or self.make_replacement is not None
+
+    def get_replacement(self) -> Optional[cst.CSTNode]:
+        if self.replacement is None and self.make_replacement is not None:
+            self.replacement = self.make_replacement()
+        return self.replacement
 
     def flake8_result(self):
         full_message = f"{self.error_code} {self.message}"
         return self.line, 1 + self.column, full_message, "TorchFix"
 
     def codemod_result(self) -> str:
-        fixable = f" [{CYAN}*{ENDC}]" if self.replacement is not None else ""
-        colon = f"{CYAN}:{ENDC}"
-        position = f"{colon}{self.line}{colon}{1 + self.column}{colon}"
-        error_code = f"{RED}{BOLD}{self.error_code}{ENDC}"
-        return f"{position} {error_code}{fixable} {self.message}"
+        return format_codemod_result(self.to_record())
+
+    def to_record(self) -> Dict[str, Any]:
+        """Serializable representation of the violation, without CST nodes."""
+        return {
+            "error_code": self.error_code,
+            "message": self.message,
+            "line": self.line,
+            "column": self.column,
+            "end_line": self.end_line,
+            "end_column": self.end_column,
+            "fixable": self.fixable,
+        }
 
 
 @dataclass(frozen=True)
@@ -48,17 +93,53 @@ class TorchError:
 
 
 class TorchVisitor(cst.BatchableCSTVisitor, ABC):
-    METADATA_DEPENDENCIES = (
+    METADATA_DEPENDENCIES: ClassVar[Collection[ProviderT]] = (
         QualifiedNameProvider,
         WhitespaceInclusivePositionProvider,
     )
 
+    # Provider of the names returned by `get_qualified_name_for_call`.
+    # Visitors only looking for torch names can use `TorchQualifiedNameProvider`,
+    # which is much faster, see `TorchNamesVisitor`.
+    QUALIFIED_NAME_PROVIDER: ClassVar[
+        Type[BaseMetadataProvider[Collection[QualifiedName]]]
+    ] = QualifiedNameProvider
+
     ERRORS: List[TorchError]
 
+    # Identifiers of which at least one occurs in any code with violations
+    # reported by the visitor, e.g. the last component of the qualified names
+    # it looks for. The visitor is skipped for code without any of them.
+    # Empty if the visitor always needs to run.
+    TRIGGER_TOKENS: Sequence[str] = ()
+
+    # Qualified names of the calls passed to `visit_qualified_Call(node, name)`
+    # and of the attributes passed to `visit_qualified_Attribute(node, name)`,
+    # see `QualifiedNameDispatcher`. Names ending with a dot are prefixes.
+    # Only for `TorchNamesVisitor`s, as are `RULES`.
+    QUALIFIED_CALLS: Collection[str] = ()
+    QUALIFIED_ATTRIBUTES: Collection[str] = ()
+
+    # Declarative rules for calls, reported by `QualifiedNameDispatcher`
+    # and by `visit_ast_Call` with `RuleSet.report_ast`, see `rules`.
+    RULES: Optional["RuleSet"] = None
+
+    # Visitors can also detect violations on stdlib `ast` trees, without fixes,
+    # with `visit_ast_<node type>` methods reporting the same violations
+    # as the libcst methods with `add_ast_violation`, see `visit_ast`.
+
     def __init__(self) -> None:
         super().__init__()
         self.violations: List[LintViolation] = []
         self.needed_imports: Set[ImportItem] = set()
+        # Set by `visit_ast`.
+        self.ast_context: Optional[AstContext] = None
+
+    def reset(self) -> None:
+        """Forget the results for the previous module, to reuse the visitor."""
+        self.violations = []
+        self.needed_imports = set()
+        self.ast_context = None
 
     @staticmethod
     def get_specific_arg(
@@ -92,13 +173,62 @@ class TorchVisitor(cst.BatchableCSTVisitor, ABC):
             is not None
         )
 
+    @staticmethod
+    def get_specific_ast_arg(
+        node: ast.Call, arg_name: str, arg_pos: int
+    ) -> Optional[ast.expr]:
+        """
+        Same as `get_specific_arg`, for an `ast` call.
+        Returns the value of the argument.
+        """
+        curr_pos = 0
+        for arg in ast_call_args(node):
+            if isinstance(arg, ast.keyword) and arg.arg is not None:
+                if arg.arg == arg_name:
+                    return arg.value
+            else:
+                if curr_pos == arg_pos:
+                    return ast_arg_value(arg)
+                curr_pos += 1
+        return None
+
+    @staticmethod
+    def has_specific_ast_arg(
+        node: ast.Call, arg_name: str, position: Optional[int] = None
+    ) -> bool:
+        """
+        Same as `has_specific_arg`, for an `ast` call.
+        """
+        return (
+            TorchVisitor.get_specific_ast_arg(
+                node, arg_name, position if position is not None else -1
+            )
+            is not None
+        )
+
+    def is_ast_number(self, node: Optional[ast.AST], *literals: str) -> bool:
+        """
+        Whether `node` is a number written as one of `literals`,
+        like `m.Integer(value=...)` or `m.Float(value=...)` match libcst nodes.
+        """
+        assert self.ast_context is not None
+        return (
+            isinstance(node, ast.Constant)
+            and isinstance(node.value, (int, float))
+            and self.ast_context.source(node) in literals
+        )
+
     def add_violation(
         self,
         node: cst.CSTNode,
         error_code: str,
         message: str,
-        replacement: Optional[cst.CSTNode] = None,
+        replacement: Union[None, cst.CSTNode, Callable[[], cst.CSTNode]] = None,
     ) -> None:
+        """
+        `replacement` can be a function making the replacement node,
+        to only make it if the fix is applied.
+        """
         position_metadata = self.get_metadata(
             cst.metadata.WhitespaceInclusivePositionProvider, node
         )
@@ -109,7 +239,28 @@ class TorchVisitor(cst.BatchableCSTVisitor, ABC):
                 line=position_metadata.start.line,
                 column=position_metadata.start.column,
                 node=node,
-                replacement=replacement,
+                replacement=(
+                    replacement if isinstance(replacement, cst.CSTNode) else None
+                ),
+                end_line=position_metadata.end.line,
+                end_column=position_metadata.end.column,
+                make_replacement=(
+                    None if isinstance(replacement, cst.CSTNode) else replacement
+                ),
+            )
+        )
+
+    def add_ast_violation(self, node: ast.AST, error_code: str, message: str) -> None:
+        assert self.ast_context is not None
+        line, column = self.ast_context.position(node)
+        self.violations.append(
+            LintViolation(
+                error_code=error_code,
+                message=message,
+                line=line,
+                column=column,
+                node=None,
+                replacement=None,
             )
         )
 
@@ -126,11 +277,54 @@ class TorchVisitor(cst.BatchableCSTVisitor, ABC):
         if isinstance(node.func, cst.Call):
             return None
 
-        name_metadata = list(self.get_metadata(QualifiedNameProvider, node))
+        name_metadata = list(
+            self.get_metadata(self.QUALIFIED_NAME_PROVIDER, node, set())
+        )
         if not name_metadata:
             return None
         return name_metadata[0].name
 
+    def get_qualified_name_for_ast_call(self, node: ast.Call) -> Optional[str]:
+        """Same as `get_qualified_name_for_call`, for an `ast` call."""
+        if isinstance(node.func, ast.Call):
+            return None
+
+        assert self.ast_context is not None
+        all_roots = self.QUALIFIED_NAME_PROVIDER is not TorchQualifiedNameProvider
+        name_metadata = list(self.ast_context.qualified_names(node, all_roots))
+        if not name_metadata:
+            return None
+        return name_metadata[0].name
+
+
+class TorchNamesVisitor(TorchVisitor):
+    """
+    Visitor only looking for names rooted at imports of `TORCH_ROOTS`,
+    resolved with `TorchQualifiedNameProvider` instead of `QualifiedNameProvider`.
+    """
+
+    METADATA_DEPENDENCIES: ClassVar[Collection[ProviderT]] = (
+        TorchQualifiedNameProvider,
+        WhitespaceInclusivePositionProvider,
+    )
+    QUALIFIED_NAME_PROVIDER = TorchQualifiedNameProvider
+
+
+def ast_call_args(node: ast.Call) -> List[Union[ast.expr, ast.keyword]]:
+    """Arguments of an `ast` call in the source order, like `cst.Call.args`."""
+    args: List[Union[ast.expr, ast.keyword]] = [*node.args, *node.keywords]
+    if node.args and node.keywords:
+        # Starred arguments can follow keyword arguments.
+        args.sort(key=lambda arg: (arg.lineno, arg.col_offset))
+    return args
+
+
+def ast_arg_value(arg: Union[ast.expr, ast.keyword]) -> ast.expr:
+    """The value of an argument of an `ast` call, like `cst.Arg.value`."""
+    if isinstance(arg, (ast.keyword, ast.Starred)):
+        return arg.value
+    return arg
+
 
 def call_with_name_changes(
     node: cst.Call, qualified_name: str, new_qualified_name: str
@@ -140,10 +334,24 @@ def call_with_name_changes(
     new `Call` node with name changes
     and a set of newly needed imports.
     """
+    name_changes = call_name_changes(node, qualified_name, new_qualified_name)
+    if name_changes is None:
+        return None
+    new_name, needed_imports = name_changes
+    return node.with_changes(func=cst.parse_expression(new_name)), needed_imports
+
+
+def call_name_changes(
+    node: cst.Call, qualified_name: str, new_qualified_name: str
+) -> Optional[Tuple[str, Set[ImportItem]]]:
+    """
+    Same as `call_with_name_changes`, with the code of the new name of the function
+    instead of the new `Call` node.
+    """
     needed_imports: Set[ImportItem] = set()
     call_name = cst.helpers.get_full_name_for_node(node)
     assert call_name is not None
-    replacement = None
+    new_name = None
 
     alias_prefix = ""
     if not qualified_name.endswith(call_name):
@@ -167,15 +375,13 @@ def call_with_name_changes(
                     obj_name=new_call_name.split(".")[0],
                 )
             )
-        replacement = node.with_changes(
-            func=cst.parse_expression(alias_prefix + new_call_name)
-        )
+        new_name = alias_prefix + new_call_name
 
     # Replace with new_qualified_name.
-    if replacement is None:
+    if new_name is None:
         return None
 
-    return replacement, needed_imports
+    return new_name, needed_imports
 
 
 def check_old_names_in_import_from(
@@ -230,6 +436,19 @@ def check_old_names_in_import_from(
     return old_names, replacement
 
 
+def old_names_in_ast_import_from(
+    node: ast.ImportFrom, old_names: Container[str]
+) -> List[str]:
+    """
+    Same as the old names found by `check_old_names_in_import_from`,
+    for an `ast` import.
+    """
+    if node.module is None or node.names[0].name == "*":
+        return []
+    qualified_names = (f"{node.module}.{alias.name}" for alias in node.names)
+    return [name for name in qualified_names if name in old_names]
+
+
 def deep_multi_replace(tree, replacement_map):
     class MultiChildReplacementTransformer(cst.CSTTransformer):
         def __init__(self, replacement_map) -> None:
@@ -0,0 +1,246 @@
+import bisect
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+import libcst.codemod as codemod
+
+from .cache import default_cache_dir
+from .client import default_socket_path, send_message
+from .executor import (
+    create_pool,
+    DIFF_CONTEXT,
+    execute_files,
+    execute_sources,
+    ExecutionResult,
+    warm_up,
+)
+from .prefilter import filter_files
+from .torchfix import process_error_code_str, TorchCodemod, TorchCodemodConfig
+
+# Upper bounds of the request latency histogram buckets, in milliseconds.
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class DaemonStats:
+    """Request counters and latency histograms, safe to update from threads."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.files: Counter = Counter()
+        # One bucket per bound in `LATENCY_BUCKETS_MS`, plus one for larger values.
+        self.latency: Dict[str, List[int]] = {}
+
+    def record_request(self, command: str, seconds: float, error: bool) -> None:
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)
+        with self._lock:
+            self.requests[command] += 1
+            if error:
+                self.errors[command] += 1
+            histogram = self.latency.setdefault(
+                command, [0] * (len(LATENCY_BUCKETS_MS) + 1)
+            )
+            histogram[bucket] += 1
+
+    def record_file(self, result: ExecutionResult) -> None:
+        with self._lock:
+            self.files[result.status] += 1
+            if result.cached:
+                self.files["cached"] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        bounds = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS]
+        bounds.append(f">{LATENCY_BUCKETS_MS[-1]}ms")
+        with self._lock:
+            return {
+                "uptime_seconds": round(time.time() - self.started_at, 3),
+                "requests": dict(self.requests),
+                "errors": dict(self.errors),
+                "files": dict(self.files),
+                "latency": {
+                    command: dict(zip(bounds, histogram))
+                    for command, histogram in self.latency.items()
+                },
+            }
+
+
+def result_message(result: ExecutionResult) -> Dict[str, Any]:
+    transform_result = result.transform_result
+    message: Dict[str, Any] = {
+        "type": "result",
+        "filename": result.filename,
+        "status": result.status,
+        "violations": result.violations,
+        "cached": result.cached,
+        "code": None,
+        "error": None,
+    }
+    if isinstance(transform_result, codemod.TransformSuccess):
+        message["code"] = transform_result.code
+    elif isinstance(transform_result, codemod.TransformFailure):
+        message["error"] = transform_result.traceback_str
+    elif isinstance(transform_result, codemod.TransformSkip):
+        message["error"] = transform_result.skip_description
+    return message
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: "TorchFixDaemon"
+
+    def handle(self) -> None:
+        started_at = time.perf_counter()
+        command = "invalid"
+        error = False
+        try:
+            request = json.loads(self.rfile.readline())
+            command = request.get("command", "invalid")
+            if command == "check":
+                self._check(request)
+            elif command == "stats":
+                self._send({"type": "stats", "stats": self.server.stats.to_dict()})
+            elif command == "shutdown":
+                self._send({"type": "shutdown"})
+                # `shutdown` blocks until the serving loop exits,
+                # so it can't be called from the handler thread.
+                threading.Thread(target=self.server.shutdown).start()
+            else:
+                raise ValueError(f"Unknown command: {command}")
+        except BrokenPipeError:
+            # The client went away, nothing to report to.
+            error = True
+        except Exception as e:
+            error = True
+            try:
+                self._send({"type": "error", "message": str(e)})
+            except OSError:
+                pass
+        finally:
+            self.server.stats.record_request(
+                command, time.perf_counter() - started_at, error
+            )
+
+    def _send(self, message: Dict[str, Any]) -> None:
+        send_message(self.wfile, message)
+
+    def _check(self, request: Dict[str, Any]) -> None:
+        config = TorchCodemodConfig()
+        config.select = list(process_error_code_str(request.get("select")))
+        if not request.get("no_cache"):
+            config.cache_dir = request.get("cache_dir") or default_cache_dir()
+        transformer = TorchCodemod(codemod.CodemodContext(), config)
+        unified_diff = None if request.get("fix") else DIFF_CONTEXT
+
+        results: Iterable[ExecutionResult]
+        if "sources" in request:
+            results = execute_sources(
+                transformer,
+                [
+                    (source["filename"], source["source"].encode())
+                    for source in request["sources"]
+                ],
+                unified_diff=unified_diff,
+                pool=self.server.pool,
+            )
+        else:
+            files = codemod.gather_files(request["paths"])
+            files = sorted({os.path.abspath(f) for f in files})
+            results = execute_files(
+                transformer,
+                filter_files(files),
+                jobs=self.server.jobs,
+                unified_diff=unified_diff,
+                pool=self.server.pool,
+            )
+
+        counts: Counter = Counter()
+        over_limit = []
+        uncached = False
+        for result in results:
+            self.server.stats.record_file(result)
+            counts[result.status] += 1
+            if result.status == "limit":
+                over_limit.append((result.filename, result.over_limit))
+            uncached = uncached or not result.cached
+            self._send(result_message(result))
+
+        result_cache = transformer.get_result_cache()
+        if result_cache is not None and uncached:
+            result_cache.prune()
+
+        self._send(
+            {
+                "type": "summary",
+                "successes": counts["success"],
+                "skips": counts["skip"],
+                "failures": counts["failure"],
+                # File names and reasons of files skipped over the limits.
+                "over_limit": over_limit,
+            }
+        )
+
+
+class TorchFixDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Server processing requests from `torchfix.client` over a Unix domain socket.
+
+    Each request is a single JSON line, and response messages are streamed
+    back as JSON lines as soon as they are available.
+    All requests share a pool of warmed-up worker processes.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, jobs: Optional[int] = None) -> None:
+        self.stats = DaemonStats()
+        # Preload everything in the server process too, the workers are forked
+        # from it and the pool is replenished by forking as well.
+        warm_up()
+        self.jobs = jobs
+        self.pool = create_pool(jobs)
+        _remove_stale_socket(socket_path)
+        # Only the current user is allowed to connect.
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.terminate()
+        self.pool.join()
+        try:
+            os.unlink(self.server_address)  # type: ignore[arg-type]
+        except OSError:
+            pass
+
+
+def _remove_stale_socket(socket_path: str) -> None:
+    if not os.path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            os.unlink(socket_path)
+            return
+    raise RuntimeError(f"TorchFix daemon is already running at {socket_path}")
+
+
+def serve(socket_path: Optional[str] = None, jobs: Optional[int] = None) -> None:
+    socket_path = socket_path or default_socket_path()
+    with TorchFixDaemon(socket_path, jobs) as server:
+        print(f"TorchFix daemon listening on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
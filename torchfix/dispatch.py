@@ -0,0 +1,111 @@
+import functools
+from typing import Callable, Collection, Dict, List, Mapping, Sequence
+
+import libcst as cst
+
+from .common import TorchVisitor
+from .names import TorchQualifiedNameProvider
+
+# Prefix of the methods of visitors handling nodes by qualified name,
+# e.g. `visit_qualified_Call`.
+QUALIFIED_VISIT_PREFIX = "visit_qualified_"
+
+_Handler = Callable[[cst.CSTNode, str], None]
+
+
+class _HandlerTable:
+    """
+    Handlers by qualified name. Names ending with a dot are prefixes,
+    their handlers are called for all names starting with them.
+    """
+
+    def __init__(self) -> None:
+        self.names: Dict[str, List[_Handler]] = {}
+        self.prefixes: Dict[str, List[_Handler]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.names or self.prefixes)
+
+    def add(self, names: Collection[str], handler: _Handler) -> None:
+        for name in names:
+            table = self.prefixes if name.endswith(".") else self.names
+            table.setdefault(name, []).append(handler)
+
+    def dispatch(self, node: cst.CSTNode, name: str) -> None:
+        for handler in self.names.get(name, ()):
+            handler(node, name)
+        if self.prefixes:
+            dot = name.find(".")
+            while dot != -1:
+                for handler in self.prefixes.get(name[: dot + 1], ()):
+                    handler(node, name)
+                dot = name.find(".", dot + 1)
+
+
+class QualifiedNameDispatcher(cst.BatchableCSTVisitor):
+    """
+    Call the `visit_qualified_Call` and `visit_qualified_Attribute` methods
+    of `visitors` with the calls and attributes with the qualified names
+    in their `QUALIFIED_CALLS` and `QUALIFIED_ATTRIBUTES`,
+    resolving the name of each node once for all visitors.
+    The calls matching the `RULES` of `visitors` are reported for them.
+
+    The name of a call is the one returned by `get_qualified_name_for_call`.
+    Attributes are only dispatched if they have a single qualified name.
+    """
+
+    METADATA_DEPENDENCIES = (TorchQualifiedNameProvider,)
+
+    def __init__(self, visitors: Sequence[TorchVisitor]) -> None:
+        super().__init__()
+        self.handlers = {"Call": _HandlerTable(), "Attribute": _HandlerTable()}
+        for visitor in visitors:
+            for node_type, names in [
+                ("Call", visitor.QUALIFIED_CALLS),
+                ("Attribute", visitor.QUALIFIED_ATTRIBUTES),
+            ]:
+                if names:
+                    # Other providers could resolve different names,
+                    # see `TorchNamesVisitor`.
+                    assert visitor.QUALIFIED_NAME_PROVIDER is TorchQualifiedNameProvider
+                    handler = getattr(visitor, QUALIFIED_VISIT_PREFIX + node_type)
+                    self.handlers[node_type].add(names, handler)
+            if visitor.RULES is not None:
+                assert visitor.QUALIFIED_NAME_PROVIDER is TorchQualifiedNameProvider
+                self.handlers["Call"].add(
+                    visitor.RULES.names,
+                    functools.partial(visitor.RULES.report, visitor),
+                )
+
+    def get_visitors(self) -> Mapping[str, Callable[[cst.CSTNode], None]]:
+        # Only visit the node types with handlers.
+        return {
+            name: method
+            for name, method in super().get_visitors().items()
+            if self.handlers[name[len("visit_") :]]
+        }
+
+    def visit_Call(self, node: cst.Call) -> None:
+        # See `get_qualified_name_for_call`.
+        if isinstance(node.func, cst.Call):
+            return
+        names = self.get_metadata(TorchQualifiedNameProvider, node, None)
+        if names:
+            self.handlers["Call"].dispatch(node, next(iter(names)).name)
+
+    def visit_Attribute(self, node: cst.Attribute) -> None:
+        names = self.get_metadata(TorchQualifiedNameProvider, node, None)
+        if names and len(names) == 1:
+            self.handlers["Attribute"].dispatch(node, next(iter(names)).name)
+
+
+def visit_cst(module: cst.MetadataWrapper, visitors: Sequence[TorchVisitor]) -> None:
+    """
+    Visit `module` with `visitors`, including their `visit_qualified_*` methods,
+    see `QualifiedNameDispatcher`.
+    """
+    dispatcher = QualifiedNameDispatcher(visitors)
+    if any(dispatcher.handlers.values()):
+        module.visit_batched([*visitors, dispatcher])
+    else:
+        module.visit_batched(visitors)
@@ -0,0 +1,841 @@
+import functools
+import heapq
+import contextlib
+import io
+import os
+import queue
+import re
+import signal
+import sys
+import threading
+import time
+import tokenize
+import traceback
+from dataclasses import dataclass, field, replace
+from multiprocessing import cpu_count, Pool, SimpleQueue
+from multiprocessing.pool import Pool as PoolType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import libcst as cst
+import libcst.codemod as codemod
+
+from .git import GitBlob, read_blobs
+from .prefilter import MARKER
+from .profiling import FileProfile, phase_timer
+from .report import display_path, format_codemod_result
+from .torchfix import (
+    ALL_VISITOR_CLS,
+    GET_TRIGGER_MATCHER,
+    get_visitor_classes_with_error_codes,
+    get_visitors,
+    TorchCodemod,
+)
+from .workers import current_rss, RecyclingPool, WorkerDiedError
+
+# Lines of context of the diffs of unfixed files.
+DIFF_CONTEXT = 5
+
+# Same marker as used by libcst, split to not mark this file as generated.
+GENERATED_CODE_MARKER = f"@{''}generated".encode()
+
+# Header comment of protobuf stubs, looked for at the start of a line
+# in the first `GENERATED_HEADER_SIZE` bytes only.
+# Looser markers like "do not edit" are also used in hand-written code.
+GENERATED_HEADER_MARKER = re.compile(
+    rb"^# Generated by the protocol buffer compiler\.", re.MULTILINE
+)
+GENERATED_HEADER_SIZE = 1024
+
+# Files of at least `MINIFIED_MIN_SIZE` bytes with an average line length
+# above `MINIFIED_LINE_LENGTH` are considered minified.
+MINIFIED_MIN_SIZE = 4096
+MINIFIED_LINE_LENGTH = 500
+
+# Cost model for files without a remembered timing, in seconds:
+# a fixed cost per file plus a cost per byte.
+# Fitted to `execute_file` times with all rules and diffs, on the default
+# `benchmarks.corpus` (40 files of 3-25 KB) on a single-core Linux VM:
+# 21 ms per file plus 67 us per byte (15 KB/s), rounded up.
+FILE_COST = 0.025
+BYTE_COST = 7e-5
+
+# Files are sent to workers in batches of up to `MAX_BATCH_SIZE` files
+# and up to `BATCH_COST` estimated seconds, to amortize IPC for small files.
+# Files estimated to take longer are sent alone.
+BATCH_COST = 0.5
+MAX_BATCH_SIZE = 16
+
+# Inputs of up to `SERIAL_MAX_FILES` files and up to `SERIAL_MAX_COST`
+# estimated seconds are processed in the current process,
+# as starting a pool would take longer.
+SERIAL_MAX_FILES = 4
+SERIAL_MAX_COST = 2.0
+
+# Number of batches in flight per worker. Keeping the pool's task queue short
+# lets large files found later by the prefilter overtake small ones.
+BATCHES_PER_WORKER = 2
+
+
+class FileTimeoutError(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def _file_timeout(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Raise `FileTimeoutError` in the block after `seconds`.
+    Only enforced in the main thread on platforms with `SIGALRM`,
+    which is where pool workers process files.
+    """
+    if (
+        seconds is None
+        or not hasattr(signal, "SIGALRM")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield
+        return
+
+    def handler(signum, frame):
+        raise FileTimeoutError(f"took longer than {seconds:g} seconds")
+
+    old_handler = signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, old_handler)
+
+
+def looks_generated(code: bytes) -> bool:
+    """Cheaply check if `code` is generated or minified, without parsing it."""
+    if GENERATED_CODE_MARKER in code:
+        return True
+    if GENERATED_HEADER_MARKER.search(code[:GENERATED_HEADER_SIZE]):
+        return True
+    lines = code.count(b"\n") + 1
+    return len(code) >= MINIFIED_MIN_SIZE and len(code) / lines > MINIFIED_LINE_LENGTH
+
+
+@dataclass(frozen=True)
+class WorkerLimits:
+    """Limits after which a worker process is replaced with a fresh one."""
+
+    max_files: Optional[int] = None
+    # In bytes.
+    max_rss: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class ExecutionResult:
+    filename: str
+    transform_result: codemod.TransformResult
+    # Reported violations, see `LintViolation.to_record`.
+    violations: List[Dict[str, Any]] = field(default_factory=list)
+    # Whether the result was replayed from the result cache.
+    cached: bool = False
+    # Wall time spent on the file, in seconds.
+    duration: float = 0.0
+    # `FileProfile.to_dict()` if profiling is enabled.
+    profile: Optional[Dict[str, Any]] = None
+    # RSS of the worker process after the file, in bytes,
+    # if it exceeded `WorkerLimits.max_rss`.
+    worker_rss: Optional[int] = None
+    # Why the file was skipped, if it was over `TorchCodemodConfig.max_file_bytes`
+    # or `TorchCodemodConfig.file_timeout`, or if it `looks_generated`.
+    over_limit: Optional[str] = None
+    # The fix plan, if `TorchCodemodConfig.emit_plan` is set and there are fixes.
+    plan: Optional[Dict[str, Any]] = None
+
+    @property
+    def status(self) -> str:
+        if self.over_limit is not None:
+            return "limit"
+        if isinstance(self.transform_result, codemod.TransformSuccess):
+            return "success"
+        if isinstance(self.transform_result, codemod.TransformFailure):
+            return "failure"
+        return "skip"
+
+
+def execute_code(
+    transformer: TorchCodemod,
+    filename: str,
+    old_code: bytes,
+    unified_diff: Optional[int] = None,
+    write_back: bool = False,
+    profile: Optional[FileProfile] = None,
+) -> ExecutionResult:
+    """
+    Run `transformer` on `old_code` of `filename`,
+    similar to libcst's `_execute_transform`.
+
+    The code of a successful result is the diff with `unified_diff` lines
+    of context if `unified_diff` is set. Otherwise, it's the new code,
+    or empty if `write_back` is set and the new code was written to `filename`.
+    With `report_only` set in the transformer config, the code is always empty
+    and nothing is written.
+
+    If profiling is enabled in the transformer config, phase times are recorded
+    in `profile` (or a new `FileProfile`) and returned with the result.
+    """
+    if profile is None and transformer.config is not None:
+        if transformer.config.profile:
+            profile = FileProfile()
+    result = _execute_code(
+        transformer, filename, old_code, unified_diff, write_back, profile
+    )
+    if profile is not None:
+        result = replace(result, profile=profile.to_dict())
+    return result
+
+
+def _execute_code(
+    transformer: TorchCodemod,
+    filename: str,
+    old_code: bytes,
+    unified_diff: Optional[int],
+    write_back: bool,
+    profile: Optional[FileProfile],
+) -> ExecutionResult:
+    violations: List[Dict[str, Any]] = []
+    cached = False
+    phase = phase_timer(profile)
+    config = transformer.config
+    max_file_bytes = config.max_file_bytes if config is not None else None
+    timeout = config.file_timeout if config is not None else None
+    report_only = config is not None and config.report_only
+    try:
+        if max_file_bytes is not None and len(old_code) > max_file_bytes:
+            return _too_large_result(filename, max_file_bytes)
+
+        if looks_generated(old_code):
+            return _over_limit_result(
+                filename, "generated or minified", codemod.SkipReason.GENERATED
+            )
+
+        transformer.context = codemod.CodemodContext(filename=filename)
+        if profile is not None:
+            transformer.context.scratch["profile"] = profile
+        # Writing back is not interrupted, to not leave the file truncated.
+        with _file_timeout(timeout):
+            if config is not None and config.select is not None:
+                with phase("triggers"):
+                    triggered = GET_TRIGGER_MATCHER().match(old_code)
+                triggered &= get_visitor_classes_with_error_codes(config.select)
+                if not triggered:
+                    # No visitor can report anything, don't parse.
+                    raise codemod.SkipFile("No changes")
+                transformer.context.scratch["triggered_visitors"] = triggered
+            transformer.context.scratch["source"] = old_code
+
+            result_cache = transformer.get_result_cache()
+            entry = None
+            if result_cache is not None:
+                with phase("cache"):
+                    entry = result_cache.load(old_code)
+            if entry is not None:
+                cached = True
+                violations = entry["violations"]
+                transformer.context.warnings.extend(entry["warnings"])
+                if transformer.on_violation is not None:
+                    for record in violations:
+                        transformer.on_violation(filename, record)
+                if entry["code"] is None:
+                    raise codemod.SkipFile("No changes")
+                encoding = entry["encoding"]
+                new_code = entry["code"].encode(encoding)
+            else:
+                try:
+                    with phase("parse"):
+                        input_tree = cst.parse_module(old_code)
+                    output_tree = transformer.transform_module(input_tree)
+                finally:
+                    violations = transformer.context.scratch.get("violations", [])
+                encoding = output_tree.encoding
+                fixed_code = transformer.context.scratch.get("fixed_code")
+                if fixed_code is not None:
+                    new_code = fixed_code
+                elif not report_only:
+                    with phase("codegen"):
+                        new_code = output_tree.bytes
+
+            if report_only:
+                # There is no fixed code to diff or write.
+                code = ""
+            elif unified_diff:
+                with phase("diff"):
+                    code = codemod.diff_code(
+                        old_code.decode(encoding),
+                        new_code.decode(encoding),
+                        unified_diff,
+                        filename=filename,
+                    )
+            elif not write_back:
+                code = new_code.decode(encoding)
+
+        if write_back and not unified_diff and not report_only:
+            if new_code != old_code:
+                with phase("write"), open(filename, "wb") as f:
+                    f.write(new_code)
+            code = ""
+
+        return ExecutionResult(
+            filename,
+            codemod.TransformSuccess(
+                warning_messages=transformer.context.warnings, code=code
+            ),
+            violations,
+            cached,
+            plan=transformer.context.scratch.get("plan"),
+        )
+    except KeyboardInterrupt:
+        return ExecutionResult(filename, codemod.TransformExit())
+    except FileTimeoutError as ex:
+        return _over_limit_result(filename, str(ex))
+    except codemod.SkipFile as ex:
+        return ExecutionResult(
+            filename,
+            codemod.TransformSkip(
+                skip_reason=codemod.SkipReason.OTHER,
+                skip_description=str(ex),
+                warning_messages=transformer.context.warnings,
+            ),
+            violations,
+            cached,
+        )
+    except Exception as ex:
+        return ExecutionResult(
+            filename,
+            codemod.TransformFailure(
+                error=ex,
+                traceback_str=traceback.format_exc(),
+                warning_messages=transformer.context.warnings,
+            ),
+            violations,
+        )
+
+
+def _over_limit_result(
+    filename: str,
+    reason: str,
+    skip_reason: codemod.SkipReason = codemod.SkipReason.OTHER,
+) -> ExecutionResult:
+    return ExecutionResult(
+        filename,
+        codemod.TransformSkip(
+            skip_reason=skip_reason,
+            skip_description=f"File {reason}.",
+        ),
+        over_limit=reason,
+    )
+
+
+def _too_large_result(filename: str, max_file_bytes: int) -> ExecutionResult:
+    return _over_limit_result(filename, f"larger than {max_file_bytes} bytes")
+
+
+def execute_file(
+    transformer: TorchCodemod, filename: str, unified_diff: Optional[int] = None
+) -> ExecutionResult:
+    """
+    Run `transformer` on a single file.
+
+    If `unified_diff` is set, the successful result contains the diff
+    with `unified_diff` lines of context, otherwise the changes are written
+    back to the file.
+    """
+    started_at = time.perf_counter()
+    profile = None
+    if transformer.config is not None and transformer.config.profile:
+        profile = FileProfile()
+    max_file_bytes = None
+    if transformer.config is not None:
+        max_file_bytes = transformer.config.max_file_bytes
+    try:
+        with phase_timer(profile)("read"), open(filename, "rb") as f:
+            # Files over the limit aren't read.
+            if max_file_bytes is not None:
+                if os.fstat(f.fileno()).st_size > max_file_bytes:
+                    return _too_large_result(filename, max_file_bytes)
+            old_code = f.read()
+    except Exception as ex:
+        return ExecutionResult(
+            filename,
+            codemod.TransformFailure(
+                error=ex, traceback_str=traceback.format_exc(), warning_messages=[]
+            ),
+        )
+
+    result = execute_code(
+        transformer, filename, old_code, unified_diff, write_back=True, profile=profile
+    )
+    return replace(result, duration=time.perf_counter() - started_at)
+
+
+# Worker process state, set by `_init_worker`.
+# Channel for streaming violations to the parent process.
+_violations_queue: Optional[SimpleQueue] = None
+_worker_limits: Optional[WorkerLimits] = None
+_files_processed = 0
+_retiring = False
+
+
+def _init_worker(
+    violations_queue: Optional[SimpleQueue],
+    worker_limits: Optional[WorkerLimits] = None,
+) -> None:
+    global _violations_queue, _worker_limits
+    _violations_queue = violations_queue
+    _worker_limits = worker_limits
+    warm_up()
+
+
+def _should_retire() -> bool:
+    return _retiring
+
+
+def _put_violation(filename: str, record: Dict[str, Any]) -> None:
+    assert _violations_queue is not None
+    _violations_queue.put((filename, record))
+
+
+def _execute_batch(
+    transformer: TorchCodemod, filenames: List[str], unified_diff: Optional[int]
+) -> List[ExecutionResult]:
+    """
+    Process `filenames` in a worker. If a worker limit is reached,
+    the worker retires and the results for the rest of the files are omitted.
+    """
+    global _files_processed, _retiring
+    if _violations_queue is not None:
+        transformer.on_violation = _put_violation
+    results = []
+    for filename in filenames:
+        if _retiring:
+            break
+        result = execute_file(transformer, filename, unified_diff)
+        _files_processed += 1
+        if _worker_limits is not None:
+            max_files = _worker_limits.max_files
+            if max_files is not None and _files_processed >= max_files:
+                _retiring = True
+            max_rss = _worker_limits.max_rss
+            if max_rss is not None:
+                rss = current_rss()
+                if rss > max_rss:
+                    result = replace(result, worker_rss=rss)
+                    _retiring = True
+        results.append(result)
+    return results
+
+
+def _execute_code_task(
+    task: Tuple[TorchCodemod, str, bytes, Optional[int]],
+) -> ExecutionResult:
+    return execute_code(*task)
+
+
+def warm_up() -> None:
+    """Do one-time work ahead of processing files, e.g. in a new worker."""
+    cst.parse_module("")
+    get_visitors(set(ALL_VISITOR_CLS))
+    GET_TRIGGER_MATCHER()
+
+
+def create_pool(
+    jobs: Optional[int] = None, violations_queue: Optional[SimpleQueue] = None
+) -> PoolType:
+    """
+    Create a pool of `jobs` worker processes.
+    If `violations_queue` is provided, workers put `(filename, record)` pairs
+    of violations in it as soon as they are found.
+    """
+    jobs = jobs if jobs is not None else cpu_count()
+    if jobs < 1:
+        raise ValueError("Must have at least one job to process!")
+    # Warm the parser, pre-fork.
+    cst.parse_module("")
+    return Pool(processes=jobs, initializer=_init_worker, initargs=(violations_queue,))
+
+
+def _create_worker_pool(
+    jobs: Optional[int],
+    violations_queue: Optional[SimpleQueue],
+    worker_limits: Optional[WorkerLimits],
+) -> Union[PoolType, RecyclingPool]:
+    """Like `create_pool`, but replace workers when they reach `worker_limits`."""
+    if worker_limits is None:
+        return create_pool(jobs, violations_queue)
+    jobs = jobs if jobs is not None else cpu_count()
+    if jobs < 1:
+        raise ValueError("Must have at least one job to process!")
+    cst.parse_module("")
+    return RecyclingPool(
+        jobs, _init_worker, (violations_queue, worker_limits), _should_retire
+    )
+
+
+def estimate_cost(filename: str, timings: Optional[Dict[str, float]] = None) -> float:
+    """
+    Estimate the time to process `filename`, in seconds,
+    from its timing in a previous run if known, otherwise from its size.
+    """
+    if timings is not None and filename in timings:
+        return timings[filename]
+    try:
+        size = os.path.getsize(filename)
+    except OSError:
+        return FILE_COST
+    return FILE_COST + size * BYTE_COST
+
+
+class _FileQueue:
+    """
+    Files ordered by decreasing estimated cost, for longest-processing-time-first
+    scheduling. The queue is fed from an iterator in a background thread,
+    so that files can be scheduled while the rest are still being produced.
+    """
+
+    def __init__(self, files: Iterable[str], timings: Optional[Dict[str, float]]):
+        self._heap: List[Tuple[float, int, str]] = []
+        self._cond = threading.Condition()
+        self._timings = timings
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.count = 0
+        self.total_cost = 0.0
+        threading.Thread(target=self._feed, args=(files,), daemon=True).start()
+
+    def _feed(self, files: Iterable[str]) -> None:
+        try:
+            for filename in files:
+                self.push(filename)
+        except BaseException as e:
+            self.error = e
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+
+    def push(self, filename: str) -> None:
+        cost = estimate_cost(filename, self._timings)
+        with self._cond:
+            # The counter keeps equal costs in input order.
+            heapq.heappush(self._heap, (-cost, self.count, filename))
+            self.count += 1
+            self.total_cost += cost
+            self._cond.notify_all()
+
+    def wait_for(
+        self, predicate: Callable[[], bool], timeout: Optional[float] = None
+    ) -> None:
+        with self._cond:
+            self._cond.wait_for(lambda: self.done or predicate(), timeout)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def pop_batch(self) -> List[str]:
+        """
+        Pop the most expensive file, together with the next ones
+        while they fit in a batch. Returns an empty list if the queue is empty.
+        """
+        batch: List[str] = []
+        batch_cost = 0.0
+        with self._cond:
+            while self._heap and len(batch) < MAX_BATCH_SIZE:
+                cost = -self._heap[0][0]
+                if batch and batch_cost + cost > BATCH_COST:
+                    break
+                batch.append(heapq.heappop(self._heap)[2])
+                batch_cost += cost
+        return batch
+
+
+def execute_files(
+    transformer: TorchCodemod,
+    files: Iterable[str],
+    *,
+    jobs: Optional[int] = None,
+    unified_diff: Optional[int] = None,
+    pool: Optional[PoolType] = None,
+    on_violation: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+    timings: Optional[Dict[str, float]] = None,
+    worker_limits: Optional[WorkerLimits] = None,
+) -> Iterator[ExecutionResult]:
+    """
+    Run `transformer` on `files` in a pool of `jobs` worker processes,
+    yielding results in completion order.
+
+    `files` is consumed lazily, so workers can start on the first files
+    while the rest are still being produced (e.g. by the prefilter).
+    Files are expected to be deduplicated.
+    The most expensive files are scheduled first, according to `timings`
+    (seconds per file from previous runs, see `ExecutionResult.duration`)
+    or their size, and small files are sent to workers in batches.
+    If `pool` is provided, it's used instead of creating a new pool.
+    Otherwise, small inputs are processed in the current process,
+    and workers are replaced when they reach `worker_limits`.
+
+    If `on_violation` is provided, it's called in the current process with
+    the file name and the record of each violation as soon as a worker finds it,
+    possibly before the result for the file is yielded.
+    """
+    if pool is not None:
+        if on_violation is not None:
+            raise ValueError("`on_violation` is not supported with a provided pool")
+        yield from _schedule(
+            transformer, _FileQueue(files, timings), pool, jobs, unified_diff
+        )
+        return
+
+    if jobs == 1 and worker_limits is None:
+        transformer.on_violation = on_violation
+        for filename in files:
+            yield execute_file(transformer, filename, unified_diff)
+        return
+
+    file_queue = _FileQueue(files, timings)
+    file_queue.wait_for(
+        lambda: file_queue.count > SERIAL_MAX_FILES
+        or file_queue.total_cost > SERIAL_MAX_COST
+    )
+    if file_queue.done and file_queue.error is None:
+        if (
+            file_queue.count <= SERIAL_MAX_FILES
+            and file_queue.total_cost <= SERIAL_MAX_COST
+        ):
+            transformer.on_violation = on_violation
+            while len(file_queue):
+                for filename in file_queue.pop_batch():
+                    yield execute_file(transformer, filename, unified_diff)
+            return
+
+    if on_violation is None:
+        with _create_worker_pool(jobs, None, worker_limits) as worker_pool:
+            yield from _schedule(
+                transformer, file_queue, worker_pool, jobs, unified_diff
+            )
+        return
+
+    violations_queue: SimpleQueue = SimpleQueue()
+
+    def drain_violations() -> None:
+        assert on_violation is not None
+        for item in iter(violations_queue.get, None):
+            on_violation(*item)
+
+    drain_thread = threading.Thread(target=drain_violations, daemon=True)
+    drain_thread.start()
+    try:
+        with _create_worker_pool(jobs, violations_queue, worker_limits) as worker_pool:
+            yield from _schedule(
+                transformer, file_queue, worker_pool, jobs, unified_diff
+            )
+    finally:
+        # `SimpleQueue.put` is synchronous, so all the violations
+        # from finished tasks are already in the queue before this.
+        violations_queue.put(None)
+        drain_thread.join()
+
+
+def _schedule(
+    transformer: TorchCodemod,
+    file_queue: _FileQueue,
+    pool: Union[PoolType, RecyclingPool],
+    jobs: Optional[int],
+    unified_diff: Optional[int],
+) -> Iterator[ExecutionResult]:
+    """
+    Send batches from `file_queue` to `pool` and yield their results.
+    Files left over by retiring workers are sent again.
+    """
+    max_in_flight = (jobs or cpu_count()) * BATCHES_PER_WORKER
+    # Batches with their results, or exceptions raised by the pool.
+    done: queue.SimpleQueue = queue.SimpleQueue()
+    in_flight = 0
+    while True:
+        if in_flight < max_in_flight:
+            batch = file_queue.pop_batch()
+            if batch:
+                pool.apply_async(
+                    _execute_batch,
+                    (transformer, batch, unified_diff),
+                    callback=functools.partial(_put_pair, done, batch),
+                    error_callback=functools.partial(_put_pair, done, batch),
+                )
+                in_flight += 1
+                continue
+
+        if in_flight == 0:
+            if file_queue.done and not len(file_queue):
+                break
+            file_queue.wait_for(lambda: len(file_queue) > 0)
+            continue
+
+        try:
+            # While files are still coming, wake up regularly to schedule them.
+            item = done.get(timeout=None if file_queue.done else 0.05)
+        except queue.Empty:
+            continue
+        in_flight -= 1
+        batch, results = item
+        if isinstance(results, WorkerDiedError):
+            for filename in batch:
+                yield ExecutionResult(
+                    filename,
+                    codemod.TransformFailure(
+                        error=results, traceback_str=str(results), warning_messages=[]
+                    ),
+                )
+            continue
+        if isinstance(results, BaseException):
+            raise results
+        yield from results
+        processed = {result.filename for result in results}
+        for filename in batch:
+            if filename not in processed:
+                file_queue.push(filename)
+
+    if file_queue.error is not None:
+        raise file_queue.error
+
+
+def _put_pair(done: queue.SimpleQueue, first: Any, second: Any) -> None:
+    done.put((first, second))
+
+
+def execute_sources(
+    transformer: TorchCodemod,
+    sources: Iterable[Tuple[str, bytes]],
+    *,
+    unified_diff: Optional[int] = None,
+    pool: PoolType,
+) -> Iterator[ExecutionResult]:
+    """
+    Run `transformer` on `(filename, code)` pairs in `pool`,
+    yielding results in completion order. Files are not read or written.
+    """
+    tasks = ((transformer, filename, code, unified_diff) for filename, code in sources)
+    yield from pool.imap_unordered(_execute_code_task, tasks)
+
+
+def execute_blobs(
+    transformer: TorchCodemod,
+    blobs: Sequence[GitBlob],
+    *,
+    jobs: Optional[int] = None,
+    unified_diff: Optional[int] = None,
+    on_violation: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+) -> Iterator[ExecutionResult]:
+    """
+    Run `transformer` on git `blobs`, read from the object database
+    without touching the working tree, yielding results in completion order.
+
+    Blobs without the prefilter marker are skipped without a result.
+    Each distinct blob is processed once, and its result is yielded
+    for each of its paths. Nothing is written: the code of a successful result
+    is the diff if `unified_diff` is set, or the new code otherwise.
+    With `report_only` set in the transformer config, there is no diff.
+    """
+    if transformer.config is not None and transformer.config.report_only:
+        unified_diff = None
+    paths: Dict[str, List[str]] = {}
+    for blob in blobs:
+        paths.setdefault(blob.sha, []).append(blob.path)
+    distinct = [blob for blob in blobs if paths[blob.sha][0] == blob.path]
+    # Kept until the result is ready, to make diffs for each path.
+    old_codes: Dict[str, bytes] = {}
+
+    def sources() -> Iterator[Tuple[str, bytes]]:
+        for blob, code in read_blobs(distinct):
+            if MARKER in code:
+                old_codes[blob.path] = code
+                yield blob.path, code
+
+    if jobs == 1 or len(distinct) <= SERIAL_MAX_FILES:
+        results: Iterable[ExecutionResult] = (
+            execute_code(transformer, filename, code) for filename, code in sources()
+        )
+        yield from _blob_results(results, paths, old_codes, unified_diff, on_violation)
+        return
+    with create_pool(jobs) as pool:
+        results = execute_sources(transformer, sources(), pool=pool)
+        yield from _blob_results(results, paths, old_codes, unified_diff, on_violation)
+
+
+def _blob_results(
+    results: Iterable[ExecutionResult],
+    paths: Dict[str, List[str]],
+    old_codes: Dict[str, bytes],
+    unified_diff: Optional[int],
+    on_violation: Optional[Callable[[str, Dict[str, Any]], None]],
+) -> Iterator[ExecutionResult]:
+    """Yield a copy of each result of a distinct blob for each path of the blob."""
+    shas = {blob_paths[0]: sha for sha, blob_paths in paths.items()}
+    for result in results:
+        old_code = old_codes.pop(result.filename)
+        transform_result = result.transform_result
+        for path in paths[shas[result.filename]]:
+            if on_violation is not None:
+                for record in result.violations:
+                    on_violation(path, record)
+            if unified_diff and isinstance(transform_result, codemod.TransformSuccess):
+                encoding, _ = tokenize.detect_encoding(io.BytesIO(old_code).readline)
+                diff = codemod.diff_code(
+                    old_code.decode(encoding),
+                    transform_result.code,
+                    unified_diff,
+                    filename=path,
+                )
+                yield replace(
+                    result,
+                    filename=path,
+                    transform_result=codemod.TransformSuccess(
+                        warning_messages=transform_result.warning_messages, code=diff
+                    ),
+                )
+            else:
+                yield replace(result, filename=path)
+
+
+def print_execution_result(result: ExecutionResult, text_output: bool = True) -> None:
+    """
+    Print violations and the diff, if any, to stdout,
+    and diagnostics to stderr.
+    If `text_output` is False, only diagnostics are printed.
+    """
+    filename = result.filename
+    transform_result = result.transform_result
+    if text_output:
+        path = display_path(filename)
+        for record in result.violations:
+            print(f"{path}{format_codemod_result(record)}")
+
+    for warning in transform_result.warning_messages:
+        print(f"WARNING: {warning}", file=sys.stderr)
+
+    if isinstance(transform_result, codemod.TransformSkip):
+        print(
+            f"Skipped codemodding {filename}: {transform_result.skip_description}\n",
+            file=sys.stderr,
+        )
+    elif isinstance(transform_result, codemod.TransformFailure):
+        print(transform_result.traceback_str, file=sys.stderr)
+        print(f"Failed to codemod {filename}\n", file=sys.stderr)
+    elif isinstance(transform_result, codemod.TransformSuccess):
+        # In unified diff mode, the code is a diff we must print.
+        if text_output and transform_result.code:
+            print(transform_result.code)
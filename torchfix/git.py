@@ -0,0 +1,189 @@
+import os
+import subprocess
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+class GitError(Exception):
+    pass
+
+
+def _run_git(args: Sequence[str], cwd: str) -> List[str]:
+    """Run git in `cwd` and return NUL-separated output entries."""
+    try:
+        result = subprocess.run(
+            ["git", *args], cwd=cwd, capture_output=True, check=True
+        )
+    except FileNotFoundError:
+        raise GitError("git executable not found")
+    except subprocess.CalledProcessError as e:
+        raise GitError(e.stderr.decode(errors="replace").strip())
+    return [entry for entry in os.fsdecode(result.stdout).split("\0") if entry]
+
+
+def _path_args(path: str) -> Tuple[str, str]:
+    """Return the directory to run git in and the pathspec for `path`."""
+    if os.path.isdir(path):
+        return path, "."
+    return os.path.dirname(path) or ".", os.path.basename(path)
+
+
+def changed_files(
+    paths: Sequence[str], rev: Optional[str] = None, staged: bool = False
+) -> List[str]:
+    """
+    Return Python files under `paths` that were changed, added or renamed,
+    either compared to `rev` (including uncommitted and untracked files),
+    or in the index if `staged` is True.
+
+    Only the local repository is queried. Deleted files are not returned.
+    """
+    if staged == (rev is not None):
+        raise ValueError("Exactly one of `rev` and `staged` must be provided")
+
+    diff_args = ["diff", "--name-only", "-z", "--relative", "--diff-filter=ACMR"]
+    if rev is not None:
+        diff_args.append(rev)
+    else:
+        diff_args.append("--cached")
+    diff_args.append("--")
+
+    files = set()
+    for path in paths:
+        cwd, pathspec = _path_args(path)
+        entries = _run_git([*diff_args, pathspec], cwd)
+        if not staged:
+            entries += _run_git(
+                ["ls-files", "-z", "--others", "--exclude-standard", pathspec], cwd
+            )
+        for entry in entries:
+            file = os.path.join(cwd, entry)
+            # Files can be deleted in the working tree but not in git.
+            if file.endswith(".py") and os.path.isfile(file):
+                files.add(file)
+    return sorted(files)
+
+
+@dataclass(frozen=True)
+class GitBlob:
+    # Path of the file in the working tree, which may have different content.
+    path: str
+    # Object name of the blob.
+    sha: str
+    # Git directory of the repository with the blob.
+    git_dir: str
+
+
+# Modes of regular files; symlinks and submodules are not checked.
+_FILE_MODES = ("100644", "100755")
+
+
+def _git_dir(cwd: str) -> str:
+    (output,) = _run_git(["rev-parse", "--absolute-git-dir"], cwd)
+    return output.strip()
+
+
+def staged_blobs(paths: Sequence[str]) -> List[GitBlob]:
+    """
+    Return the staged blobs of Python files under `paths` that were changed,
+    added or renamed in the index, like `changed_files(paths, staged=True)`.
+    """
+    blobs = {}
+    for path in paths:
+        cwd, pathspec = _path_args(path)
+        git_dir = _git_dir(cwd)
+        entries = _run_git(
+            [
+                "diff",
+                "--cached",
+                "--raw",
+                "-z",
+                "--no-abbrev",
+                "--relative",
+                "--diff-filter=ACMR",
+                "--",
+                pathspec,
+            ],
+            cwd,
+        )
+        # Each entry is ":<old mode> <new mode> <old sha> <new sha> <status>"
+        # followed by the path, or the old and new paths for renames and copies.
+        i = 0
+        while i < len(entries):
+            _, mode, _, sha, status = entries[i][1:].split()
+            i += 3 if status[0] in "RC" else 2
+            file = os.path.join(cwd, entries[i - 1])
+            if file.endswith(".py") and mode in _FILE_MODES:
+                file = os.path.abspath(file)
+                blobs[file] = GitBlob(file, sha, git_dir)
+    return sorted(blobs.values(), key=lambda blob: blob.path)
+
+
+def tree_blobs(paths: Sequence[str], tree_ish: str) -> List[GitBlob]:
+    """Return the blobs of Python files under `paths` in `tree_ish`, e.g. HEAD."""
+    blobs = {}
+    for path in paths:
+        cwd, pathspec = _path_args(path)
+        git_dir = _git_dir(cwd)
+        for entry in _run_git(["ls-tree", "-r", "-z", tree_ish, "--", pathspec], cwd):
+            # "<mode> <type> <sha>\t<path>", with the path relative to `cwd`.
+            info, name = entry.split("\t", 1)
+            mode, _, sha = info.split()
+            file = os.path.join(cwd, name)
+            if file.endswith(".py") and mode in _FILE_MODES:
+                file = os.path.abspath(file)
+                blobs[file] = GitBlob(file, sha, git_dir)
+    return sorted(blobs.values(), key=lambda blob: blob.path)
+
+
+class BlobReader:
+    """Read blobs through a single long-lived `git cat-file --batch` process."""
+
+    def __init__(self, git_dir: str) -> None:
+        try:
+            self._process = subprocess.Popen(
+                ["git", "--git-dir", git_dir, "cat-file", "--batch"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+        except FileNotFoundError:
+            raise GitError("git executable not found")
+
+    def read(self, sha: str) -> bytes:
+        stdin, stdout = self._process.stdin, self._process.stdout
+        assert stdin is not None and stdout is not None
+        stdin.write(sha.encode() + b"\n")
+        stdin.flush()
+        # "<sha> <type> <size>", or "<sha> missing".
+        header = stdout.readline().split()
+        if len(header) != 3:
+            raise GitError(f"Failed to read git object {sha}")
+        data = stdout.read(int(header[2]))
+        # Skip the newline after the content.
+        stdout.read(1)
+        return data
+
+    def close(self) -> None:
+        assert self._process.stdin is not None
+        self._process.stdin.close()
+        self._process.wait()
+
+    def __enter__(self) -> "BlobReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def read_blobs(blobs: Iterable[GitBlob]) -> Iterator[Tuple[GitBlob, bytes]]:
+    """Lazily yield the content of each of `blobs`, with one reader per repository."""
+    readers: Dict[str, BlobReader] = {}
+    try:
+        for blob in blobs:
+            reader = readers.get(blob.git_dir)
+            if reader is None:
+                reader = readers[blob.git_dir] = BlobReader(blob.git_dir)
+            yield blob, reader.read(blob.sha)
+    finally:
+        for reader in readers.values():
+            reader.close()
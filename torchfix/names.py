@@ -0,0 +1,964 @@
+import ast
+import builtins
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Collection,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+import libcst as cst
+from libcst.helpers import get_full_name_for_node
+from libcst.metadata import (
+    BatchableMetadataProvider,
+    QualifiedName,
+    QualifiedNameProvider,
+    QualifiedNameSource,
+)
+
+# Names rooted at imports of these modules are resolved by
+# `TorchQualifiedNameProvider`.
+TORCH_ROOTS = frozenset(["torch", "torchvision", "functorch"])
+
+# Nodes after which the index of assignments in the current scope is incremented,
+# as in libcst's scope analysis.
+_ASSIGNMENT_LIKE_NODES = (
+    cst.AnnAssign,
+    cst.AsName,
+    cst.Assign,
+    cst.AugAssign,
+    cst.ClassDef,
+    cst.CompFor,
+    cst.FunctionDef,
+    cst.Global,
+    cst.Import,
+    cst.ImportFrom,
+    cst.NamedExpr,
+    cst.Nonlocal,
+    cst.Parameters,
+    cst.WithItem,
+)
+
+
+@dataclass(frozen=True)
+class _Import:
+    """An import statement: the module imported from, if any, and the names."""
+
+    # Relative modules start with dots.
+    module: str
+    # Imported names with their aliases.
+    names: Tuple[Tuple[str, Optional[str]], ...]
+
+
+@dataclass(eq=False)
+class _Binding:
+    name: str
+    scope: "_Scope"
+    index: int
+    # The import statement for import bindings, None otherwise.
+    imported: Optional[_Import] = None
+
+    def qualified_names(self, full_name: str) -> Set[QualifiedName]:
+        if self.imported is None:
+            prefix = self.scope.prefix
+            name = f"{prefix}.{full_name}" if prefix else full_name
+            return {QualifiedName(name, QualifiedNameSource.LOCAL)}
+        return _import_qualified_names(self.imported, full_name)
+
+
+class _Scope:
+    """
+    A scope of `_ScopeVisitor`, resolving names the same way
+    as `libcst.metadata.Scope`. The global scope has no parent.
+    """
+
+    def __init__(
+        self, parent: Optional["_Scope"], prefix: str, is_class: bool = False
+    ) -> None:
+        self.parent = parent
+        self.globals: _Scope = self if parent is None else parent.globals
+        self.prefix = prefix
+        self.is_class = is_class
+        self.bindings: Dict[str, List[_Binding]] = defaultdict(list)
+        # Scopes of names declared `global` or `nonlocal`.
+        self.overwrites: Dict[str, _Scope] = {}
+        self.assignment_count = 0
+
+    def _next_visible_parent(self, first: Optional["_Scope"] = None) -> "_Scope":
+        # Class scopes aren't visible from nested scopes.
+        parent = first if first is not None else self.parent
+        while parent is not None and parent.is_class:
+            parent = parent.parent
+        assert parent is not None
+        return parent
+
+    def _assignment_target(self, name: str) -> "_Scope":
+        if name in self.overwrites:
+            scope = self._next_visible_parent(self.overwrites[name])
+            return scope._assignment_target(name)
+        return self
+
+    def bind(self, name: str, imported: Optional[_Import] = None) -> None:
+        target = self._assignment_target(name)
+        target.bindings[name].append(
+            _Binding(name, target, target.assignment_count, imported)
+        )
+
+    def contains(self, name: str) -> bool:
+        if name in self.overwrites:
+            return self.overwrites[name].contains(name)
+        if self.bindings.get(name):
+            return True
+        if self.parent is None:
+            return hasattr(builtins, name)
+        return self._next_visible_parent().contains(name)
+
+    def resolve(self, name: str) -> Sequence[Optional[_Binding]]:
+        """Bindings of `name` accessed from this scope, None for a builtin."""
+        scope = self
+        while True:
+            if name in scope.overwrites:
+                scope = scope._next_visible_parent(scope.overwrites[name])
+            elif scope.bindings.get(name):
+                return scope.bindings[name]
+            elif scope.parent is None:
+                return [None] if hasattr(builtins, name) else []
+            else:
+                scope = scope._next_visible_parent()
+
+
+def _qualified_names(
+    bindings: Sequence[Optional[_Binding]], full_name: str
+) -> Set[QualifiedName]:
+    names = set()
+    for binding in bindings:
+        if binding is None:
+            # Builtins are named by the resolved prefix of the full name.
+            builtin = full_name.split(".", 1)[0]
+            names.add(QualifiedName(f"builtins.{builtin}", QualifiedNameSource.BUILTIN))
+        else:
+            names |= binding.qualified_names(full_name)
+    return names
+
+
+def _import_qualified_names(imported: _Import, full_name: str) -> Set[QualifiedName]:
+    """Same as `libcst.metadata.ImportAssignment.get_qualified_names_for`."""
+    module = imported.module
+    results = set()
+    for real_name, alias in imported.names:
+        if not real_name:
+            continue
+        parts = real_name.split(".")
+        for i in range(len(parts), 0, -1):
+            real_name = ".".join(parts[:i])
+            as_name = real_name
+            if module.endswith("."):
+                real_name = f"{module}{real_name}"
+            elif module:
+                real_name = f"{module}.{real_name}"
+            if alias:
+                as_name = alias
+            if full_name.startswith(as_name):
+                remaining_name = full_name.split(as_name, 1)[1]
+                if remaining_name and not remaining_name.startswith("."):
+                    continue
+                remaining_name = remaining_name.lstrip(".")
+                results.add(
+                    QualifiedName(
+                        (
+                            f"{real_name}.{remaining_name}"
+                            if remaining_name
+                            else real_name
+                        ),
+                        QualifiedNameSource.IMPORT,
+                    )
+                )
+                break
+    return results
+
+
+def _cst_import(node: Union[cst.Import, cst.ImportFrom]) -> _Import:
+    module = ""
+    if isinstance(node, cst.ImportFrom):
+        if node.module is not None:
+            module = get_full_name_for_node(node.module) or ""
+        if node.relative:
+            module = "." * len(node.relative) + module
+    assert not isinstance(node.names, cst.ImportStar)
+    return _Import(
+        module,
+        tuple(
+            (get_full_name_for_node(alias.name) or "", alias.evaluated_alias or None)
+            for alias in node.names
+        ),
+    )
+
+
+def _dotted_names(
+    node: Union[cst.Attribute, cst.Name]
+) -> Iterator[Tuple[str, Union[cst.Attribute, cst.Name]]]:
+    """Names accessed by an attribute, longest first, as in libcst's scope analysis."""
+    if isinstance(node, cst.Name):
+        yield node.value, node
+        return
+    value = node.value
+    if isinstance(value, cst.Call):
+        # The attribute of a call's result is not part of the names.
+        if isinstance(value.func, (cst.Attribute, cst.Name)):
+            yield from _dotted_names(value.func)
+    elif isinstance(value, (cst.Attribute, cst.Name)):
+        names = _dotted_names(value)
+        for name, name_node in names:
+            yield f"{name}.{node.attr.value}", node
+            yield name, name_node
+            yield from names
+            break
+
+
+def _root_name(node: cst.CSTNode) -> Optional[str]:
+    while True:
+        if isinstance(node, cst.Name):
+            return node.value
+        if isinstance(node, (cst.Attribute, cst.Subscript)):
+            node = node.value
+        elif isinstance(node, cst.Call):
+            node = node.func
+        else:
+            return None
+
+
+def _ast_name(node: ast.AST) -> Optional[str]:
+    """The name of a `Name` node, or of `None`, `True` or `False`, names in libcst."""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Constant) and (
+        node.value is None or isinstance(node.value, bool)
+    ):
+        return str(node.value)
+    return None
+
+
+def _ast_dotted_names(node: ast.expr) -> Iterator[Tuple[str, ast.expr]]:
+    """Same as `_dotted_names`, for `ast` nodes."""
+    name = _ast_name(node)
+    if name is not None:
+        yield name, node
+        return
+    assert isinstance(node, ast.Attribute)
+    value = node.value
+    if isinstance(value, ast.Call):
+        func = value.func
+        if isinstance(func, ast.Attribute) or _ast_name(func) is not None:
+            yield from _ast_dotted_names(func)
+    elif isinstance(value, ast.Attribute) or _ast_name(value) is not None:
+        names = _ast_dotted_names(value)
+        for name, name_node in names:
+            yield f"{name}.{node.attr}", node
+            yield name, name_node
+            yield from names
+            break
+
+
+def _ast_root_name(node: ast.AST) -> Optional[str]:
+    while True:
+        if isinstance(node, (ast.Attribute, ast.Subscript)):
+            node = node.value
+        elif isinstance(node, ast.Call):
+            node = node.func
+        else:
+            return _ast_name(node)
+
+
+def _ast_full_name(node: ast.AST) -> Optional[str]:
+    """Same as `libcst.helpers.get_full_name_for_node`, for `ast` nodes."""
+    if isinstance(node, ast.Attribute):
+        return f"{_ast_full_name(node.value)}.{node.attr}"
+    if isinstance(node, ast.Call):
+        return _ast_full_name(node.func)
+    if isinstance(node, ast.Subscript):
+        return _ast_full_name(node.value)
+    return _ast_name(node)
+
+
+# Calls and attributes, of libcst or `ast` trees.
+_NodeT = TypeVar(
+    "_NodeT", bound=Union[cst.Call, cst.Attribute, ast.Call, ast.Attribute]
+)
+
+
+@dataclass
+class _Access:
+    name: str
+    scope: _Scope
+    index: int
+    # The outermost attribute the name is a part of.
+    attribute: Union[cst.Attribute, ast.Attribute]
+
+
+class _NameIndex(Generic[_NodeT], ABC):
+    """
+    The bindings of all names, and calls and attributes with their scopes,
+    collected by traversing a module the same way as libcst's scope analysis.
+    Subclasses traverse libcst or `ast` trees.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.scope = _Scope(None, "")
+        self.nodes: List[Tuple[_NodeT, _Scope]] = []
+        self.accesses: List[_Access] = []
+        # Names imported from `TORCH_ROOTS`.
+        self.torch_names: Set[str] = set()
+        # Whether the module has constructs not handled here.
+        self.unsupported = False
+        # The outermost attribute being visited, for each call being visited.
+        self._attributes: List[Optional[Union[cst.Attribute, ast.Attribute]]] = [None]
+
+    @staticmethod
+    @abstractmethod
+    def _root_name(node: Any) -> Optional[str]:
+        """The name at the root of a call or an attribute."""
+
+    @staticmethod
+    @abstractmethod
+    def _full_name(node: Any) -> Optional[str]:
+        """See `libcst.helpers.get_full_name_for_node`."""
+
+    @staticmethod
+    @abstractmethod
+    def _dotted_names(node: Any) -> Iterator[Tuple[str, Any]]:
+        """The names accessed by an attribute, with their nodes, longest first."""
+
+    def _new_scope(self, prefix: Optional[str], is_class: bool = False) -> _Scope:
+        parent = self.scope
+        prefix = ".".join(filter(None, [parent.prefix, prefix]))
+        self.scope = _Scope(parent, prefix, is_class)
+        return parent
+
+    def _bind_import(self, imported: _Import, names: Iterator[str], is_torch: bool):
+        for name in names:
+            self.scope.bind(name, imported)
+            if is_torch:
+                self.torch_names.add(name.split(".", 1)[0])
+
+    def _access(self, name: str) -> None:
+        attribute = self._attributes[-1]
+        if attribute is not None:
+            self.accesses.append(
+                _Access(name, self.scope, self.scope.assignment_count, attribute)
+            )
+
+    def _access_nodes(
+        self, roots: Optional[Collection[str]]
+    ) -> Dict[Any, List[Tuple[_Access, str]]]:
+        """
+        Attributes that are accesses of dotted import names, e.g. `torch.nn`
+        after `import torch.nn`, with the accesses and the names.
+        """
+        access_nodes: Dict[Any, List[Tuple[_Access, str]]] = defaultdict(list)
+        for access in self.accesses:
+            if roots is not None and access.name not in roots:
+                continue
+            for name, node in self._dotted_names(access.attribute):
+                if access.scope.contains(name):
+                    if isinstance(node, (cst.Attribute, ast.Attribute)):
+                        access_nodes[node].append((access, name))
+                    break
+        return access_nodes
+
+    def qualified_names(
+        self, all_roots: bool = False
+    ) -> Iterator[Tuple[_NodeT, Set[QualifiedName]]]:
+        """
+        Yield the qualified names of calls and attributes rooted at names
+        imported from `TORCH_ROOTS` (or at those names themselves),
+        or of all calls and attributes rooted at a name if `all_roots`.
+        """
+        roots = None if all_roots else self.torch_names | TORCH_ROOTS
+        access_nodes = self._access_nodes(roots)
+        for node, scope in self.nodes:
+            if roots is not None and self._root_name(node) not in roots:
+                continue
+            if node in access_nodes:
+                yield node, self._access_qualified_names(access_nodes[node])
+                continue
+            # Not an access, use all bindings of the longest bound prefix
+            # of the full name, wherever they are in the scope.
+            full_name = self._full_name(node)
+            if full_name is None:
+                continue
+            prefix: Optional[str] = full_name
+            bindings: Sequence[Optional[_Binding]] = []
+            while prefix:
+                if scope.contains(prefix):
+                    bindings = scope.resolve(prefix)
+                    break
+                idx = prefix.rfind(".")
+                prefix = None if idx == -1 else prefix[:idx]
+            yield node, _qualified_names(bindings, full_name)
+
+    @staticmethod
+    def _access_qualified_names(
+        accesses: List[Tuple[_Access, str]]
+    ) -> Set[QualifiedName]:
+        names = set()
+        for access, name in accesses:
+            # Only bindings before the access in the same scope.
+            bindings = access.scope.resolve(name)
+            previous: Sequence[Optional[_Binding]] = [
+                binding
+                for binding in bindings
+                if binding is None
+                or binding.scope is not access.scope
+                or binding.index < access.index
+            ]
+            if not previous and bindings:
+                parent = access.scope.parent
+                if parent is None:
+                    previous = [None] if hasattr(builtins, name) else []
+                else:
+                    previous = parent.resolve(name)
+            names |= _qualified_names(previous, name)
+        return names
+
+
+class _ScopeVisitor(_NameIndex[Union[cst.Call, cst.Attribute]], cst.CSTVisitor):
+    """Collect the names of a libcst module, see `_NameIndex`."""
+
+    _root_name = staticmethod(_root_name)
+    _full_name = staticmethod(get_full_name_for_node)
+    _dotted_names = staticmethod(_dotted_names)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._stores: List[bool] = [False]
+
+    def _visit_target(self, node: cst.CSTNode) -> None:
+        self._stores.append(True)
+        node.visit(self)
+        self._stores.pop()
+
+    def _visit_load(self, node: cst.CSTNode) -> None:
+        self._stores.append(False)
+        node.visit(self)
+        self._stores.pop()
+
+    def on_leave(self, original_node: cst.CSTNode) -> None:
+        if isinstance(original_node, (cst.Call, cst.Attribute)):
+            self.nodes.append((original_node, self.scope))
+        elif isinstance(original_node, _ASSIGNMENT_LIKE_NODES):
+            self.scope.assignment_count += 1
+        super().on_leave(original_node)
+
+    def _visit_import(self, node: Union[cst.Import, cst.ImportFrom]) -> bool:
+        if isinstance(node.names, cst.ImportStar):
+            return False
+        imported = _cst_import(node)
+        is_torch = False
+        if isinstance(node, cst.ImportFrom):
+            module = node.module
+            if not node.relative and module is not None:
+                is_torch = _root_name(module) in TORCH_ROOTS
+        for alias in node.names:
+            if isinstance(node, cst.Import):
+                is_torch = _root_name(alias.name) in TORCH_ROOTS
+            if alias.asname is not None:
+                names = _dotted_names(cst.ensure_type(alias.asname.name, cst.Name))
+            else:
+                names = _dotted_names(alias.name)
+            self._bind_import(imported, (name for name, _ in names), is_torch)
+        return False
+
+    def visit_Import(self, node: cst.Import) -> bool:
+        return self._visit_import(node)
+
+    def visit_ImportFrom(self, node: cst.ImportFrom) -> bool:
+        return self._visit_import(node)
+
+    def visit_Name(self, node: cst.Name) -> bool:
+        if self._stores[-1]:
+            self.scope.bind(node.value)
+        else:
+            self._access(node.value)
+        return False
+
+    def visit_Attribute(self, node: cst.Attribute) -> bool:
+        if self._attributes[-1] is None:
+            self._attributes[-1] = node
+        self._visit_load(node.value)
+        if self._attributes[-1] is node:
+            self._attributes[-1] = None
+        return False
+
+    def visit_Subscript(self, node: cst.Subscript) -> bool:
+        self._stores.append(False)
+        return True
+
+    def leave_Subscript(self, original_node: cst.Subscript) -> None:
+        self._stores.pop()
+
+    def visit_Call(self, node: cst.Call) -> bool:
+        self._attributes.append(None)
+        return True
+
+    def leave_Call(self, original_node: cst.Call) -> None:
+        self._attributes.pop()
+
+    def visit_Arg(self, node: cst.Arg) -> bool:
+        # The keyword is not a name access.
+        node.value.visit(self)
+        return False
+
+    def visit_Assign(self, node: cst.Assign) -> bool:
+        for target in node.targets:
+            self._visit_target(target)
+        node.value.visit(self)
+        return False
+
+    def visit_AnnAssign(self, node: cst.AnnAssign) -> bool:
+        self._visit_target(node.target)
+        node.annotation.visit(self)
+        if node.value is not None:
+            node.value.visit(self)
+        return False
+
+    def visit_AugAssign(self, node: cst.AugAssign) -> bool:
+        self._visit_target(node.target)
+        node.value.visit(self)
+        return False
+
+    def visit_NamedExpr(self, node: cst.NamedExpr) -> bool:
+        self._visit_target(node.target)
+        node.value.visit(self)
+        return False
+
+    def visit_AsName(self, node: cst.AsName) -> bool:
+        self._visit_target(node.name)
+        return False
+
+    def visit_Global(self, node: cst.Global) -> bool:
+        if self.scope.parent is not None:
+            for item in node.names:
+                self.scope.overwrites[item.name.value] = self.scope.globals
+        return False
+
+    def visit_Nonlocal(self, node: cst.Nonlocal) -> bool:
+        parent = self.scope.parent
+        if parent is None:
+            # A syntax error, can't be resolved.
+            self.unsupported = True
+            return False
+        for item in node.names:
+            self.scope.overwrites[item.name.value] = parent
+        return False
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> bool:
+        if node.type_parameters is not None:
+            self.unsupported = True
+        self.scope.bind(node.name.value)
+        parent = self._new_scope(f"{node.name.value}.<locals>")
+        node.params.visit(self)
+        node.body.visit(self)
+        self.scope = parent
+        for decorator in node.decorators:
+            decorator.visit(self)
+        if node.returns is not None:
+            node.returns.visit(self)
+        return False
+
+    def visit_Lambda(self, node: cst.Lambda) -> bool:
+        parent = self._new_scope("<locals>")
+        node.params.visit(self)
+        node.body.visit(self)
+        self.scope = parent
+        return False
+
+    def visit_Param(self, node: cst.Param) -> bool:
+        self.scope.bind(node.name.value)
+        scope = self.scope
+        # Defaults and annotations are evaluated in the enclosing scope.
+        assert scope.parent is not None
+        self.scope = scope.parent
+        for field in [node.default, node.annotation]:
+            if field is not None:
+                self._visit_load(field)
+        self.scope = scope
+        return False
+
+    def visit_ClassDef(self, node: cst.ClassDef) -> bool:
+        if node.type_parameters is not None:
+            self.unsupported = True
+        self.scope.bind(node.name.value)
+        for decorator in node.decorators:
+            decorator.visit(self)
+        for base in node.bases:
+            base.visit(self)
+        for keyword in node.keywords:
+            keyword.visit(self)
+        parent = self._new_scope(node.name.value, is_class=True)
+        for statement in node.body.body:
+            statement.visit(self)
+        self.scope = parent
+        return False
+
+    def visit_TypeAlias(self, node: cst.TypeAlias) -> bool:
+        self.unsupported = True
+        return False
+
+    def _visit_comprehension(
+        self, node: Union[cst.ListComp, cst.SetComp, cst.DictComp, cst.GeneratorExp]
+    ) -> bool:
+        for_in = node.for_in
+        # The first iterable is evaluated in the enclosing scope.
+        for_in.iter.visit(self)
+        parent = self._new_scope("<comprehension>")
+        self._visit_target(for_in.target)
+        self.scope.assignment_count += 1
+        for condition in for_in.ifs:
+            condition.visit(self)
+        if for_in.inner_for_in is not None:
+            for_in.inner_for_in.visit(self)
+        if isinstance(node, cst.DictComp):
+            node.key.visit(self)
+            node.value.visit(self)
+        else:
+            node.elt.visit(self)
+        self.scope = parent
+        return False
+
+    def visit_ListComp(self, node: cst.ListComp) -> bool:
+        return self._visit_comprehension(node)
+
+    def visit_SetComp(self, node: cst.SetComp) -> bool:
+        return self._visit_comprehension(node)
+
+    def visit_DictComp(self, node: cst.DictComp) -> bool:
+        return self._visit_comprehension(node)
+
+    def visit_GeneratorExp(self, node: cst.GeneratorExp) -> bool:
+        return self._visit_comprehension(node)
+
+    def visit_CompFor(self, node: cst.CompFor) -> bool:
+        self._visit_target(node.target)
+        node.iter.visit(self)
+        for condition in node.ifs:
+            condition.visit(self)
+        if node.inner_for_in is not None:
+            node.inner_for_in.visit(self)
+        return False
+
+    def visit_For(self, node: cst.For) -> bool:
+        self._visit_target(node.target)
+        self.scope.assignment_count += 1
+        for child in [node.iter, node.body, node.orelse, node.asynchronous]:
+            if child is not None:
+                child.visit(self)
+        return False
+
+
+# Nodes after which the index of assignments in the current scope is incremented,
+# the `ast` counterparts of `_ASSIGNMENT_LIKE_NODES` that are not handled
+# explicitly by `_AstScopeVisitor`.
+_AST_ASSIGNMENT_LIKE_NODES = (
+    ast.AnnAssign,
+    ast.Assign,
+    ast.AsyncFunctionDef,
+    ast.AugAssign,
+    ast.ClassDef,
+    ast.FunctionDef,
+    ast.Global,
+    ast.Import,
+    ast.ImportFrom,
+    ast.NamedExpr,
+    ast.Nonlocal,
+    ast.withitem,
+)
+
+
+class _AstScopeVisitor(_NameIndex[Union[ast.Call, ast.Attribute]], ast.NodeVisitor):
+    """
+    Collect the names of an `ast` module, see `_NameIndex`.
+    Nodes are visited in the same order as the corresponding libcst nodes
+    by `_ScopeVisitor`, and `ast` expression contexts tell which names are bound.
+    """
+
+    _root_name = staticmethod(_ast_root_name)
+    _full_name = staticmethod(_ast_full_name)
+    _dotted_names = staticmethod(_ast_dotted_names)
+
+    def visit(self, node: ast.AST) -> None:
+        getattr(self, f"visit_{node.__class__.__name__}", self.generic_visit)(node)
+        if isinstance(node, (ast.Call, ast.Attribute)):
+            self.nodes.append((node, self.scope))
+        elif isinstance(node, _AST_ASSIGNMENT_LIKE_NODES):
+            self.scope.assignment_count += 1
+
+    def _visit_all(self, nodes: Sequence[Optional[ast.AST]]) -> None:
+        for node in nodes:
+            if node is not None:
+                self.visit(node)
+
+    def _visit_import(self, node: Union[ast.Import, ast.ImportFrom]) -> None:
+        if node.names[0].name == "*":
+            return
+        module = ""
+        is_torch = False
+        if isinstance(node, ast.ImportFrom):
+            module = "." * node.level + (node.module or "")
+            if not node.level and node.module is not None:
+                is_torch = node.module.split(".", 1)[0] in TORCH_ROOTS
+        imported = _Import(
+            module, tuple((alias.name, alias.asname) for alias in node.names)
+        )
+        for alias in node.names:
+            if isinstance(node, ast.Import):
+                is_torch = alias.name.split(".", 1)[0] in TORCH_ROOTS
+            if alias.asname is not None:
+                names = [alias.asname]
+            else:
+                # All prefixes of the dotted name, longest first.
+                parts = alias.name.split(".")
+                names = [".".join(parts[:i]) for i in range(len(parts), 0, -1)]
+            self._bind_import(imported, iter(names), is_torch)
+
+    def visit_Import(self, node: ast.Import) -> None:
+        self._visit_import(node)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        self._visit_import(node)
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if isinstance(node.ctx, ast.Store):
+            self.scope.bind(node.id)
+        elif isinstance(node.ctx, ast.Load):
+            self._access(node.id)
+
+    def visit_Constant(self, node: ast.Constant) -> None:
+        name = _ast_name(node)
+        if name is not None:
+            self._access(name)
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        if self._attributes[-1] is None:
+            self._attributes[-1] = node
+        self.visit(node.value)
+        if self._attributes[-1] is node:
+            self._attributes[-1] = None
+
+    def visit_Call(self, node: ast.Call) -> None:
+        self._attributes.append(None)
+        self.visit(node.func)
+        arguments: List[ast.AST] = [*node.args, *node.keywords]
+        if node.args and node.keywords:
+            # Starred arguments can follow keyword arguments.
+            arguments.sort(key=lambda arg: (arg.lineno, arg.col_offset))
+        self._visit_all(arguments)
+        self._attributes.pop()
+
+    def visit_Dict(self, node: ast.Dict) -> None:
+        for key, value in zip(node.keys, node.values):
+            self._visit_all([key, value])
+
+    def visit_IfExp(self, node: ast.IfExp) -> None:
+        self._visit_all([node.body, node.test, node.orelse])
+
+    def visit_withitem(self, node: ast.withitem) -> None:
+        self.visit(node.context_expr)
+        if node.optional_vars is not None:
+            self.visit(node.optional_vars)
+            # Counted as `AsName` by libcst.
+            self.scope.assignment_count += 1
+
+    def visit_ExceptHandler(self, node: ast.ExceptHandler) -> None:
+        self._visit_all([node.type])
+        if node.name is not None:
+            self.scope.bind(node.name)
+            self.scope.assignment_count += 1
+        self._visit_all(node.body)
+
+    def visit_Global(self, node: ast.Global) -> None:
+        if self.scope.parent is not None:
+            for name in node.names:
+                self.scope.overwrites[name] = self.scope.globals
+
+    def visit_Nonlocal(self, node: ast.Nonlocal) -> None:
+        parent = self.scope.parent
+        if parent is None:
+            self.unsupported = True
+            return
+        for name in node.names:
+            self.scope.overwrites[name] = parent
+
+    def _visit_arguments(self, node: ast.arguments) -> None:
+        positional = [*node.posonlyargs, *node.args]
+        defaults: List[Optional[ast.expr]] = [None] * len(positional)
+        if node.defaults:
+            defaults[-len(node.defaults) :] = node.defaults
+        params = list(zip(positional, defaults))
+        if node.vararg is not None:
+            params.append((node.vararg, None))
+        params += zip(node.kwonlyargs, node.kw_defaults)
+        if node.kwarg is not None:
+            params.append((node.kwarg, None))
+        for param, default in params:
+            self.scope.bind(param.arg)
+            scope = self.scope
+            # Defaults and annotations are evaluated in the enclosing scope.
+            assert scope.parent is not None
+            self.scope = scope.parent
+            self._visit_all([default, param.annotation])
+            self.scope = scope
+        # Counted as `Parameters` by libcst.
+        self.scope.assignment_count += 1
+
+    def _visit_function(self, node: Union[ast.FunctionDef, ast.AsyncFunctionDef]):
+        if getattr(node, "type_params", None):
+            self.unsupported = True
+        self.scope.bind(node.name)
+        parent = self._new_scope(f"{node.name}.<locals>")
+        self._visit_arguments(node.args)
+        self._visit_all(node.body)
+        self.scope = parent
+        self._visit_all([*node.decorator_list, node.returns])
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        self._visit_function(node)
+
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> None:
+        self._visit_function(node)
+
+    def visit_Lambda(self, node: ast.Lambda) -> None:
+        parent = self._new_scope("<locals>")
+        self._visit_arguments(node.args)
+        self.visit(node.body)
+        self.scope = parent
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        if getattr(node, "type_params", None):
+            self.unsupported = True
+        self.scope.bind(node.name)
+        self._visit_all([*node.decorator_list, *node.bases, *node.keywords])
+        parent = self._new_scope(node.name, is_class=True)
+        self._visit_all(node.body)
+        self.scope = parent
+
+    def visit_TypeAlias(self, node: ast.AST) -> None:
+        self.unsupported = True
+
+    def _visit_comprehension(
+        self,
+        node: Union[ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp],
+        elements: Sequence[ast.expr],
+    ) -> None:
+        first, *rest = node.generators
+        # The first iterable is evaluated in the enclosing scope.
+        self.visit(first.iter)
+        parent = self._new_scope("<comprehension>")
+        self.visit(first.target)
+        self.scope.assignment_count += 1
+        self._visit_all(first.ifs)
+        self._visit_generators(rest)
+        self._visit_all(elements)
+        self.scope = parent
+
+    def _visit_generators(self, generators: Sequence[ast.comprehension]) -> None:
+        # Nested like `CompFor` nodes of libcst.
+        if generators:
+            generator, *rest = generators
+            self._visit_all([generator.target, generator.iter, *generator.ifs])
+            self._visit_generators(rest)
+            self.scope.assignment_count += 1
+
+    def visit_ListComp(self, node: ast.ListComp) -> None:
+        self._visit_comprehension(node, [node.elt])
+
+    def visit_SetComp(self, node: ast.SetComp) -> None:
+        self._visit_comprehension(node, [node.elt])
+
+    def visit_DictComp(self, node: ast.DictComp) -> None:
+        self._visit_comprehension(node, [node.key, node.value])
+
+    def visit_GeneratorExp(self, node: ast.GeneratorExp) -> None:
+        self._visit_comprehension(node, [node.elt])
+
+    def _visit_for(self, node: Union[ast.For, ast.AsyncFor]) -> None:
+        self.visit(node.target)
+        self.scope.assignment_count += 1
+        self._visit_all([node.iter, *node.body, *node.orelse])
+
+    def visit_For(self, node: ast.For) -> None:
+        self._visit_for(node)
+
+    def visit_AsyncFor(self, node: ast.AsyncFor) -> None:
+        self._visit_for(node)
+
+
+class AstQualifiedNames:
+    """
+    Qualified names of calls and attributes of a stdlib `ast` module,
+    the same as given by `TorchQualifiedNameProvider` for the corresponding
+    libcst nodes, or by `QualifiedNameProvider` with `all_roots`.
+    Not `supported` for modules using constructs needing the full analysis.
+    """
+
+    def __init__(self, module: ast.Module) -> None:
+        self._visitor = _AstScopeVisitor()
+        self._visitor.visit(module)
+        self.supported = not self._visitor.unsupported
+        self._names: Dict[bool, Mapping[ast.AST, Set[QualifiedName]]] = {}
+
+    def get(self, node: ast.AST, all_roots: bool = False) -> Set[QualifiedName]:
+        assert self.supported
+        if all_roots not in self._names:
+            self._names[all_roots] = dict(self._visitor.qualified_names(all_roots))
+        return self._names[all_roots].get(node, set())
+
+
+class _FullQualifiedNames(cst.MetadataDependent):
+    """Access to `QualifiedNameProvider` values, which libcst may compute lazily."""
+
+    METADATA_DEPENDENCIES = (QualifiedNameProvider,)
+
+
+class TorchQualifiedNameProvider(BatchableMetadataProvider[Collection[QualifiedName]]):
+    """
+    Qualified names of calls and attributes rooted at names imported from
+    `torch`, `torchvision` or `functorch`, e.g. `torch.nn.functional.relu`
+    for `F.relu(x)` after `import torch.nn.functional as F`.
+
+    The names are the same as given by `QualifiedNameProvider`,
+    including those of local bindings shadowing the imports, but only imports
+    and other bindings are indexed, without the full scope analysis.
+    Other nodes have no metadata.
+    """
+
+    def visit_Module(self, node: cst.Module) -> None:
+        visitor = _ScopeVisitor()
+        node.visit(visitor)
+        if visitor.unsupported:
+            # Fall back to the full analysis, on the same nodes.
+            wrapper = cst.MetadataWrapper(node, unsafe_skip_copy=True)
+            resolver = _FullQualifiedNames()
+            names = visitor.torch_names | TORCH_ROOTS
+            with resolver.resolve(wrapper):
+                for name_node, _ in visitor.nodes:
+                    if _root_name(name_node) in names:
+                        value = resolver.get_metadata(
+                            QualifiedNameProvider, name_node, set()
+                        )
+                        self.set_metadata(name_node, set(value))
+            return
+        for name_node, qualified_names in visitor.qualified_names():
+            self.set_metadata(name_node, qualified_names)
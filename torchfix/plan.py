@@ -0,0 +1,275 @@
+import argparse
+import bisect
+import difflib
+import hashlib
+import json
+import re
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+PLAN_VERSION = 1
+
+# Kinds of edits in a plan:
+# a fix for a single violation, imports needed by fixes,
+# and the whole file when fixes can't be split into separate edits.
+EDIT_FIX = "fix"
+EDIT_IMPORTS = "imports"
+EDIT_FILE = "file"
+
+_LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+
+class Offsets:
+    """Convert (line, column) positions in `code` to byte offsets in its encoding."""
+
+    def __init__(self, code: str, encoding: str) -> None:
+        self.code = code
+        self.encoding = encoding
+        self.line_starts = [0] + [m.end() for m in _LINE_BREAK.finditer(code)]
+        self.byte_starts = []
+        byte_offset = 0
+        previous = 0
+        for start in self.line_starts:
+            byte_offset += len(code[previous:start].encode(encoding))
+            self.byte_starts.append(byte_offset)
+            previous = start
+
+    def byte_offset(self, line: int, column: int) -> int:
+        """Byte offset of a 1-based `line` and 0-based `column` in characters."""
+        start = self.line_starts[line - 1]
+        return self.byte_starts[line - 1] + len(
+            self.code[start : start + column].encode(self.encoding)
+        )
+
+    def line(self, byte_offset: int) -> int:
+        """The 1-based line of a byte offset."""
+        return bisect.bisect_right(self.byte_starts, byte_offset)
+
+
+def _line_edits(
+    old_code: str, new_code: str, offsets: Offsets
+) -> List[Tuple[int, int, str]]:
+    """Byte-range edits of whole lines turning `old_code` into `new_code`."""
+    old_lines = old_code.splitlines(keepends=True)
+    new_lines = new_code.splitlines(keepends=True)
+    line_offsets = [0]
+    for line in old_lines:
+        line_offsets.append(line_offsets[-1] + len(line.encode(offsets.encoding)))
+    edits = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag != "equal":
+            text = "".join(new_lines[new_start:new_end])
+            edits.append((line_offsets[old_start], line_offsets[old_end], text))
+    return edits
+
+
+def _edits_after_fixes(
+    data: bytes, fix_edits: List[Dict[str, Any]], new_code: str, encoding: str
+) -> Optional[List[Tuple[int, int, str]]]:
+    """
+    Line edits turning `data` with `fix_edits` applied into `new_code`,
+    in the byte offsets of `data`. None if the fixes overlap each other
+    or the lines of the edits.
+    """
+    try:
+        fixed = splice(data, fix_edits, encoding).decode(encoding)
+    except ValueError:
+        return None
+    # Fix edits as (start, end) in the fixed code, with the size change
+    # of the code up to their end.
+    fixed_ranges = []
+    growth = 0
+    for edit in sorted(fix_edits, key=lambda edit: edit["start"]):
+        start = edit["start"] + growth
+        growth += len(edit["text"].encode(encoding)) - (edit["end"] - edit["start"])
+        fixed_ranges.append((start, edit["end"] + growth, growth))
+    edits = []
+    for start, end, text in _line_edits(fixed, new_code, Offsets(fixed, encoding)):
+        growth = 0
+        for fix_start, fix_end, fix_growth in fixed_ranges:
+            if fix_end <= start and fix_start < start:
+                growth = fix_growth
+            elif fix_start < end or fix_start == start:
+                return None
+        edits.append((start - growth, end - growth, text))
+    return edits
+
+
+def splice(data: bytes, edits: Iterable[Dict[str, Any]], encoding: str) -> bytes:
+    """Apply non-overlapping byte-range `edits` to `data`."""
+    chunks = []
+    position = 0
+    for edit in sorted(edits, key=lambda edit: (edit["start"], edit["end"])):
+        if edit["start"] < position:
+            raise ValueError(f"Overlapping edit at byte {edit['start']}")
+        chunks += [data[position : edit["start"]], edit["text"].encode(encoding)]
+        position = edit["end"]
+    chunks.append(data[position:])
+    return b"".join(chunks)
+
+
+def make_file_plan(
+    filename: str,
+    code: str,
+    encoding: str,
+    fixes: Sequence[Tuple[str, int, int, int, int, str]],
+    imports_code: Optional[str],
+    import_codes: Sequence[str],
+    new_code: str,
+) -> Dict[str, Any]:
+    """
+    Make the plan for fixing `filename` with the original `code`,
+    from `fixes` of `(error_code, line, column, end_line, end_column, text)`,
+    where the positions are those of the replaced node, including whitespace.
+    Fixes of the same node are merged into one edit.
+
+    `imports_code` is `code` with only the imports needed by the fixes added,
+    and `import_codes` are the error codes of the fixes needing them.
+    If the separate edits don't reproduce `new_code`, the result of applying
+    all fixes, e.g. because they overlap, a single edit of the whole file is used.
+    """
+    data = code.encode(encoding)
+    offsets = Offsets(code, encoding)
+    # Violations of the same node (e.g. several names of a deprecated import)
+    # have a single edit, with the last replacement as when fixing.
+    edits_by_range: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    for error_code, line, column, end_line, end_column, text in fixes:
+        start = offsets.byte_offset(line, column)
+        end = offsets.byte_offset(end_line, end_column)
+        edit = edits_by_range.get((start, end))
+        error_codes = sorted({error_code, *(edit["error_codes"] if edit else [])})
+        edits_by_range[start, end] = {
+            "kind": EDIT_FIX,
+            "error_codes": error_codes,
+            "start": start,
+            "end": end,
+            "text": text,
+        }
+    fix_edits = list(edits_by_range.values())
+    # Imports can also be satisfied by fixed import statements,
+    # so only the import edits still needed after the fixes are used.
+    import_edits: Optional[List[Tuple[int, int, str]]] = []
+    if imports_code is not None and imports_code != code:
+        import_edits = _edits_after_fixes(data, fix_edits, new_code, encoding)
+        candidates = set(_line_edits(code, imports_code, offsets))
+        if import_edits is not None and not candidates.issuperset(import_edits):
+            import_edits = None
+    edits = fix_edits + [
+        {
+            "kind": EDIT_IMPORTS,
+            "error_codes": sorted(set(import_codes)),
+            "start": start,
+            "end": end,
+            "text": text,
+        }
+        for start, end, text in import_edits or []
+    ]
+    try:
+        separable = (
+            import_edits is not None
+            and splice(data, edits, encoding) == new_code.encode(encoding)
+        )
+    except ValueError:
+        separable = False
+    if not separable:
+        edits = [
+            {
+                "kind": EDIT_FILE,
+                "error_codes": sorted({fix[0] for fix in fixes}),
+                "start": 0,
+                "end": len(data),
+                "text": new_code,
+            }
+        ]
+    return {
+        "path": filename,
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "encoding": encoding,
+        "edits": sorted(edits, key=lambda edit: (edit["start"], edit["end"])),
+    }
+
+
+def write_plan(path: str, file_plans: Iterable[Dict[str, Any]], version: str) -> None:
+    plan = {
+        "version": PLAN_VERSION,
+        "torchfix": version,
+        "files": sorted(file_plans, key=lambda file_plan: file_plan["path"]),
+    }
+    with open(path, "w") as f:
+        json.dump(plan, f, indent=1)
+        f.write("\n")
+
+
+def _selected(edit: Dict[str, Any], only: Optional[Sequence[str]]) -> bool:
+    def is_selected(code: str) -> bool:
+        return only is None or any(code.startswith(prefix) for prefix in only)
+
+    if edit["kind"] == EDIT_FILE:
+        # Can't be split, so only applied if all its fixes are selected.
+        return all(is_selected(code) for code in edit["error_codes"])
+    return any(is_selected(code) for code in edit["error_codes"])
+
+
+def apply_file_plan(
+    file_plan: Dict[str, Any], only: Optional[Sequence[str]] = None
+) -> Tuple[int, Optional[str]]:
+    """
+    Apply the edits of `file_plan` with fixes for `only` the given error codes
+    or prefixes (all if None) and return the number of applied edits,
+    and the reason if the file was not changed.
+    """
+    path = file_plan["path"]
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return 0, f"can't be read: {e.strerror}"
+    if hashlib.sha256(data).hexdigest() != file_plan["sha256"]:
+        return 0, "changed since the plan was made"
+
+    edits = [edit for edit in file_plan["edits"] if _selected(edit, only)]
+    has_fixes = any(edit["kind"] != EDIT_IMPORTS for edit in edits)
+    if not has_fixes:
+        if any(edit["kind"] == EDIT_FILE for edit in file_plan["edits"]):
+            return 0, "fixes for other rules can't be separated"
+        return 0, None
+    with open(path, "wb") as f:
+        f.write(splice(data, edits, file_plan["encoding"]))
+    return len(edits), None
+
+
+def apply_main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="torchfix apply",
+        description="Apply fixes from a plan made with `torchfix --emit-plan`. "
+        "Files changed after the plan was made are not modified.",
+    )
+    parser.add_argument("plan", help="Plan JSON file.")
+    parser.add_argument(
+        "--only",
+        help="Comma-separated list of rules or rule prefixes to apply fixes for, "
+        "e.g. TOR101 or TOR1. Defaults to all fixes in the plan.",
+        type=str,
+        default=None,
+    )
+    args = parser.parse_args(argv)
+    only = [code.strip() for code in args.only.split(",")] if args.only else None
+
+    with open(args.plan) as f:
+        plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION:
+        parser.error(f"unsupported plan version: {plan.get('version')}")
+
+    applied_edits = applied_files = refused = 0
+    for file_plan in plan["files"]:
+        count, reason = apply_file_plan(file_plan, only)
+        if reason is not None:
+            print(f"Skipped {file_plan['path']}: {reason}", file=sys.stderr)
+            refused += 1
+        elif count:
+            applied_edits += count
+            applied_files += 1
+    print(f"Applied {applied_edits} edits to {applied_files} files.", file=sys.stderr)
+    if refused:
+        sys.exit(1)
@@ -0,0 +1,44 @@
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
+
+# Files that don't have "torch" string in them are skipped.
+# This avoids expensive parsing.
+MARKER = b"torch"  # this will catch import torch or functorch
+
+# Files at least this large are searched through mmap instead of being read.
+MMAP_THRESHOLD = 1024 * 1024
+
+
+def has_marker(filename: str, marker: bytes = MARKER) -> bool:
+    try:
+        with open(filename, "rb") as f:
+            if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    return m.find(marker) != -1
+            return f.read().find(marker) != -1
+    except OSError:
+        # Let the file through, so that the error is reported when processing it.
+        return True
+
+
+def filter_files(
+    files: Iterable[str], marker: bytes = MARKER, threads: Optional[int] = None
+) -> Iterator[str]:
+    """
+    Yield files containing `marker`, in the input order.
+
+    Files are scanned concurrently in a thread pool, and matches are yielded
+    as soon as they are found, so that the consumer can start processing
+    them while the rest of the files is still being scanned.
+    """
+    executor = ThreadPoolExecutor(max_workers=threads)
+    try:
+        futures = [(f, executor.submit(has_marker, f, marker)) for f in files]
+        for filename, future in futures:
+            if future.result():
+                yield filename
+    finally:
+        # Don't wait for the remaining scans if the consumer stopped early.
+        executor.shutdown(wait=False, cancel_futures=True)
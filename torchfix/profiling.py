@@ -0,0 +1,156 @@
+import contextlib
+import functools
+import inspect
+import json
+import sys
+import time
+import types
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, TextIO
+
+from .common import TorchVisitor
+from .report import display_path
+
+
+class FileProfile:
+    """
+    Time spent in each phase of processing a single file,
+    and in each `TorchVisitor` callback by node type.
+    """
+
+    def __init__(self) -> None:
+        self.phases: Dict[str, float] = {}
+        # Visitor class name -> node type -> [calls, seconds].
+        self.visitors: Dict[str, Dict[str, List[float]]] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started_at
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def instrument(self, visitor: TorchVisitor) -> None:
+        """
+        Time the `visit_*` and `leave_*` callbacks of `visitor`.
+
+        The timed callbacks are set as bound methods on the instance,
+        which take precedence when libcst collects the callbacks in `visit_batched`.
+        """
+        stats = self.visitors.setdefault(type(visitor).__name__, {})
+        for name in dir(visitor):
+            if not name.startswith(("visit_", "leave_")):
+                continue
+            callback = getattr(visitor, name)
+            # Skip the empty stubs, libcst doesn't call them.
+            if not inspect.ismethod(callback) or getattr(callback, "_is_no_op", False):
+                continue
+            node_type = name.split("_", 1)[1]
+            counters = stats.setdefault(node_type, [0, 0.0])
+            setattr(
+                visitor, name, types.MethodType(_timed(callback, counters), visitor)
+            )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"phases": self.phases, "visitors": self.visitors}
+
+
+def _timed(callback: Callable, counters: List[float]) -> Callable:
+    @functools.wraps(callback)
+    def wrapper(self, *args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return callback(*args, **kwargs)
+        finally:
+            counters[0] += 1
+            counters[1] += time.perf_counter() - started_at
+
+    return wrapper
+
+
+def phase_timer(profile: Optional[FileProfile]) -> Callable[[str], ContextManager]:
+    """Return `profile.phase`, or a no-op replacement if not profiling."""
+    if profile is not None:
+        return profile.phase
+    return lambda name: contextlib.nullcontext()
+
+
+class ProfileReport:
+    """Aggregate of `FileProfile` dicts, e.g. from multiple worker processes."""
+
+    def __init__(self) -> None:
+        self.phases: Dict[str, float] = {}
+        # File name -> phase -> seconds.
+        self.files: Dict[str, Dict[str, float]] = {}
+        self.visitors: Dict[str, Dict[str, List[float]]] = {}
+
+    def add(self, filename: str, profile: Dict[str, Any]) -> None:
+        for phase, seconds in profile["phases"].items():
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self.files[filename] = dict(profile["phases"])
+        for visitor, node_types in profile["visitors"].items():
+            stats = self.visitors.setdefault(visitor, {})
+            for node_type, (calls, seconds) in node_types.items():
+                if not calls:
+                    continue
+                counters = stats.setdefault(node_type, [0, 0.0])
+                counters[0] += calls
+                counters[1] += seconds
+
+    def _visitor_totals(self) -> Dict[str, List[float]]:
+        return {
+            visitor: [
+                sum(calls for calls, _ in node_types.values()),
+                sum(seconds for _, seconds in node_types.values()),
+            ]
+            for visitor, node_types in self.visitors.items()
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "phases": self.phases,
+            "files": self.files,
+            "visitors": {
+                visitor: {
+                    node_type: {"calls": int(calls), "seconds": seconds}
+                    for node_type, (calls, seconds) in node_types.items()
+                }
+                for visitor, node_types in self.visitors.items()
+            },
+        }
+
+    def dump(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+            f.write("\n")
+
+    def print(self, file: TextIO = sys.stderr, top: int = 10) -> None:
+        """Print totals sorted by time, limiting files and node types to `top`."""
+
+        def by_seconds(item):
+            return -item[1] if isinstance(item[1], float) else -item[1][1]
+
+        total = sum(self.phases.values()) or 1.0
+        print("Phases:", file=file)
+        for phase, seconds in sorted(self.phases.items(), key=by_seconds):
+            print(f"  {phase:<50} {seconds:10.3f}s {seconds / total:7.1%}", file=file)
+
+        print(f"Slowest files (top {top}):", file=file)
+        file_totals = {
+            filename: sum(phases.values()) for filename, phases in self.files.items()
+        }
+        for filename, seconds in sorted(file_totals.items(), key=by_seconds)[:top]:
+            print(f"  {seconds:10.3f}s  {display_path(filename)}", file=file)
+
+        print("Visitor callbacks:", file=file)
+        for visitor, (calls, seconds) in sorted(
+            self._visitor_totals().items(), key=by_seconds
+        ):
+            print(f"  {visitor:<50} {seconds:10.3f}s {int(calls):10} calls", file=file)
+            node_types = sorted(self.visitors[visitor].items(), key=by_seconds)
+            for node_type, (calls, seconds) in node_types[:top]:
+                print(
+                    f"    {node_type:<48} {seconds:10.3f}s {int(calls):10} calls",
+                    file=file,
+                )
@@ -0,0 +1,165 @@
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterable, Sequence, TextIO, Tuple
+
+# This module must not import libcst or other heavy dependencies,
+# as it's used by the thin daemon client.
+
+IS_TTY = hasattr(sys.stdout, "isatty") and sys.stdout.isatty()
+CYAN = "\033[96m" if IS_TTY else ""
+RED = "\033[31m" if IS_TTY else ""
+BOLD = "\033[1m" if IS_TTY else ""
+ENDC = "\033[0m" if IS_TTY else ""
+
+
+def format_codemod_result(record: Dict[str, Any]) -> str:
+    """Format a violation record (see `LintViolation.to_record`) for the terminal."""
+    fixable = f" [{CYAN}*{ENDC}]" if record["fixable"] else ""
+    colon = f"{CYAN}:{ENDC}"
+    position = f"{colon}{record['line']}{colon}{1 + record['column']}{colon}"
+    error_code = f"{RED}{BOLD}{record['error_code']}{ENDC}"
+    return f"{position} {error_code}{fixable} {record['message']}"
+
+
+def display_path(filename: str) -> Path:
+    try:
+        return Path(filename).relative_to(Path.cwd())
+    except ValueError:
+        # Not a subpath of a current dir, use absolute path
+        return Path(filename)
+
+
+def print_summary(
+    successes: int,
+    skips: int,
+    failures: int,
+    fix: bool,
+    over_limit: Sequence[Tuple[str, str]] = (),
+) -> None:
+    """
+    :param over_limit: file names and reasons of files skipped
+        over the size or time limits, or as generated.
+    """
+    total = successes + skips + failures + len(over_limit)
+    print(f"Finished checking {total} files.", file=sys.stderr)
+    if over_limit:
+        print(
+            f"Skipped {len(over_limit)} files over the size or time limits "
+            "or generated:",
+            file=sys.stderr,
+        )
+        for filename, reason in over_limit:
+            print(f"  {display_path(filename)}: {reason}", file=sys.stderr)
+
+    if successes > 0:
+        if fix:
+            print(f"Transformed {successes} files successfully.", file=sys.stderr)
+        else:
+            print(
+                f"[{CYAN}*{ENDC}] {successes} "
+                "potentially fixable with the --fix option",
+                file=sys.stderr,
+            )
+
+
+class JsonLinesReporter:
+    """Write each violation record as a JSON object on its own line."""
+
+    def __init__(self, stream: TextIO = sys.stdout) -> None:
+        self.stream = stream
+
+    def report(self, filename: str, record: Dict[str, Any]) -> None:
+        path = display_path(filename).as_posix()
+        self.stream.write(json.dumps({"path": path, **record}) + "\n")
+        self.stream.flush()
+
+    def close(self) -> None:
+        pass
+
+
+class SarifReporter:
+    """
+    Write violation records as a SARIF 2.1.0 log.
+
+    The log is streamed: the header is written on creation,
+    each result as soon as it's reported, and the footer on `close`.
+    """
+
+    SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+
+    def __init__(
+        self,
+        version: str,
+        rules: Iterable[Tuple[str, str]],
+        stream: TextIO = sys.stdout,
+    ) -> None:
+        """
+        :param rules: pairs of error codes and message templates.
+        """
+        self.stream = stream
+        self.results_count = 0
+        driver = {
+            "name": "TorchFix",
+            "version": version,
+            "informationUri": "https://github.com/pytorch-labs/torchfix",
+            "rules": [
+                {"id": code, "shortDescription": {"text": template}}
+                for code, template in rules
+            ],
+        }
+        # The log and its run without their closing braces,
+        # leaving the results array open for streaming.
+        log = json.dumps({"version": "2.1.0", "$schema": self.SCHEMA})
+        run = json.dumps({"tool": {"driver": driver}})
+        self.stream.write(f'{log[:-1]}, "runs": [{run[:-1]}, "results": [')
+        self.stream.flush()
+
+    def report(self, filename: str, record: Dict[str, Any]) -> None:
+        artifact = {"uri": display_path(filename).as_posix()}
+        result: Dict[str, Any] = {
+            "ruleId": record["error_code"],
+            "level": "warning",
+            "message": {"text": record["message"]},
+            "locations": [
+                {
+                    "physicalLocation": {
+                        "artifactLocation": artifact,
+                        "region": {
+                            "startLine": record["line"],
+                            "startColumn": 1 + record["column"],
+                        },
+                    }
+                }
+            ],
+        }
+        if record.get("replacement") is not None:
+            deleted_region = {
+                "startLine": record["line"],
+                "startColumn": 1 + record["column"],
+                "endLine": record["end_line"],
+                "endColumn": 1 + record["end_column"],
+            }
+            result["fixes"] = [
+                {
+                    "artifactChanges": [
+                        {
+                            "artifactLocation": artifact,
+                            "replacements": [
+                                {
+                                    "deletedRegion": deleted_region,
+                                    "insertedContent": {"text": record["replacement"]},
+                                }
+                            ],
+                        }
+                    ]
+                }
+            ]
+        separator = "," if self.results_count else ""
+        self.stream.write(separator + json.dumps(result))
+        self.stream.flush()
+        self.results_count += 1
+
+    def close(self) -> None:
+        self.stream.write("]}]}\n")
+        self.stream.flush()
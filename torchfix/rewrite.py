@@ -0,0 +1,259 @@
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import libcst as cst
+import libcst.codemod as codemod
+from libcst.codemod.visitors import ImportItem
+from libcst.metadata import CodeRange
+
+from .common import deep_multi_replace
+from .plan import Offsets, splice
+
+_Statement = Union[cst.SimpleStatementLine, cst.BaseCompoundStatement]
+
+
+class _ChildReplacer(cst.CSTTransformer):
+    """Replace direct children of `parent`, without visiting deeper."""
+
+    def __init__(
+        self, parent: cst.CSTNode, replacements: Mapping[int, cst.CSTNode]
+    ) -> None:
+        super().__init__()
+        self.parent = parent
+        self.replacements = replacements
+
+    def on_visit(self, node: cst.CSTNode) -> bool:
+        return node is self.parent
+
+    def on_leave(self, original_node, updated_node):
+        return self.replacements.get(id(original_node), updated_node)
+
+
+def _contains(outer: CodeRange, inner: CodeRange) -> bool:
+    return (outer.start.line, outer.start.column) <= (
+        inner.start.line,
+        inner.start.column,
+    ) and (inner.end.line, inner.end.column) <= (outer.end.line, outer.end.column)
+
+
+def _ancestors(
+    module: cst.Module,
+    positions: Mapping[cst.CSTNode, CodeRange],
+    node: cst.CSTNode,
+) -> Optional[List[cst.CSTNode]]:
+    """
+    The ancestors of `node` from `module` down to its parent, found by descending
+    into the child containing the node at each level. None if it's not found.
+    """
+    target = positions.get(node)
+    if target is None or target.start == target.end:
+        # An empty node could be in any of several empty siblings.
+        return None
+    path: List[cst.CSTNode] = []
+    current: cst.CSTNode = module
+    while current is not node:
+        path.append(current)
+        for child in current.children:
+            child_range = positions.get(child)
+            if child is node or (
+                child_range is not None and _contains(child_range, target)
+            ):
+                current = child
+                break
+        else:
+            return None
+    return path
+
+
+def replace_nodes(
+    module: cst.Module,
+    positions: Mapping[cst.CSTNode, CodeRange],
+    replacements: Sequence[Tuple[cst.CSTNode, cst.CSTNode]],
+) -> cst.Module:
+    """
+    Replace nodes of `module`, with the same result as `deep_multi_replace`:
+    the last replacement of a node is used, and replacements of nodes inside
+    replaced nodes are ignored.
+
+    Only the ancestors of the replaced nodes are rebuilt, they are found with
+    `positions` (from `WhitespaceInclusivePositionProvider`) for `module`.
+    """
+    replacement_map = {id(node): replacement for node, replacement in replacements}
+    paths: Dict[int, List[cst.CSTNode]] = {}
+    for node, _ in replacements:
+        path = _ancestors(module, positions, node)
+        if path is None:
+            return deep_multi_replace(module, replacement_map)
+        paths[id(node)] = path
+    replaced = set(replacement_map)
+    # Ancestors to rebuild, by depth.
+    parents: Dict[int, Tuple[int, cst.CSTNode]] = {}
+    for node_id, path in paths.items():
+        if any(id(ancestor) in replaced for ancestor in path):
+            # Replaced as part of an ancestor.
+            del replacement_map[node_id]
+            continue
+        for depth, ancestor in enumerate(path):
+            parents[id(ancestor)] = (depth, ancestor)
+
+    # Deepest first, so children are updated before their parents.
+    for _, parent in sorted(parents.values(), key=lambda item: -item[0]):
+        new_parent = parent.visit(_ChildReplacer(parent, replacement_map))
+        assert isinstance(new_parent, cst.CSTNode)
+        replacement_map[id(parent)] = new_parent
+    return cst.ensure_type(replacement_map.get(id(module), module), cst.Module)
+
+
+def add_imports(
+    context: codemod.CodemodContext,
+    module: cst.Module,
+    needed_imports: Sequence[ImportItem],
+) -> cst.Module:
+    """
+    Same as applying `AddImportsVisitor`, which only looks at the imports
+    at the top of the module, but only visiting these statements.
+    """
+    if not needed_imports:
+        return module
+    head, rest = _split_head(module)
+    new_head = _head_module(module, head, rest).visit(
+        codemod.visitors.AddImportsVisitor(context, needed_imports)
+    )
+    new_body = list(new_head.body)
+    if rest:
+        placeholder = new_body.pop()
+        first = rest[0]
+        if placeholder.leading_lines is not first.leading_lines:
+            first = first.with_changes(leading_lines=placeholder.leading_lines)
+        new_body += [first, *rest[1:]]
+    return module.with_changes(body=new_body)
+
+
+def _split_head(module: cst.Module) -> Tuple[List[_Statement], Sequence[_Statement]]:
+    """The statements at the top of `module` where imports are added, and the rest."""
+    body = module.body
+    # The first statement can be a docstring, the imports are after it.
+    end = 1 if body and isinstance(body[0], cst.SimpleStatementLine) else 0
+    while end < len(body) and _is_import_line(body[end]):
+        end += 1
+    return list(body[:end]), body[end:]
+
+
+def _head_module(
+    module: cst.Module,
+    head: List[_Statement],
+    rest: Sequence[_Statement],
+) -> cst.Module:
+    if not rest:
+        return module.with_changes(body=head)
+    # Imports are inserted before the first statement after the imports,
+    # possibly with an empty line. A placeholder avoids visiting it.
+    placeholder = cst.SimpleStatementLine(
+        body=[cst.Pass()], leading_lines=rest[0].leading_lines
+    )
+    return module.with_changes(
+        body=[*head, placeholder], footer=(), has_trailing_newline=True
+    )
+
+
+class OverlappingEdits(Exception):
+    """Edits of the code which can't be applied together."""
+
+
+def splice_fixes(
+    context: codemod.CodemodContext,
+    module: cst.Module,
+    source: bytes,
+    positions: Mapping[cst.CSTNode, CodeRange],
+    replacements: Sequence[Tuple[cst.CSTNode, cst.CSTNode]],
+    needed_imports: Sequence[ImportItem],
+) -> bytes:
+    """
+    The code of `module` with the same changes as `replace_nodes` and `add_imports`,
+    made by splicing the code of the replacements into `source`, the code of
+    `module`, instead of generating the code of the whole module.
+    Only the statements at the top of the module are generated for the imports.
+
+    Raises `OverlappingEdits` if the replaced nodes overlap without one containing
+    the other, or it's ambiguous which one contains the other.
+    """
+    code = source.decode(module.encoding)
+    offsets = Offsets(code, module.encoding)
+    # The last replacement of each node.
+    latest = {id(node): (node, replacement) for node, replacement in replacements}
+
+    head_end = 0
+    head: List[_Statement] = []
+    rest: Sequence[_Statement] = []
+    if needed_imports:
+        head, rest = _split_head(module)
+        if rest:
+            rest_start = positions[rest[0]].start
+            head_end = offsets.byte_offset(rest_start.line, rest_start.column) + sum(
+                len(module.code_for_node(line).encode(module.encoding))
+                for line in rest[0].leading_lines
+            )
+        else:
+            head_end = len(source)
+
+    head_replacements = []
+    edits: List[Tuple[int, int, cst.CSTNode]] = []
+    for node, replacement in latest.values():
+        node_range = positions[node]
+        start = offsets.byte_offset(node_range.start.line, node_range.start.column)
+        end = offsets.byte_offset(node_range.end.line, node_range.end.column)
+        if start < head_end:
+            if end > head_end:
+                raise OverlappingEdits(
+                    f"Fix overlapping the imports on line {offsets.line(start)}"
+                )
+            # Made together with the imports.
+            head_replacements.append((node, replacement))
+        else:
+            edits.append((start, end, replacement))
+
+    # Outer edits first, the edits inside them are dropped.
+    edits.sort(key=lambda edit: (edit[0], -edit[1]))
+    spliced: List[Dict[str, Any]] = []
+    for start, end, replacement in edits:
+        if spliced:
+            previous_start, previous_end = spliced[-1]["start"], spliced[-1]["end"]
+            if (start, end) == (previous_start, previous_end) or (
+                (start == end or previous_start == previous_end)
+                and start in (previous_start, previous_end)
+            ):
+                # Either node could be inside the other.
+                raise OverlappingEdits(f"Ambiguous fixes on line {offsets.line(start)}")
+            if start < previous_end:
+                if end > previous_end:
+                    raise OverlappingEdits(
+                        f"Overlapping fixes on line {offsets.line(start)}"
+                    )
+                continue
+        spliced.append(
+            {"start": start, "end": end, "text": module.code_for_node(replacement)}
+        )
+
+    if needed_imports:
+        head_module = _head_module(module, head, rest)
+        if head_replacements:
+            head_module = replace_nodes(head_module, positions, head_replacements)
+        new_head = head_module.visit(
+            codemod.visitors.AddImportsVisitor(context, needed_imports)
+        )
+        if rest:
+            *new_body, placeholder = new_head.body
+            head_code = new_head.with_changes(body=new_body).code + "".join(
+                new_head.code_for_node(line) for line in placeholder.leading_lines
+            )
+        else:
+            head_code = new_head.code
+        spliced.append({"start": 0, "end": head_end, "text": head_code})
+    return splice(source, spliced, module.encoding)
+
+
+def _is_import_line(statement: cst.BaseStatement) -> bool:
+    return (
+        isinstance(statement, cst.SimpleStatementLine)
+        and len(statement.body) == 1
+        and isinstance(statement.body[0], (cst.Import, cst.ImportFrom))
+    )
@@ -0,0 +1,343 @@
+"""
+Declarative rules for calls, compiled into lookup tables by qualified name
+which are evaluated by `QualifiedNameDispatcher` without visitor code.
+
+A rule is a mapping with these keys (only `name` and `error` are required):
+
+- `name`: the qualified name of the called function, or a list of them.
+- `error`: the error code of the violation, one of the visitor's `ERRORS`.
+- `message`: values of the fields of the error message template,
+  where `{name}` is the qualified name of the call.
+- `reference`: appended to the message, e.g. a URL.
+- `args`: conditions on the arguments, by keyword: `null` if the argument must be
+  passed, or a mapping with its `position` if it can be positional
+  (zero-based, see `TorchVisitor.get_specific_arg`) and/or the literal `value`
+  it must have.
+- `rename`: the new qualified name of the called function.
+- `replace_args`: arguments to replace, by keyword, with their `position`,
+  the new `keyword` and the new `values` (Python code) by the literal value
+  of the argument. Other values are not replaced.
+- `imports`: the imports needed by the new values, as `module.name` or `module`,
+  added if the values refer to the imported name.
+- `fixer`: a `module:function` called with the call node instead of `rename`
+  and `replace_args`, returning None if the call can't be fixed, or a function
+  making the replacement, which is only called if the fix is needed.
+
+For each call, the first rule of a visitor whose conditions hold is reported.
+For example:
+
+    - name: torch.ger
+      error: TOR101
+      message: {old_name: "{name}"}
+      rename: torch.outer
+"""
+
+import ast
+import functools
+import importlib
+import pkgutil
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+import libcst as cst
+import libcst.matchers as m
+import yaml
+from libcst.codemod.visitors import ImportItem
+
+from .common import call_name_changes, TorchError, TorchVisitor
+
+RULE_KEYS = frozenset(
+    [
+        "name",
+        "error",
+        "message",
+        "reference",
+        "args",
+        "rename",
+        "replace_args",
+        "imports",
+        "fixer",
+    ]
+)
+
+# Any value of an argument.
+_ANY = object()
+
+_Fixer = Callable[[cst.Call], Optional[Callable[[], cst.CSTNode]]]
+
+
+def _literal_value(node: Union[cst.BaseExpression, ast.expr, None]) -> Any:
+    """The value of a literal expression, `_ANY` if it's not a literal."""
+    if node is None:
+        return _ANY
+    try:
+        if isinstance(node, cst.CSTNode):
+            return ast.literal_eval(f"({cst.Module([]).code_for_node(node)})")
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return _ANY
+
+
+def _same_literal(value: Any, expected: Any) -> bool:
+    # `True == 1`, but they are different literals.
+    return value is not _ANY and type(value) is type(expected) and value == expected
+
+
+@functools.cache
+def _new_arg(keyword: str, value: str) -> Tuple[cst.Arg, FrozenSet[str]]:
+    """A keyword argument, and the names its value refers to."""
+    call = cst.ensure_type(cst.parse_expression(f"f({keyword}={value})"), cst.Call)
+    arg = call.args[0]
+    names = m.findall(arg.value, m.Name())
+    return arg, frozenset(cst.ensure_type(name, cst.Name).value for name in names)
+
+
+@dataclass(frozen=True)
+class _Arg:
+    """An argument by keyword, and position if it's not -1."""
+
+    keyword: str
+    position: int
+
+    def find(self, node: cst.Call) -> Optional[cst.Arg]:
+        return TorchVisitor.get_specific_arg(node, self.keyword, self.position)
+
+    def find_ast(self, node: ast.Call) -> Optional[ast.expr]:
+        return TorchVisitor.get_specific_ast_arg(node, self.keyword, self.position)
+
+
+@dataclass(frozen=True)
+class _ArgCondition:
+    arg: _Arg
+    value: Any = _ANY
+
+    def holds(self, node: cst.Call) -> bool:
+        arg = self.arg.find(node)
+        return arg is not None and (
+            self.value is _ANY or _same_literal(_literal_value(arg.value), self.value)
+        )
+
+    def holds_ast(self, node: ast.Call) -> bool:
+        value = self.arg.find_ast(node)
+        return value is not None and (
+            self.value is _ANY or _same_literal(_literal_value(value), self.value)
+        )
+
+
+@dataclass(frozen=True)
+class _ArgReplacement:
+    arg: _Arg
+    new_keyword: str
+    # The code of the new values, by the literal value of the argument.
+    values: Tuple[Tuple[Any, str], ...]
+
+    def new_arg(self, old_arg: cst.Arg) -> Optional[Tuple[cst.Arg, FrozenSet[str]]]:
+        old_value = _literal_value(old_arg.value)
+        for value, code in self.values:
+            if _same_literal(old_value, value):
+                return _new_arg(self.new_keyword, code)
+        return None
+
+
+@dataclass(frozen=True)
+class Rule:
+    """A compiled rule, see the module docstring."""
+
+    error: TorchError
+    message_fields: Tuple[Tuple[str, str], ...] = ()
+    reference: Optional[str] = None
+    conditions: Tuple[_ArgCondition, ...] = ()
+    rename: Optional[str] = None
+    replace_args: Tuple[_ArgReplacement, ...] = ()
+    # By the names they import.
+    imports: Tuple[Tuple[str, ImportItem], ...] = ()
+    fixer: Optional[_Fixer] = None
+
+    def holds(self, node: cst.Call) -> bool:
+        return all(condition.holds(node) for condition in self.conditions)
+
+    def holds_ast(self, node: ast.Call) -> bool:
+        return all(condition.holds_ast(node) for condition in self.conditions)
+
+    def message(self, qualified_name: str) -> str:
+        message = self.error.message(
+            **{
+                field: value.format(name=qualified_name)
+                for field, value in self.message_fields
+            }
+        )
+        if self.reference is not None:
+            message = f"{message}: {self.reference}"
+        return message
+
+    def replacement(
+        self, node: cst.Call, qualified_name: str
+    ) -> Tuple[Optional[Callable[[], cst.CSTNode]], Set[ImportItem]]:
+        """
+        The function making the replacement of `node`, if any,
+        and the imports it needs.
+        """
+        if self.fixer is not None:
+            return self.fixer(node), set()
+
+        new_name = None
+        imports: Set[ImportItem] = set()
+        if self.rename is not None:
+            name_changes = call_name_changes(node, qualified_name, self.rename)
+            if name_changes is not None:
+                new_name, imports = name_changes
+
+        # The replaced arguments, by position.
+        new_args: Dict[int, cst.Arg] = {}
+        for arg_replacement in self.replace_args:
+            old_arg = arg_replacement.arg.find(node)
+            if old_arg is None:
+                continue
+            new_arg_and_names = arg_replacement.new_arg(old_arg)
+            if new_arg_and_names is None:
+                continue
+            new_arg, names = new_arg_and_names
+            for pos, arg in enumerate(node.args):
+                if arg is old_arg:
+                    new_args[pos] = new_arg
+            imports.update(item for name, item in self.imports if name in names)
+        if new_name is None and not new_args:
+            return None, imports
+
+        def make_replacement() -> cst.CSTNode:
+            changes: Dict[str, Any] = {}
+            if new_name is not None:
+                changes["func"] = cst.parse_expression(new_name)
+            if new_args:
+                changes["args"] = [
+                    new_args[pos].deep_clone() if pos in new_args else arg
+                    for pos, arg in enumerate(node.args)
+                ]
+            return node.with_changes(**changes)
+
+        return make_replacement, imports
+
+
+class RuleSet:
+    """Compiled rules, by the qualified names of the calls they match."""
+
+    def __init__(self, rules: Mapping[str, Sequence[Rule]]) -> None:
+        self.rules = {name: tuple(name_rules) for name, name_rules in rules.items()}
+
+    @property
+    def names(self) -> Collection[str]:
+        return self.rules.keys()
+
+    def match(self, node: cst.Call, qualified_name: str) -> Optional[Rule]:
+        for rule in self.rules.get(qualified_name, ()):
+            if rule.holds(node):
+                return rule
+        return None
+
+    def report(
+        self, visitor: TorchVisitor, node: cst.Call, qualified_name: str
+    ) -> None:
+        """Report the violation of the first matching rule, if any, by `visitor`."""
+        rule = self.match(node, qualified_name)
+        if rule is None:
+            return
+        replacement, imports = rule.replacement(node, qualified_name)
+        visitor.needed_imports.update(imports)
+        visitor.add_violation(
+            node,
+            error_code=rule.error.error_code,
+            message=rule.message(qualified_name),
+            replacement=replacement,
+        )
+
+    def report_ast(self, visitor: TorchVisitor, node: ast.Call) -> None:
+        """Same as `report`, for an `ast` call, for `visit_ast_Call`."""
+        qualified_name = visitor.get_qualified_name_for_ast_call(node)
+        if qualified_name is None:
+            return
+        for rule in self.rules.get(qualified_name, ()):
+            if rule.holds_ast(node):
+                visitor.add_ast_violation(
+                    node, rule.error.error_code, rule.message(qualified_name)
+                )
+                return
+
+
+def _arg(keyword: str, spec: Optional[Mapping[str, Any]]) -> _Arg:
+    return _Arg(keyword, -1 if spec is None else spec.get("position", -1))
+
+
+def _import(name: str) -> Tuple[str, ImportItem]:
+    module_name, _, obj_name = name.rpartition(".")
+    if not module_name:
+        return name, ImportItem(module_name=name)
+    return obj_name, ImportItem(module_name=module_name, obj_name=obj_name)
+
+
+def _fixer(path: str) -> _Fixer:
+    module_name, _, function_name = path.partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def compile_rules(
+    items: Iterable[Mapping[str, Any]], errors: Sequence[TorchError]
+) -> RuleSet:
+    """Compile rules, see the module docstring. Raises `ValueError` if invalid."""
+    errors_by_code = {error.error_code: error for error in errors}
+    rules: Dict[str, List[Rule]] = {}
+    for item in items:
+        unknown = set(item) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"Unknown rule keys: {', '.join(sorted(unknown))}")
+        if item["error"] not in errors_by_code:
+            raise ValueError(f"Unknown error code in rule: {item['error']}")
+        rule = Rule(
+            error=errors_by_code[item["error"]],
+            message_fields=tuple((item.get("message") or {}).items()),
+            reference=item.get("reference"),
+            conditions=tuple(
+                _ArgCondition(
+                    _arg(keyword, spec),
+                    spec["value"] if spec is not None and "value" in spec else _ANY,
+                )
+                for keyword, spec in (item.get("args") or {}).items()
+            ),
+            rename=item.get("rename"),
+            replace_args=tuple(
+                _ArgReplacement(
+                    _arg(keyword, spec),
+                    spec["keyword"],
+                    tuple(spec["values"].items()),
+                )
+                for keyword, spec in (item.get("replace_args") or {}).items()
+            ),
+            imports=tuple(_import(name) for name in item.get("imports") or ()),
+            fixer=_fixer(item["fixer"]) if item.get("fixer") else None,
+        )
+        names = item["name"]
+        for name in [names] if isinstance(names, str) else names:
+            if name.endswith("."):
+                raise ValueError(f"Rules can't match name prefixes: {name}")
+            rules.setdefault(name, []).append(rule)
+    return RuleSet(rules)
+
+
+def load_rules(path: str, errors: Sequence[TorchError]) -> RuleSet:
+    """Compile the rules in a YAML file in the `torchfix` package."""
+    data = pkgutil.get_data("torchfix", path)
+    assert data is not None
+    return compile_rules(yaml.load(data, yaml.SafeLoader) or (), errors)
@@ -0,0 +1,126 @@
+import argparse
+import hashlib
+import heapq
+import json
+import sys
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .executor import estimate_cost
+from .report import display_path, format_codemod_result, print_summary
+
+RESULTS_VERSION = 1
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse a 1-based shard index and shard count, e.g. `2/4`."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, e.g. 1/4: {value!r}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 1..{count}")
+    return index, count
+
+
+def _path_hash(filename: str) -> str:
+    # Relative to the current directory, to not depend on the checkout location.
+    return hashlib.sha1(display_path(filename).as_posix().encode()).hexdigest()
+
+
+def shard_files(files: Sequence[str], index: int, count: int) -> List[str]:
+    """
+    Return the files of the 1-based shard `index` out of `count` shards.
+
+    Files are assigned to shards largest first, each to the shard with the least
+    estimated cost so far, with ties broken by a hash of the path.
+    All shards of the same checkout get the same partition,
+    independently of the order of `files`.
+    """
+    weighted = sorted(
+        ((-estimate_cost(filename), _path_hash(filename), filename))
+        for filename in files
+    )
+    # (estimated cost, shard index) of each shard.
+    shards = [(0.0, i) for i in range(count)]
+    selected = []
+    for negative_cost, _, filename in weighted:
+        cost, shard = heapq.heappop(shards)
+        if shard == index - 1:
+            selected.append(filename)
+        heapq.heappush(shards, (cost - negative_cost, shard))
+    return sorted(selected)
+
+
+def write_results(
+    path: str,
+    version: str,
+    shard: Optional[Tuple[int, int]],
+    successes: int,
+    skips: int,
+    failures: int,
+    over_limit: Sequence[Tuple[str, str]],
+    violations: Sequence[Tuple[str, Dict[str, Any]]],
+) -> None:
+    """Write the results of a run, to be combined by `torchfix merge`."""
+    results = {
+        "version": RESULTS_VERSION,
+        "torchfix": version,
+        "shard": shard,
+        "successes": successes,
+        "skips": skips,
+        "failures": failures,
+        "over_limit": [
+            (display_path(filename).as_posix(), reason)
+            for filename, reason in over_limit
+        ],
+        "violations": [
+            {"path": display_path(filename).as_posix(), **record}
+            for filename, record in violations
+        ],
+    }
+    with open(path, "w") as f:
+        json.dump(results, f)
+        f.write("\n")
+
+
+def merge_main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="torchfix merge",
+        description="Combine results written by `torchfix --results-json`, "
+        "e.g. from `--shard` runs, and print the violations and the summary.",
+    )
+    parser.add_argument("results", nargs="+", help="Results JSON files.")
+    args = parser.parse_args(argv)
+
+    successes = skips = failures = 0
+    over_limit: List[Tuple[str, str]] = []
+    violations: List[Dict[str, Any]] = []
+    shards: Dict[int, List[int]] = {}
+    for path in args.results:
+        with open(path) as f:
+            results = json.load(f)
+        if results.get("version") != RESULTS_VERSION:
+            parser.error(f"{path}: unsupported results version")
+        successes += results["successes"]
+        skips += results["skips"]
+        failures += results["failures"]
+        over_limit += [tuple(item) for item in results["over_limit"]]
+        violations += results["violations"]
+        if results["shard"] is not None:
+            index, count = results["shard"]
+            shards.setdefault(count, []).append(index)
+
+    for count, indices in shards.items():
+        missing = sorted(set(range(1, count + 1)) - set(indices))
+        if len(shards) > 1 or missing or len(indices) != count:
+            print(
+                f"WARNING: expected each of {count} shards once, got {sorted(indices)}",
+                file=sys.stderr,
+            )
+
+    violations.sort(key=lambda r: (r["path"], r["line"], r["column"]))
+    for record in violations:
+        print(f"{record['path']}{format_codemod_result(record)}")
+    print_summary(successes, skips, failures, False, sorted(over_limit))
+    if failures > 0:
+        sys.exit(1)
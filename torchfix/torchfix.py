@@ -1,11 +1,37 @@
+import ast
 from dataclasses import dataclass
 import functools
-from pathlib import Path
-from typing import Optional, List
+import hashlib
+import pkgutil
+import re
+import threading
+from typing import (
+    AbstractSet,
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+)
 import libcst as cst
 import libcst.codemod as codemod
+from libcst.codemod.visitors import ImportItem
+from libcst.metadata import CodeRange, WhitespaceInclusivePositionProvider
 
-from .common import deep_multi_replace, TorchVisitor
+from .ast_checker import AstContext, UnsupportedAst, visit_ast
+from .cache import ResultCache
+from .common import LintViolation, TorchError, TorchVisitor
+from .dispatch import visit_cst
+from .plan import make_file_plan
+from .profiling import phase_timer
+from .rewrite import add_imports, OverlappingEdits, replace_nodes, splice_fixes
 
 from .visitors import (
     TorchDeprecatedSymbolsVisitor,
@@ -23,14 +49,20 @@ from .visitors import (
     TorchVisionSingletonImportVisitor,
     TorchGradNotSetToNonePatternVisitor,
 )
+from .visitors.deprecated_symbols import read_deprecated_config
 
 __version__ = "0.7.0"
 
 DEPRECATED_CONFIG_PATH = "deprecated_symbols.yaml"
+# Rule files of the visitors, see `rules`.
+RULES_PATHS = [
+    TorchNonPublicAliasVisitor.RULES_PATH,
+    TorchVisionDeprecatedPretrainedVisitor.RULES_PATH,
+]
 
 DISABLED_BY_DEFAULT = ["TOR3", "TOR4", "TOR9"]
 
-ALL_VISITOR_CLS = [
+ALL_VISITOR_CLS: List[Type[TorchVisitor]] = [
     TorchDeprecatedSymbolsVisitor,
     TorchExpm1Visitor,
     TorchLog1pVisitor,
@@ -48,6 +80,15 @@ ALL_VISITOR_CLS = [
 ]
 
 
+@functools.cache
+def GET_ALL_ERRORS() -> List[TorchError]:
+    errors = []
+    for cls in ALL_VISITOR_CLS:
+        assert issubclass(cls, TorchVisitor)
+        errors += cls.ERRORS
+    return sorted(errors, key=lambda error: error.error_code)
+
+
 @functools.cache
 def GET_ALL_ERROR_CODES():
     codes = set()
@@ -78,21 +119,121 @@ def GET_ALL_VISITORS():
     return [construct_visitor(v) for v in ALL_VISITOR_CLS]
 
 
-def get_visitors_with_error_codes(error_codes):
-    visitor_classes = set()
+# Visitors reused for each module, see `get_visitors`.
+_REUSABLE_VISITORS = threading.local()
+
+
+def get_visitors(
+    visitor_classes: AbstractSet[Type[TorchVisitor]],
+) -> List[TorchVisitor]:
+    """
+    Return visitors of `visitor_classes`, in the order of `ALL_VISITOR_CLS`,
+    reset for a new module.
+
+    Visitors are constructed once per thread and reused,
+    so visitors returned by a previous call must not be used anymore.
+    """
+    visitors = getattr(_REUSABLE_VISITORS, "visitors", None)
+    if visitors is None:
+        visitors = {cls: construct_visitor(cls) for cls in ALL_VISITOR_CLS}
+        _REUSABLE_VISITORS.visitors = visitors
+    selected = []
+    for cls in ALL_VISITOR_CLS:
+        if cls in visitor_classes:
+            visitor = visitors[cls]
+            visitor.reset()
+            selected.append(visitor)
+    return selected
+
+
+def get_trigger_tokens(cls) -> Sequence[str]:
+    if cls is TorchDeprecatedSymbolsVisitor:
+        names = read_deprecated_config(DEPRECATED_CONFIG_PATH)
+        return sorted({name.rsplit(".", 1)[-1] for name in names})
+
+    return cls.TRIGGER_TOKENS
+
+
+class TriggerMatcher:
+    """
+    Find the visitors that need to run on some code: those with any of their
+    `TRIGGER_TOKENS` as an identifier in it, and those without trigger tokens.
+    The code is scanned once for the tokens of all visitors.
+    """
+
+    # Also matches the ASCII parts of non-ASCII identifiers,
+    # which can only trigger more visitors than needed.
+    IDENTIFIER = re.compile(rb"[A-Za-z_]\w*")
+
+    def __init__(self, visitor_classes: Iterable[Type[TorchVisitor]]) -> None:
+        self.untriggered: Set[Type[TorchVisitor]] = set()
+        self.token_classes: Dict[bytes, Set[Type[TorchVisitor]]] = {}
+        for cls in visitor_classes:
+            tokens = get_trigger_tokens(cls)
+            if not tokens:
+                self.untriggered.add(cls)
+            for token in tokens:
+                assert token.isidentifier(), f"Invalid trigger token: {token}"
+                self.token_classes.setdefault(token.encode(), set()).add(cls)
+
+    def match(self, code: bytes) -> Set[Type[TorchVisitor]]:
+        triggered = set(self.untriggered)
+        if not self.token_classes:
+            return triggered
+        identifiers = set(self.IDENTIFIER.findall(code))
+        for token in identifiers.intersection(self.token_classes):
+            triggered |= self.token_classes[token]
+        return triggered
+
+
+@functools.cache
+def GET_TRIGGER_MATCHER() -> TriggerMatcher:
+    return TriggerMatcher(ALL_VISITOR_CLS)
+
+
+@functools.cache
+def GET_ERROR_CODE_VISITOR_CLS() -> Dict[str, Type[TorchVisitor]]:
+    return {error.error_code: cls for cls in ALL_VISITOR_CLS for error in cls.ERRORS}
+
+
+def get_visitor_classes_with_error_codes(
+    error_codes,
+) -> FrozenSet[Type[TorchVisitor]]:
+    # Selections are the same for all files of a run, compute them once.
+    return _get_visitor_classes_with_error_codes(frozenset(error_codes))
+
+
+@functools.cache
+def _get_visitor_classes_with_error_codes(
+    error_codes: FrozenSet[str],
+) -> FrozenSet[Type[TorchVisitor]]:
+    # Assume the error codes have been expanded so each error code can
+    # only correspond to one visitor.
+    code_visitor_cls = GET_ERROR_CODE_VISITOR_CLS()
     for error_code in error_codes:
-        # Assume the error codes have been expanded so each error code can
-        # only correspond to one visitor.
-        found = False
-        for visitor_cls in ALL_VISITOR_CLS:
-            assert issubclass(visitor_cls, TorchVisitor)
-            if any(error_code == err.error_code for err in visitor_cls.ERRORS):
-                visitor_classes.add(visitor_cls)
-                found = True
-                break
-        if not found:
+        if error_code not in code_visitor_cls:
             raise AssertionError(f"Unknown error code: {error_code}")
-    return [construct_visitor(cls) for cls in visitor_classes]
+    return frozenset(code_visitor_cls[error_code] for error_code in error_codes)
+
+
+def get_visitors_with_error_codes(
+    error_codes,
+    triggered: Optional[AbstractSet[Type[TorchVisitor]]] = None,
+    fresh: bool = False,
+):
+    """
+    Return the visitors for `error_codes`,
+    only those in `triggered` (see `TriggerMatcher`) if it is set.
+    The visitors are reused (see `get_visitors`) unless `fresh` is set.
+    """
+    visitor_classes = get_visitor_classes_with_error_codes(error_codes)
+    if triggered is not None:
+        visitor_classes &= triggered
+    if fresh:
+        return [
+            construct_visitor(cls) for cls in ALL_VISITOR_CLS if cls in visitor_classes
+        ]
+    return get_visitors(visitor_classes)
 
 
 def process_error_code_str(code_str):
@@ -127,30 +268,72 @@ class TorchChecker:
     name = "TorchFix"
     version = __version__
 
+    # Visitors that can report a code enabled in flake8, see `parse_options`.
+    # None if the options were not parsed (e.g. not run by flake8): all visitors.
+    enabled_visitor_classes: Optional[FrozenSet[Type[TorchVisitor]]] = None
+
     # The parameters need to have these exact names.
     # See https://flake8.pycqa.org/en/latest/plugin-development/plugin-parameters.html
-    # `tree` is unused, but the plugin doesn't work without it.
+    # Violations are detected on the `ast` tree parsed by flake8 when possible,
+    # which is much faster than parsing and resolving the metadata with libcst.
+    # `tree` can be None, then the code is parsed with `ast`.
     def __init__(self, tree, lines):
         # Filter out files that don't have "torch" string in them.
         # This avoids expensive parsing.
         MARKER = "torch"  # this will catch import torch or functorch
         has_marker = False
         self.module = None
+        if (
+            self.enabled_visitor_classes is not None
+            and not self.enabled_visitor_classes
+        ):
+            # All TorchFix codes are disabled.
+            return
         for line in lines:
             if MARKER in line:
                 has_marker = True
                 break
         if has_marker:
-            module = cst.parse_module("".join(lines))
-            self.module = cst.MetadataWrapper(module, unsafe_skip_copy=True)
-            self.violations = []
-            self.visitors = GET_ALL_VISITORS()
+            code = "".join(lines)
+            # Only construct the visitors that can report something,
+            # and don't parse if there are none.
+            self.visitor_classes = GET_TRIGGER_MATCHER().match(
+                code.encode(errors="replace")
+            )
+            if self.enabled_visitor_classes is not None:
+                self.visitor_classes &= self.enabled_visitor_classes
+            if self.visitor_classes:
+                self.module = tree if tree is not None else ast.parse(code)
+                self.lines = lines
+                self.code = code
+                self.violations = []
+
+    def _ast_violations(self) -> List[LintViolation]:
+        assert self.module is not None
+        visitors = get_visitors(self.visitor_classes)
+        visit_ast(AstContext(self.module, self.lines), visitors)
+        violations: List[LintViolation] = []
+        for visitor in visitors:
+            # Nodes are visited breadth-first, report in the order of libcst:
+            # by position, and outer nodes first.
+            violations += sorted(visitor.violations, key=lambda v: (v.line, v.column))
+        return violations
+
+    def _cst_violations(self) -> List[LintViolation]:
+        visitors = get_visitors(self.visitor_classes)
+        module = cst.MetadataWrapper(cst.parse_module(self.code), unsafe_skip_copy=True)
+        visit_cst(module, visitors)
+        violations: List[LintViolation] = []
+        for visitor in visitors:
+            violations += visitor.violations
+        return violations
 
     def run(self):
         if self.module:
-            self.module.visit_batched(self.visitors)
-            for v in self.visitors:
-                self.violations += v.violations
+            try:
+                self.violations = self._ast_violations()
+            except UnsupportedAst:
+                self.violations = self._cst_violations()
             for violation in self.violations:
                 yield violation.flake8_result()
 
@@ -158,14 +341,85 @@ class TorchChecker:
     def add_options(optmanager):
         optmanager.extend_default_ignore(DISABLED_BY_DEFAULT)
 
+    @classmethod
+    def parse_options(cls, options):
+        # Only imported when run by flake8.
+        from flake8.style_guide import (  # type: ignore[import-untyped]
+            Decision,
+            DecisionEngine,
+        )
+
+        # Same decisions as flake8 for `--select`, `--ignore`, `--extend-ignore`,
+        # etc., to not run visitors whose violations would all be discarded.
+        decision_engine = DecisionEngine(options)
+        enabled_codes = [
+            code
+            for code in GET_ALL_ERROR_CODES()
+            if decision_engine.decision_for(code) is Decision.Selected
+        ]
+        cls.enabled_visitor_classes = get_visitor_classes_with_error_codes(
+            enabled_codes
+        )
+
 
 # Standalone torchfix command
 @dataclass
 class TorchCodemodConfig:
     select: Optional[List[str]] = None
+    # Directory of the result cache, caching is disabled when None.
+    cache_dir: Optional[str] = None
+    # Whether to collect a `FileProfile` for each file, see `execute_code`.
+    profile: bool = False
+    # Files larger than this, in bytes, are skipped.
+    max_file_bytes: Optional[int] = None
+    # Processing of a file is interrupted after this many seconds.
+    file_timeout: Optional[float] = None
+    # Whether to make a fix plan for each file, see `make_file_plan`.
+    emit_plan: bool = False
+    # Only report violations, without making the fixes (or the replacement code
+    # of the records). The module is returned unchanged.
+    report_only: bool = False
+    # Whether to splice the code of the fixes into the original code instead of
+    # generating the code of the fixed module, see `splice_fixes`.
+    splice_fixes: bool = False
+    # Whether to check that the spliced code parses.
+    verify_fixes: bool = False
+
+
+@functools.cache
+def get_rules_digest() -> str:
+    """Digest of everything besides the selection that affects lint results."""
+    digest = hashlib.sha256(__version__.encode())
+    for path in [DEPRECATED_CONFIG_PATH, *RULES_PATHS]:
+        data = pkgutil.get_data("torchfix", path)
+        assert data is not None
+        digest.update(data)
+    return digest.hexdigest()
 
 
 class TorchCodemod(codemod.Codemod):
+    """
+    Codemod applying fixes for the selected rules.
+
+    Records of all reported violations (see `LintViolation.to_record`),
+    with the replacement code for fixable violations unless `report_only`
+    is set in the config, are stored in
+    `self.context.scratch["violations"]`.
+    Additionally, `on_violation` is called with the file name and the record
+    for each violation as soon as it's found.
+    If `self.context.scratch["profile"]` is set to a `FileProfile`,
+    the time of each phase and visitor callback is recorded in it.
+    If `emit_plan` is set in the config, the plan for applying the fixes
+    later is stored in `self.context.scratch["plan"]`.
+    If `self.context.scratch["triggered_visitors"]` is set to the visitor
+    classes found by `TriggerMatcher` for the module code, only those are run.
+    If `self.context.scratch["source"]` is set to the module code, it's used
+    instead of generating it.
+    If `splice_fixes` is set in the config, the module is returned unchanged
+    and the fixed code is stored in `self.context.scratch["fixed_code"]`,
+    unless the fixes can't be spliced (e.g. they overlap), with a warning.
+    """
+
     def __init__(
         self,
         context: codemod.CodemodContext,
@@ -173,6 +427,20 @@ class TorchCodemod(codemod.Codemod):
     ) -> None:
         super().__init__(context)
         self.config = config
+        self.on_violation: Optional[Callable[[str, Dict[str, Any]], None]] = None
+
+    def get_result_cache(self) -> Optional[ResultCache]:
+        if self.config is None or self.config.cache_dir is None:
+            return None
+        assert self.config.select is not None
+        salt = f"{get_rules_digest()}:{','.join(sorted(self.config.select))}"
+        if self.config.report_only:
+            # Entries without the fixed code.
+            salt += ":report"
+        elif self.config.splice_fixes:
+            # The fixed code is made differently, possibly with warnings.
+            salt += ":verify" if self.config.verify_fixes else ":splice"
+        return ResultCache(self.config.cache_dir, salt)
 
     def transform_module_impl(self, module: cst.Module) -> cst.Module:
         # We use `unsafe_skip_copy`` here not only to save some time, but
@@ -183,18 +451,47 @@ class TorchCodemod(codemod.Codemod):
         wrapped_module = cst.MetadataWrapper(module, unsafe_skip_copy=True)
         if self.config is None or self.config.select is None:
             raise AssertionError("Expected self.config.select to be set")
-        visitors = get_visitors_with_error_codes(self.config.select)
+        profile = self.context.scratch.get("profile")
+        # Profiling instruments the visitors, don't reuse them.
+        visitors = get_visitors_with_error_codes(
+            self.config.select,
+            self.context.scratch.get("triggered_visitors"),
+            fresh=profile is not None,
+        )
+
+        phase = phase_timer(profile)
+        if profile is not None:
+            for visitor in visitors:
+                profile.instrument(visitor)
+            # Resolve metadata ahead of `visit_batched` (which reuses it)
+            # to time each provider separately.
+            providers = {
+                provider
+                for visitor in visitors
+                for provider in visitor.get_inherited_dependencies()
+            }
+            for provider in sorted(providers, key=lambda p: p.__name__):
+                with phase(f"metadata:{provider.__name__}"):
+                    wrapped_module.resolve(provider)
 
         violations = []
         needed_imports = []
-        wrapped_module.visit_batched(visitors)
+        # Violations from visitors that need imports for their fixes.
+        import_violations: Set[int] = set()
+        with phase("visitors"):
+            visit_cst(wrapped_module, visitors)
         for v in visitors:
             violations += v.violations
             needed_imports += v.needed_imports
+            if v.needed_imports:
+                import_violations.update(id(violation) for violation in v.violations)
 
         fixes_count = 0
-        replacement_map = {}
-        assert self.context.filename is not None
+        replacements = []
+        # Fixed violations with their records, for the plan.
+        fixes = []
+        records: List[Dict[str, Any]] = []
+        self.context.scratch["violations"] = records
         for violation in violations:
             # Still need to skip violations here, since a single visitor can
             # correspond to multiple different types of violations.
@@ -206,24 +503,145 @@ class TorchCodemod(codemod.Codemod):
             if skip_violation:
                 continue
 
-            if violation.replacement is not None:
-                replacement_map[id(violation.node)] = violation.replacement
+            record = violation.to_record()
+            if violation.fixable:
                 fixes_count += 1
-            try:
-                path = Path(self.context.filename).relative_to(Path.cwd())
-            except ValueError:
-                # Not a subpath of a current dir, use absolute path
-                path = Path(self.context.filename)
-            print(f"{path}{violation.codemod_result()}")
-
-        new_module = deep_multi_replace(module, replacement_map)
-
-        add_imports_visitor = codemod.visitors.AddImportsVisitor(
-            self.context, needed_imports
-        )
-        new_module = new_module.visit(add_imports_visitor)
+            if violation.fixable and not self.config.report_only:
+                replacement = violation.get_replacement()
+                assert replacement is not None
+                replacements.append((violation.node, replacement))
+                record["replacement"] = module.code_for_node(replacement)
+                fixes.append((violation, record))
+            records.append(record)
+            if self.on_violation is not None:
+                assert self.context.filename is not None
+                self.on_violation(self.context.filename, record)
+
+        new_module = module
+        # The fixed code when it's spliced into the original code.
+        new_code: Optional[bytes] = None
+        if replacements:
+            positions = wrapped_module.resolve(WhitespaceInclusivePositionProvider)
+            if self.config.splice_fixes:
+                new_code = self._splice_fixes(
+                    module, positions, replacements, needed_imports
+                )
+            if new_code is None:
+                # Only the nodes on the way to the fixes are rebuilt.
+                with phase("replace"):
+                    new_module = replace_nodes(module, positions, replacements)
+
+                with phase("imports"):
+                    new_module = add_imports(self.context, new_module, needed_imports)
+            else:
+                self.context.scratch["fixed_code"] = new_code
+
+        def fixed_code() -> str:
+            if new_code is not None:
+                return new_code.decode(module.encoding)
+            return new_module.code
+
+        if self.config.emit_plan and replacements:
+            with phase("plan"):
+                self.context.scratch["plan"] = self._make_plan(
+                    module,
+                    fixed_code(),
+                    [record for _, record in fixes],
+                    needed_imports,
+                    [
+                        record["error_code"]
+                        for violation, record in fixes
+                        if id(violation) in import_violations
+                    ],
+                )
+
+        result_cache = self.get_result_cache()
+        if result_cache is not None:
+            with phase("cache"):
+                cached_code = None
+                if fixes_count:
+                    cached_code = "" if self.config.report_only else fixed_code()
+                result_cache.store(
+                    self._source(module),
+                    records,
+                    cached_code,
+                    module.encoding,
+                    self.context.warnings,
+                )
 
         if fixes_count == 0:
             raise codemod.SkipFile("No changes")
 
         return new_module
+
+    def _source(self, module: cst.Module) -> bytes:
+        source = self.context.scratch.get("source")
+        return source if source is not None else module.bytes
+
+    def _splice_fixes(
+        self,
+        module: cst.Module,
+        positions: Mapping[cst.CSTNode, CodeRange],
+        replacements: List[Tuple[cst.CSTNode, cst.CSTNode]],
+        needed_imports: List[ImportItem],
+    ) -> Optional[bytes]:
+        """The fixed code made by `splice_fixes`, None if that's not possible."""
+        assert self.config is not None
+        phase = phase_timer(self.context.scratch.get("profile"))
+        try:
+            with phase("splice"):
+                new_code = splice_fixes(
+                    self.context,
+                    module,
+                    self._source(module),
+                    positions,
+                    replacements,
+                    needed_imports,
+                )
+        except OverlappingEdits as e:
+            self.warn(f"{e}, regenerating the module instead")
+            return None
+        if self.config.verify_fixes:
+            try:
+                with phase("verify"):
+                    cst.parse_module(new_code)
+            except cst.ParserSyntaxError:
+                self.warn("Spliced fixes don't parse, regenerating the module instead")
+                return None
+        return new_code
+
+    def _make_plan(
+        self,
+        module: cst.Module,
+        new_code: str,
+        fix_records: List[Dict[str, Any]],
+        needed_imports: List[ImportItem],
+        import_codes: List[str],
+    ) -> Dict[str, Any]:
+        imports_code = None
+        if needed_imports:
+            # The imports are added to the original module separately,
+            # to make edits in its coordinates.
+            imports_code = module.visit(
+                codemod.visitors.AddImportsVisitor(self.context, needed_imports)
+            ).code
+        assert self.context.filename is not None
+        return make_file_plan(
+            self.context.filename,
+            module.code,
+            module.encoding,
+            [
+                (
+                    record["error_code"],
+                    record["line"],
+                    record["column"],
+                    record["end_line"],
+                    record["end_column"],
+                    record["replacement"],
+                )
+                for record in fix_records
+            ],
+            imports_code,
+            import_codes,
+            new_code,
+        )
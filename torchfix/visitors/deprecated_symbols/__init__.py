@@ -1,25 +1,36 @@
+import ast
+import functools
 import pkgutil
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import libcst as cst
 import yaml
 
 from ...common import (
-    call_with_name_changes,
     check_old_names_in_import_from,
+    old_names_in_ast_import_from,
     TorchError,
-    TorchVisitor,
+    TorchNamesVisitor,
 )
+from ...rules import compile_rules, RuleSet
 
-from .amp import call_replacement_cpu_amp_autocast, call_replacement_cuda_amp_autocast
-from .chain_matmul import call_replacement_chain_matmul
-from .cholesky import call_replacement_cholesky
-from .qr import call_replacement_qr
 
-from .range import call_replacement_range
+@functools.cache
+def read_deprecated_config(path: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Load the deprecated symbols config, by name. Loaded once per process,
+    as visitors are constructed for each file; the result must not be modified.
+    """
+    deprecated_config = {}
+    if path is not None:
+        data = pkgutil.get_data("torchfix", path)
+        assert data is not None
+        for item in yaml.load(data, yaml.SafeLoader):
+            deprecated_config[item["name"]] = item
+    return deprecated_config
 
 
-class TorchDeprecatedSymbolsVisitor(TorchVisitor):
+class TorchDeprecatedSymbolsVisitor(TorchNamesVisitor):
     ERRORS: List[TorchError] = [
         TorchError("TOR001", "Use of removed function {old_name}"),
         TorchError("TOR101", "Use of deprecated function {old_name}"),
@@ -28,50 +39,26 @@ class TorchDeprecatedSymbolsVisitor(TorchVisitor):
     ]
 
     def __init__(self, deprecated_config_path=None):
-        def read_deprecated_config(path=None):
-            deprecated_config = {}
-            if path is not None:
-                data = pkgutil.get_data("torchfix", path)
-                assert data is not None
-                for item in yaml.load(data, yaml.SafeLoader):
-                    deprecated_config[item["name"]] = item
-            return deprecated_config
-
         super().__init__()
         self.deprecated_config = read_deprecated_config(deprecated_config_path)
         self.old_new_name_map = {
             name: self.deprecated_config[name].get("replacement")
             for name in self.deprecated_config
         }
+        self.RULES: RuleSet = _deprecated_rules(deprecated_config_path)
 
-    def _call_replacement(
-        self, node: cst.Call, qualified_name: str
-    ) -> Optional[cst.CSTNode]:
-        replacements_map = {
-            "torch.cholesky": call_replacement_cholesky,
-            "torch.range": call_replacement_range,
-            "torch.chain_matmul": call_replacement_chain_matmul,
-            "torch.qr": call_replacement_qr,
-            "torch.cuda.amp.autocast": call_replacement_cuda_amp_autocast,
-            "torch.cpu.amp.autocast": call_replacement_cpu_amp_autocast,
-        }
-        replacement = None
+    def _import_error(self, qualified_name: str) -> Tuple[str, str]:
+        """Error code and message for an import of a deprecated name."""
+        if self.deprecated_config[qualified_name]["remove_pr"] is None:
+            error = self.ERRORS[3]
+        else:
+            error = self.ERRORS[2]
+        message = error.message(old_name=qualified_name)
 
-        if qualified_name in replacements_map:
-            return replacements_map[qualified_name](node)
-
-        # Replace names for functions that have drop-in replacement.
-        function_name_replacement = self.deprecated_config.get(qualified_name, {}).get(
-            "replacement", ""
-        )
-        if function_name_replacement:
-            replacement_and_imports = call_with_name_changes(
-                node, qualified_name, function_name_replacement
-            )
-            if replacement_and_imports is not None:
-                replacement, imports = replacement_and_imports
-                self.needed_imports.update(imports)
-        return replacement
+        reference = self.deprecated_config[qualified_name].get("reference")
+        if reference is not None:
+            message = f"{message}: {reference}"
+        return error.error_code, message
 
     def visit_ImportFrom(self, node: cst.ImportFrom) -> None:
         if node.module is None:
@@ -81,17 +68,7 @@ class TorchDeprecatedSymbolsVisitor(TorchVisitor):
             node, self.old_new_name_map
         )
         for qualified_name in old_names:
-            if self.deprecated_config[qualified_name]["remove_pr"] is None:
-                error_code = self.ERRORS[3].error_code
-                message = self.ERRORS[3].message(old_name=qualified_name)
-            else:
-                error_code = self.ERRORS[2].error_code
-                message = self.ERRORS[2].message(old_name=qualified_name)
-
-            reference = self.deprecated_config[qualified_name].get("reference")
-            if reference is not None:
-                message = f"{message}: {reference}"
-
+            error_code, message = self._import_error(qualified_name)
             self.add_violation(
                 node,
                 error_code=error_code,
@@ -99,24 +76,31 @@ class TorchDeprecatedSymbolsVisitor(TorchVisitor):
                 replacement=replacement,
             )
 
-    def visit_Call(self, node) -> None:
-        qualified_name = self.get_qualified_name_for_call(node)
-        if qualified_name is None:
-            return
-
-        if qualified_name in self.deprecated_config:
-            if self.deprecated_config[qualified_name]["remove_pr"] is None:
-                error_code = self.ERRORS[1].error_code
-                message = self.ERRORS[1].message(old_name=qualified_name)
-            else:
-                error_code = self.ERRORS[0].error_code
-                message = self.ERRORS[0].message(old_name=qualified_name)
-            replacement = self._call_replacement(node, qualified_name)
-
-            reference = self.deprecated_config[qualified_name].get("reference")
-            if reference is not None:
-                message = f"{message}: {reference}"
-
-            self.add_violation(
-                node, error_code=error_code, message=message, replacement=replacement
-            )
+    def visit_ast_ImportFrom(self, node: ast.ImportFrom) -> None:
+        for qualified_name in old_names_in_ast_import_from(node, self.old_new_name_map):
+            self.add_ast_violation(node, *self._import_error(qualified_name))
+
+    def visit_ast_Call(self, node: ast.Call) -> None:
+        self.RULES.report_ast(self, node)
+
+
+@functools.cache
+def _deprecated_rules(path: Optional[str] = None) -> RuleSet:
+    """
+    Rules for the uses of the deprecated symbols, with a fixer or a replacement.
+    """
+    errors = TorchDeprecatedSymbolsVisitor.ERRORS
+    return compile_rules(
+        (
+            {
+                "name": name,
+                "error": errors[1 if item["remove_pr"] is None else 0].error_code,
+                "message": {"old_name": "{name}"},
+                "reference": item.get("reference"),
+                "rename": item.get("replacement"),
+                "fixer": item.get("fixer"),
+            }
+            for name, item in read_deprecated_config(path).items()
+        ),
+        errors,
+    )
@@ -1,14 +1,17 @@
+import functools
+from typing import Callable
+
 import libcst as cst
 
 from ...common import get_module_name
 
 
-def call_replacement_cpu_amp_autocast(node: cst.Call) -> cst.CSTNode:
-    return _call_replacement_amp(node, "cpu")
+def call_replacement_cpu_amp_autocast(node: cst.Call) -> Callable[[], cst.CSTNode]:
+    return functools.partial(_call_replacement_amp, node, "cpu")
 
 
-def call_replacement_cuda_amp_autocast(node: cst.Call) -> cst.CSTNode:
-    return _call_replacement_amp(node, "cuda")
+def call_replacement_cuda_amp_autocast(node: cst.Call) -> Callable[[], cst.CSTNode]:
+    return functools.partial(_call_replacement_amp, node, "cuda")
 
 
 def _call_replacement_amp(node: cst.Call, device: str) -> cst.CSTNode:
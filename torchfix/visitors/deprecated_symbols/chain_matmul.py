@@ -1,8 +1,15 @@
+import functools
+from typing import Callable
+
 import libcst as cst
 from ...common import get_module_name
 
 
-def call_replacement_chain_matmul(node: cst.Call) -> cst.CSTNode:
+def call_replacement_chain_matmul(node: cst.Call) -> Callable[[], cst.CSTNode]:
+    return functools.partial(_call_replacement_chain_matmul, node)
+
+
+def _call_replacement_chain_matmul(node: cst.Call) -> cst.CSTNode:
     """
     Replace `torch.chain_matmul` with `torch.linalg.multi_dot`, changing
     multiple parameters to a list.
@@ -1,23 +1,33 @@
+import functools
+from typing import Callable
+
 import libcst as cst
 from ...common import TorchVisitor, get_module_name
 
 
-def call_replacement_cholesky(node: cst.Call) -> cst.CSTNode:
+def call_replacement_cholesky(node: cst.Call) -> Callable[[], cst.CSTNode]:
+    input_arg = cst.ensure_type(
+        TorchVisitor.get_specific_arg(node, "input", 0), cst.Arg
+    )
+    upper_arg = TorchVisitor.get_specific_arg(node, "upper", 1)
+    upper = (
+        upper_arg is not None
+        and cst.ensure_type(upper_arg.value, cst.Name).value == "True"
+    )
+    return functools.partial(_call_replacement_cholesky, node, input_arg, upper)
+
+
+def _call_replacement_cholesky(
+    node: cst.Call, input_arg: cst.Arg, upper: bool
+) -> cst.CSTNode:
     """
     Replace `torch.cholesky(A)` with `torch.linalg.cholesky(A)` and
     `torch.cholesky(A, upper=True)` with `torch.linalg.cholesky(A).mH`.
     """
-    input_arg = TorchVisitor.get_specific_arg(node, "input", 0)
-    input_arg = cst.ensure_type(input_arg, cst.Arg).with_changes(
-        comma=cst.MaybeSentinel.DEFAULT
-    )
-    upper_arg = TorchVisitor.get_specific_arg(node, "upper", 1)
+    input_arg = input_arg.with_changes(comma=cst.MaybeSentinel.DEFAULT)
     module_name = get_module_name(node, "torch")
 
-    if (
-        upper_arg is not None
-        and cst.ensure_type(upper_arg.value, cst.Name).value == "True"
-    ):
+    if upper:
         replacement = cst.parse_expression(f"{module_name}.linalg.cholesky(A).mH")
 
         # Make mypy happy
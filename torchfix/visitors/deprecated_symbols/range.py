@@ -1,38 +1,37 @@
+import functools
+from typing import Callable, Optional, Tuple
+
 import libcst as cst
 import libcst.matchers as m
-from typing import Optional, Tuple
 
 
-def call_replacement_range(node: cst.Call) -> Optional[cst.Call]:
-    """Replace `range` with `arange`.
-    Add `step` to the `end` argument as `arange` has the interval `[start, end)`.
-    """
+# `torch.range` documented signature is not a valid Python signature,
+# so it's hard to generalize this.
+def _get_range_args(node: cst.Call) -> Tuple[cst.Arg, Optional[cst.Arg]]:
+    "Return (`end`, `step`) from a `range` call"
+    end_arg = None
+    step_arg = None
+    non_kw_args = []
+    for arg in node.args:
+        if arg.keyword is None:
+            non_kw_args.append(arg)
+        elif arg.keyword.value == "end":
+            end_arg = arg
+        elif arg.keyword.value == "step":
+            step_arg = arg
+    if end_arg is None:
+        if len(non_kw_args) == 1:
+            end_arg = non_kw_args[0]
+        elif len(non_kw_args) == 2:
+            end_arg = non_kw_args[1]
+        elif len(non_kw_args) == 3:
+            end_arg = non_kw_args[1]
+            step_arg = non_kw_args[2]
+    assert isinstance(end_arg, cst.Arg)
+    return end_arg, step_arg
 
-    # `torch.range` documented signature is not a valid Python signature,
-    # so it's hard to generalize this.
-    def _get_range_args(node: cst.Call) -> Tuple[cst.Arg, Optional[cst.Arg]]:
-        "Return (`end`, `step`) from a `range` call"
-        end_arg = None
-        step_arg = None
-        non_kw_args = []
-        for arg in node.args:
-            if arg.keyword is None:
-                non_kw_args.append(arg)
-            elif arg.keyword.value == "end":
-                end_arg = arg
-            elif arg.keyword.value == "step":
-                step_arg = arg
-        if end_arg is None:
-            if len(non_kw_args) == 1:
-                end_arg = non_kw_args[0]
-            elif len(non_kw_args) == 2:
-                end_arg = non_kw_args[1]
-            elif len(non_kw_args) == 3:
-                end_arg = non_kw_args[1]
-                step_arg = non_kw_args[2]
-        assert isinstance(end_arg, cst.Arg)
-        return end_arg, step_arg
 
+def call_replacement_range(node: cst.Call) -> Optional[Callable[[], cst.Call]]:
     end_arg, step_arg = _get_range_args(node)
     step = 1
     if step_arg is not None:
@@ -54,6 +53,13 @@ def call_replacement_range(node: cst.Call) -> Optional[cst.Call]:
         else:
             return None
 
+    return functools.partial(_call_replacement_range, node, end_arg, step)
+
+
+def _call_replacement_range(node: cst.Call, end_arg: cst.Arg, step: int) -> cst.Call:
+    """Replace `range` with `arange`.
+    Add `step` to the `end` argument as `arange` has the interval `[start, end)`.
+    """
     # `end` is a literal (positive) integer
     if isinstance(end_arg.value, cst.Integer):
         end = int(end_arg.value.value) + step
@@ -1,7 +1,9 @@
-from ...common import TorchError, TorchVisitor
+import ast
 
+from ...common import TorchError, TorchNamesVisitor
 
-class TorchScopedLibraryVisitor(TorchVisitor):
+
+class TorchScopedLibraryVisitor(TorchNamesVisitor):
     """
     Suggest `torch.library._scoped_library` for PyTorch tests.
     """
@@ -19,11 +21,19 @@ class TorchScopedLibraryVisitor(TorchVisitor):
         )
     ]
 
-    def visit_Call(self, node):
-        qualified_name = self.get_qualified_name_for_call(node)
-        if qualified_name == "torch.library.Library":
-            self.add_violation(
-                node,
-                error_code=self.ERRORS[0].error_code,
-                message=self.ERRORS[0].message(),
+    TRIGGER_TOKENS = ["Library"]
+
+    QUALIFIED_CALLS = ["torch.library.Library"]
+
+    def visit_qualified_Call(self, node, qualified_name):
+        self.add_violation(
+            node,
+            error_code=self.ERRORS[0].error_code,
+            message=self.ERRORS[0].message(),
+        )
+
+    def visit_ast_Call(self, node: ast.Call) -> None:
+        if self.get_qualified_name_for_ast_call(node) == "torch.library.Library":
+            self.add_ast_violation(
+                node, self.ERRORS[0].error_code, self.ERRORS[0].message()
             )
@@ -1,10 +1,12 @@
+import ast
+
 import libcst as cst
 import libcst.matchers as m
 
-from ...common import TorchError, TorchVisitor
+from ...common import TorchError, TorchNamesVisitor, ast_arg_value, ast_call_args
 
 
-class TorchRequireGradVisitor(TorchVisitor):
+class TorchRequireGradVisitor(TorchNamesVisitor):
     """
     Find and fix common misspelling `require_grad` (instead of `requires_grad`).
     """
@@ -16,6 +18,8 @@ class TorchRequireGradVisitor(TorchVisitor):
         )
     ]
 
+    TRIGGER_TOKENS = ["require_grad"]
+
     def visit_Assign(self, node):
         # Look for any assignment with `require_grad` attribute on the left.
         #
@@ -31,18 +35,28 @@ class TorchRequireGradVisitor(TorchVisitor):
                 ],
             ),
         ):
-            replacement = node.with_deep_changes(
-                old_node=node.targets[0].target.attr, value="requires_grad"
-            )
+            attr = node.targets[0].target.attr
             self.add_violation(
                 node,
                 error_code=self.ERRORS[0].error_code,
                 message=self.ERRORS[0].message(),
-                replacement=replacement,
+                replacement=lambda: node.with_deep_changes(
+                    old_node=attr, value="requires_grad"
+                ),
             )
 
+    def visit_ast_Assign(self, node: ast.Assign) -> None:
+        if (
+            len(node.targets) == 1
+            and isinstance(node.targets[0], ast.Attribute)
+            and node.targets[0].attr == "require_grad"
+        ):
+            self.add_ast_violation(
+                node, self.ERRORS[0].error_code, self.ERRORS[0].message()
+            )
 
-class TorchReentrantCheckpointVisitor(TorchVisitor):
+
+class TorchReentrantCheckpointVisitor(TorchNamesVisitor):
     """
     Find and fix common misuse of reentrant checkpoints.
     """
@@ -58,28 +72,40 @@ class TorchReentrantCheckpointVisitor(TorchVisitor):
         )
     ]
 
-    def visit_Call(self, node):
-        if self.get_qualified_name_for_call(
-            node
-        ) == "torch.utils.checkpoint.checkpoint" and not self.has_specific_arg(
-            node, "use_reentrant"
-        ):
+    TRIGGER_TOKENS = ["checkpoint"]
+
+    QUALIFIED_CALLS = ["torch.utils.checkpoint.checkpoint"]
+
+    def visit_qualified_Call(self, node, qualified_name):
+        if not self.has_specific_arg(node, "use_reentrant"):
             # This codemod maybe  unsafe correctness-wise
             # if reentrant behavior is actually needed,
             # so the changes need to be verified/tested.
-            use_reentrant_arg = cst.ensure_type(
-                cst.parse_expression("f(use_reentrant=False)"), cst.Call
-            ).args[0]
-            replacement = node.with_changes(args=(*node.args, use_reentrant_arg))
+            def make_replacement() -> cst.CSTNode:
+                use_reentrant_arg = cst.ensure_type(
+                    cst.parse_expression("f(use_reentrant=False)"), cst.Call
+                ).args[0]
+                return node.with_changes(args=(*node.args, use_reentrant_arg))
+
             self.add_violation(
                 node,
                 error_code=self.ERRORS[0].error_code,
                 message=self.ERRORS[0].message(),
-                replacement=replacement,
+                replacement=make_replacement,
+            )
+
+    def visit_ast_Call(self, node: ast.Call) -> None:
+        if self.get_qualified_name_for_ast_call(
+            node
+        ) == "torch.utils.checkpoint.checkpoint" and not self.has_specific_ast_arg(
+            node, "use_reentrant"
+        ):
+            self.add_ast_violation(
+                node, self.ERRORS[0].error_code, self.ERRORS[0].message()
             )
 
 
-class TorchLog1pVisitor(TorchVisitor):
+class TorchLog1pVisitor(TorchNamesVisitor):
     """
     Suggest using `torch.log1p(x)` instead of `torch.log(1 + x)`.
     """
@@ -94,34 +120,55 @@ class TorchLog1pVisitor(TorchVisitor):
         )
     ]
 
-    def visit_Call(self, node):
-        if self.get_qualified_name_for_call(node) == "torch.log":
-            if m.matches(
-                node,
-                m.Call(
-                    args=[
-                        m.Arg(
-                            value=m.BinaryOperation(
-                                left=m.Integer(value="1") | m.Float(value="1.0"),
-                                operator=m.Add(),
-                            )
-                            | m.BinaryOperation(
-                                operator=m.Add(),
-                                right=m.Integer(value="1") | m.Float(value="1.0"),
-                            ),
+    TRIGGER_TOKENS = ["log"]
+
+    QUALIFIED_CALLS = ["torch.log"]
+
+    def visit_qualified_Call(self, node, qualified_name):
+        if m.matches(
+            node,
+            m.Call(
+                args=[
+                    m.Arg(
+                        value=m.BinaryOperation(
+                            left=m.Integer(value="1") | m.Float(value="1.0"),
+                            operator=m.Add(),
+                        )
+                        | m.BinaryOperation(
+                            operator=m.Add(),
+                            right=m.Integer(value="1") | m.Float(value="1.0"),
                         ),
-                    ],
-                ),
+                    ),
+                ],
+            ),
+        ):
+            self.add_violation(
+                node,
+                error_code=self.ERRORS[0].error_code,
+                message=self.ERRORS[0].message(),
+                replacement=None,
+            )
+
+    def visit_ast_Call(self, node: ast.Call) -> None:
+        if self.get_qualified_name_for_ast_call(node) == "torch.log":
+            args = ast_call_args(node)
+            if len(args) != 1:
+                return
+            value = ast_arg_value(args[0])
+            if (
+                isinstance(value, ast.BinOp)
+                and isinstance(value.op, ast.Add)
+                and (
+                    self.is_ast_number(value.left, "1", "1.0")
+                    or self.is_ast_number(value.right, "1", "1.0")
+                )
             ):
-                self.add_violation(
-                    node,
-                    error_code=self.ERRORS[0].error_code,
-                    message=self.ERRORS[0].message(),
-                    replacement=None,
+                self.add_ast_violation(
+                    node, self.ERRORS[0].error_code, self.ERRORS[0].message()
                 )
 
 
-class TorchExpm1Visitor(TorchVisitor):
+class TorchExpm1Visitor(TorchNamesVisitor):
     """
     Suggest using `torch.special.expm1(x)` instead of `torch.exp(x) - 1`.
     """
@@ -136,6 +183,8 @@ class TorchExpm1Visitor(TorchVisitor):
         )
     ]
 
+    TRIGGER_TOKENS = ["exp"]
+
     def visit_BinaryOperation(self, node):
         if m.matches(
             node,
@@ -153,8 +202,19 @@ class TorchExpm1Visitor(TorchVisitor):
                     replacement=None,
                 )
 
+    def visit_ast_BinOp(self, node: ast.BinOp) -> None:
+        if (
+            isinstance(node.left, ast.Call)
+            and isinstance(node.op, ast.Sub)
+            and self.is_ast_number(node.right, "1", "1.0")
+            and self.get_qualified_name_for_ast_call(node.left) == "torch.exp"
+        ):
+            self.add_ast_violation(
+                node, self.ERRORS[0].error_code, self.ERRORS[0].message()
+            )
+
 
-class TorchLogsumexpVisitor(TorchVisitor):
+class TorchLogsumexpVisitor(TorchNamesVisitor):
     """
     Suggest using `torch.logsumexp(x)` instead of `torch.log(torch.sum(torch.exp(x))`.
     """
@@ -166,38 +226,62 @@ class TorchLogsumexpVisitor(TorchVisitor):
         )
     ]
 
-    def visit_Call(self, node):
-        if self.get_qualified_name_for_call(node) == "torch.log":
-            if m.matches(
-                node,
-                m.Call(
-                    args=[
-                        m.Arg(m.Call(args=[m.Arg(m.Call()), m.ZeroOrMore()])),
-                        m.ZeroOrMore(),
-                    ]
-                ),
-            ):
-                if self.get_qualified_name_for_call(node.args[0].value) == "torch.sum":
-                    if (
-                        self.get_qualified_name_for_call(
-                            node.args[0].value.args[0].value
-                        )
-                        == "torch.exp"
-                    ):
+    TRIGGER_TOKENS = ["log"]
 
-                        # if `dim` is not provided or None for sum, skip:
-                        # https://github.com/pytorch/pytorch/issues/144339
-                        dim_arg = self.get_specific_arg(
-                            node.args[0].value, arg_name="dim", arg_pos=1
-                        )
-                        if dim_arg is not None:
-                            if not (
-                                isinstance(dim_arg.value, cst.Name)
-                                and dim_arg.value.value == "None"
-                            ):
-                                self.add_violation(
-                                    node,
-                                    error_code=self.ERRORS[0].error_code,
-                                    message=self.ERRORS[0].message(),
-                                    replacement=None,
-                                )
+    QUALIFIED_CALLS = ["torch.log"]
+
+    def visit_qualified_Call(self, node, qualified_name):
+        if m.matches(
+            node,
+            m.Call(
+                args=[
+                    m.Arg(m.Call(args=[m.Arg(m.Call()), m.ZeroOrMore()])),
+                    m.ZeroOrMore(),
+                ]
+            ),
+        ):
+            if self.get_qualified_name_for_call(node.args[0].value) == "torch.sum":
+                if (
+                    self.get_qualified_name_for_call(node.args[0].value.args[0].value)
+                    == "torch.exp"
+                ):
+
+                    # if `dim` is not provided or None for sum, skip:
+                    # https://github.com/pytorch/pytorch/issues/144339
+                    dim_arg = self.get_specific_arg(
+                        node.args[0].value, arg_name="dim", arg_pos=1
+                    )
+                    if dim_arg is not None:
+                        if not (
+                            isinstance(dim_arg.value, cst.Name)
+                            and dim_arg.value.value == "None"
+                        ):
+                            self.add_violation(
+                                node,
+                                error_code=self.ERRORS[0].error_code,
+                                message=self.ERRORS[0].message(),
+                                replacement=None,
+                            )
+
+    def visit_ast_Call(self, node: ast.Call) -> None:
+        if self.get_qualified_name_for_ast_call(node) != "torch.log":
+            return
+        args = ast_call_args(node)
+        sum_call = ast_arg_value(args[0]) if args else None
+        if not isinstance(sum_call, ast.Call):
+            return
+        sum_args = ast_call_args(sum_call)
+        exp_call = ast_arg_value(sum_args[0]) if sum_args else None
+        if (
+            isinstance(exp_call, ast.Call)
+            and self.get_qualified_name_for_ast_call(sum_call) == "torch.sum"
+            and self.get_qualified_name_for_ast_call(exp_call) == "torch.exp"
+        ):
+            # Same conditions on `dim` as for libcst.
+            dim = self.get_specific_ast_arg(sum_call, arg_name="dim", arg_pos=1)
+            if dim is not None and not (
+                isinstance(dim, ast.Constant) and dim.value is None
+            ):
+                self.add_ast_violation(
+                    node, self.ERRORS[0].error_code, self.ERRORS[0].message()
+                )
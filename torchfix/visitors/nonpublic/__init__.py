@@ -1,16 +1,18 @@
+import ast
 from typing import List
 
 import libcst as cst
 
 from ...common import (
     TorchError,
-    TorchVisitor,
-    call_with_name_changes,
+    TorchNamesVisitor,
     check_old_names_in_import_from,
+    old_names_in_ast_import_from,
 )
+from ...rules import load_rules
 
 
-class TorchNonPublicAliasVisitor(TorchVisitor):
+class TorchNonPublicAliasVisitor(TorchNamesVisitor):
     """
     Suggest to use public APIs instead of non-public aliases.
 
@@ -18,6 +20,8 @@ class TorchNonPublicAliasVisitor(TorchVisitor):
     torch.utils.data._utils.collate.default_collate and
     torch.utils.data._utils.collate.default_convert,
     see https://github.com/pytorch/pytorch/pull/69862/files
+
+    The aliases are defined by the rules in `rules.yaml`, see `torchfix.rules`.
     """
 
     ERRORS: List[TorchError] = [
@@ -37,37 +41,15 @@ class TorchNonPublicAliasVisitor(TorchVisitor):
         ),
     ]
 
-    # fmt: off
-    ALIASES = {
-        "torch.utils.data._utils.collate.default_collate": "torch.utils.data.dataloader.default_collate",  # noqa: E501
-        "torch.utils.data._utils.collate.default_convert": "torch.utils.data.dataloader.default_convert",  # noqa: E501
-    }
-    # fmt: on
-
-    def visit_Call(self, node):
-        qualified_name = self.get_qualified_name_for_call(node)
-        if qualified_name is None:
-            return
+    RULES_PATH = "visitors/nonpublic/rules.yaml"
+    RULES = load_rules(RULES_PATH, ERRORS)
 
-        if qualified_name in self.ALIASES:
-            public_name = self.ALIASES[qualified_name]
-            error_code = self.ERRORS[0].error_code
-            message = self.ERRORS[0].message(
-                private_name=qualified_name, public_name=public_name
-            )
+    ALIASES = {name: rule.rename for name, (rule,) in RULES.rules.items()}
 
-            replacement_and_imports = call_with_name_changes(
-                node, qualified_name, public_name
-            )
-            if replacement_and_imports is not None:
-                replacement, imports = replacement_and_imports
-                self.needed_imports.update(imports)
-            else:
-                replacement = None
+    TRIGGER_TOKENS = [name.rsplit(".", 1)[-1] for name in ALIASES]
 
-            self.add_violation(
-                node, error_code=error_code, message=message, replacement=replacement
-            )
+    def visit_ast_Call(self, node: ast.Call) -> None:
+        self.RULES.report_ast(self, node)
 
     def visit_ImportFrom(self, node: cst.ImportFrom) -> None:
         if node.module is None:
@@ -86,3 +68,10 @@ class TorchNonPublicAliasVisitor(TorchVisitor):
                 message=message,
                 replacement=replacement,
             )
+
+    def visit_ast_ImportFrom(self, node: ast.ImportFrom) -> None:
+        for qualified_name in old_names_in_ast_import_from(node, self.ALIASES):
+            message = self.ERRORS[1].message(
+                private_name=qualified_name, public_name=self.ALIASES[qualified_name]
+            )
+            self.add_ast_violation(node, self.ERRORS[1].error_code, message)
@@ -1,9 +1,11 @@
+import ast
+
 import libcst.matchers as m
 
-from ...common import TorchError, TorchVisitor
+from ...common import TorchError, TorchNamesVisitor, TorchVisitor
 
 
-class TorchSynchronizedDataLoaderVisitor(TorchVisitor):
+class TorchSynchronizedDataLoaderVisitor(TorchNamesVisitor):
     """
     Reimplementation of SynchronizedDataLoaderPattern from
     https://github.com/pytorch/pytorch/blob/main/torch/profiler/_pattern_matcher.py
@@ -20,17 +22,28 @@ class TorchSynchronizedDataLoaderVisitor(TorchVisitor):
         )
     ]
 
-    def visit_Call(self, node):
-        qualified_name = self.get_qualified_name_for_call(node)
+    TRIGGER_TOKENS = ["DataLoader"]
+
+    QUALIFIED_CALLS = ["torch.utils.data.DataLoader"]
+
+    def visit_qualified_Call(self, node, qualified_name):
+        num_workers_arg = self.get_specific_arg(node, "num_workers", 5)
+        if num_workers_arg is None or m.matches(
+            num_workers_arg.value, m.Integer(value="0")
+        ):
+            self.add_violation(
+                node,
+                error_code=self.ERRORS[0].error_code,
+                message=self.ERRORS[0].message(),
+            )
+
+    def visit_ast_Call(self, node: ast.Call) -> None:
+        qualified_name = self.get_qualified_name_for_ast_call(node)
         if qualified_name == "torch.utils.data.DataLoader":
-            num_workers_arg = self.get_specific_arg(node, "num_workers", 5)
-            if num_workers_arg is None or m.matches(
-                num_workers_arg.value, m.Integer(value="0")
-            ):
-                self.add_violation(
-                    node,
-                    error_code=self.ERRORS[0].error_code,
-                    message=self.ERRORS[0].message(),
+            num_workers = self.get_specific_ast_arg(node, "num_workers", 5)
+            if num_workers is None or self.is_ast_number(num_workers, "0"):
+                self.add_ast_violation(
+                    node, self.ERRORS[0].error_code, self.ERRORS[0].message()
                 )
 
 
@@ -50,6 +63,11 @@ class TorchGradNotSetToNonePatternVisitor(TorchVisitor):
         )
     ]
 
+    TRIGGER_TOKENS = ["zero_grad"]
+
+    # Looks for `zero_grad` methods of any objects, not only torch names,
+    # so it's not a `TorchNamesVisitor`.
+
     def visit_Call(self, node):
         qualified_name = self.get_qualified_name_for_call(node)
 
@@ -65,3 +83,12 @@ class TorchGradNotSetToNonePatternVisitor(TorchVisitor):
                         error_code=self.ERRORS[0].error_code,
                         message=self.ERRORS[0].message(),
                     )
+
+    def visit_ast_Call(self, node: ast.Call) -> None:
+        qualified_name = self.get_qualified_name_for_ast_call(node)
+        if qualified_name and qualified_name.endswith("zero_grad"):
+            set_to_none = self.get_specific_ast_arg(node, "set_to_none", 0)
+            if isinstance(set_to_none, ast.Constant) and set_to_none.value is False:
+                self.add_ast_violation(
+                    node, self.ERRORS[0].error_code, self.ERRORS[0].message()
+                )
@@ -1,9 +1,11 @@
+import ast
+
 import libcst as cst
 
-from ...common import TorchError, TorchVisitor
+from ...common import TorchError, TorchNamesVisitor
 
 
-class TorchUnsafeLoadVisitor(TorchVisitor):
+class TorchUnsafeLoadVisitor(TorchNamesVisitor):
     """
     Warn on `torch.load` not having explicit `weights_only`.
     See https://github.com/pytorch/pytorch/issues/31875.
@@ -22,10 +24,12 @@ class TorchUnsafeLoadVisitor(TorchVisitor):
         )
     ]
 
-    def visit_Call(self, node):
-        if self.get_qualified_name_for_call(
-            node
-        ) == "torch.load" and not self.has_specific_arg(node, "weights_only"):
+    TRIGGER_TOKENS = ["load"]
+
+    QUALIFIED_CALLS = ["torch.load"]
+
+    def visit_qualified_Call(self, node, qualified_name):
+        if not self.has_specific_arg(node, "weights_only"):
             # Add `weights_only=True` if there is no `pickle_module`.
             # (do not add `weights_only=False` with `pickle_module`, as it
             # needs to be an explicit choice).
@@ -34,15 +38,26 @@ class TorchUnsafeLoadVisitor(TorchVisitor):
             # because full pickling functionality may still be needed
             # even without `pickle_module`,
             # so the changes need to be verified/tested.
-            replacement = None
-            if not self.has_specific_arg(node, "pickle_module", 2):
+            def make_replacement() -> cst.CSTNode:
                 weights_only_arg = cst.ensure_type(
                     cst.parse_expression("f(weights_only=True)"), cst.Call
                 ).args[0]
-                replacement = node.with_changes(args=(*node.args, weights_only_arg))
+                return node.with_changes(args=(*node.args, weights_only_arg))
+
+            replacement = None
+            if not self.has_specific_arg(node, "pickle_module", 2):
+                replacement = make_replacement
             self.add_violation(
                 node,
                 error_code=self.ERRORS[0].error_code,
                 message=self.ERRORS[0].message(),
                 replacement=replacement,
             )
+
+    def visit_ast_Call(self, node: ast.Call) -> None:
+        if self.get_qualified_name_for_ast_call(
+            node
+        ) == "torch.load" and not self.has_specific_ast_arg(node, "weights_only"):
+            self.add_ast_violation(
+                node, self.ERRORS[0].error_code, self.ERRORS[0].message()
+            )
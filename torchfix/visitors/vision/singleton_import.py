@@ -1,10 +1,12 @@
+import ast
+
 import libcst as cst
 import libcst.matchers as m
 
-from ...common import TorchError, TorchVisitor
+from ...common import TorchError, TorchNamesVisitor
 
 
-class TorchVisionSingletonImportVisitor(TorchVisitor):
+class TorchVisionSingletonImportVisitor(TorchNamesVisitor):
     ERRORS = [
         TorchError(
             "TOR203",
@@ -15,6 +17,8 @@ class TorchVisionSingletonImportVisitor(TorchVisitor):
         ),
     ]
 
+    TRIGGER_TOKENS = ["torchvision"]
+
     # Keep attr order in sync with ERRORS.
     REPLACEABLE_ATTRS = ["datasets", "models", "transforms"]
 
@@ -44,3 +48,16 @@ class TorchVisionSingletonImportVisitor(TorchVisitor):
                         replacement=replacement,
                     )
                 break
+
+    def visit_ast_Import(self, node: ast.Import) -> None:
+        # Only the first name is checked, as for libcst.
+        alias = node.names[0]
+        if (
+            alias.asname in self.REPLACEABLE_ATTRS
+            and alias.name == f"torchvision.{alias.asname}"
+        ):
+            self.add_ast_violation(
+                node,
+                self.ERRORS[0].error_code,
+                self.ERRORS[0].message(module=alias.asname),
+            )
@@ -1,8 +1,9 @@
+import ast
 from collections.abc import Sequence
 
 import libcst as cst
 
-from ...common import TorchError, TorchVisitor
+from ...common import TorchError, TorchNamesVisitor
 
 MESSAGE = (
     "The transform `v2.ToTensor()` is deprecated and will be removed "
@@ -11,12 +12,21 @@ MESSAGE = (
 )
 
 
-class TorchVisionDeprecatedToTensorVisitor(TorchVisitor):
+class TorchVisionDeprecatedToTensorVisitor(TorchNamesVisitor):
     ERRORS = [TorchError("TOR202", MESSAGE)]
 
+    TRIGGER_TOKENS = ["ToTensor"]
+
+    QUALIFIED_ATTRIBUTES = ["torchvision.transforms.v2.ToTensor"]
+
     def _maybe_add_violation(self, qualified_name, node):
         if qualified_name != "torchvision.transforms.v2.ToTensor":
             return
+        if isinstance(node, ast.AST):
+            self.add_ast_violation(
+                node, self.ERRORS[0].error_code, self.ERRORS[0].message()
+            )
+            return
         self.add_violation(
             node, error_code=self.ERRORS[0].error_code, message=self.ERRORS[0].message()
         )
@@ -34,8 +44,18 @@ class TorchVisionDeprecatedToTensorVisitor(TorchVisitor):
                     f"{module_path}.{import_node.evaluated_name}", import_node
                 )
 
-    def visit_Attribute(self, node):
-        qualified_names = self.get_metadata(cst.metadata.QualifiedNameProvider, node)
+    def visit_qualified_Attribute(self, node, qualified_name):
+        self._maybe_add_violation(qualified_name, node)
+
+    def visit_ast_ImportFrom(self, node: ast.ImportFrom) -> None:
+        if node.level or node.module is None:
+            return
+        for alias in node.names:
+            self._maybe_add_violation(f"{node.module}.{alias.name}", alias)
+
+    def visit_ast_Attribute(self, node: ast.Attribute) -> None:
+        assert self.ast_context is not None
+        qualified_names = self.ast_context.qualified_names(node)
         if len(qualified_names) != 1:
             return
 
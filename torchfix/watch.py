@@ -0,0 +1,308 @@
+import ctypes
+import ctypes.util
+import difflib
+import os
+import select
+import struct
+import sys
+import time
+from dataclasses import replace
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+import libcst.codemod as codemod
+
+from .executor import create_pool, execute_files
+from .prefilter import filter_files
+from .report import display_path, format_codemod_result
+from .torchfix import TorchCodemod, TorchCodemodConfig
+
+# After a change, wait this long for more changes before re-linting,
+# as editors often write files in several steps.
+DEBOUNCE_SECONDS = 0.1
+POLL_INTERVAL_SECONDS = 1.0
+
+# From <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_MODIFY
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _is_python_file(path: str) -> bool:
+    return path.endswith(".py")
+
+
+def _is_watched_dir(name: str) -> bool:
+    # Skip VCS and other hidden directories, they change often.
+    return not name.startswith(".")
+
+
+def _walk(path: str, on_dir: Optional[Callable[[str], None]] = None) -> List[str]:
+    """Return the Python files under `path`, calling `on_dir` for each directory."""
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = [d for d in dirs if _is_watched_dir(d)]
+        if on_dir is not None:
+            on_dir(root)
+        files += [os.path.join(root, n) for n in names if _is_python_file(n)]
+    return files
+
+
+class PollingWatcher:
+    """Detect changed Python files by periodically comparing their stats."""
+
+    def __init__(self, paths: Sequence[str], interval: float = POLL_INTERVAL_SECONDS):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.interval = interval
+        self._stats = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        stats = {}
+        for path in self.paths:
+            files = _walk(path) if os.path.isdir(path) else [path]
+            for file in files:
+                try:
+                    stat = os.stat(file)
+                except OSError:
+                    continue
+                stats[file] = (stat.st_mtime_ns, stat.st_size)
+        return stats
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        """
+        Wait up to `timeout` seconds (forever if None) for changes
+        and return the changed, created or deleted files.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stats = self._scan()
+            changed = {
+                path
+                for path in stats.keys() | self._stats.keys()
+                if stats.get(path) != self._stats.get(path)
+            }
+            self._stats = stats
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, max(deadline - time.monotonic(), 0))
+            time.sleep(delay)
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """Detect changed Python files with Linux inotify, watching directories."""
+
+    def __init__(self, paths: Sequence[str]) -> None:
+        libc_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: Dict[int, str] = {}
+        # Files watched on their own, not as part of a watched tree.
+        self._files: Set[str] = set()
+        self._trees: List[str] = []
+        try:
+            for path in paths:
+                path = os.path.abspath(path)
+                if os.path.isdir(path):
+                    self._trees.append(path)
+                    self._add_tree(path)
+                else:
+                    self._files.add(path)
+                    self._add_dir(os.path.dirname(path))
+        except BaseException:
+            self.close()
+            raise
+
+    def _add_dir(self, path: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self._dirs[wd] = path
+
+    def _add_tree(self, path: str) -> List[str]:
+        """Watch `path` recursively and return the Python files in it."""
+        return _walk(path, self._add_dir)
+
+    def _is_watched_file(self, path: str) -> bool:
+        if path in self._files:
+            return True
+        return _is_python_file(path) and any(
+            path.startswith(tree + os.sep) for tree in self._trees
+        )
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        """
+        Wait up to `timeout` seconds (forever if None) for changes
+        and return the changed, created or deleted files.
+        """
+        changed: Set[str] = set()
+        while not changed:
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+            if not readable:
+                break
+            changed = self._read_events()
+        return changed
+
+    def _read_events(self) -> Set[str]:
+        changed: Set[str] = set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            directory = self._dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                # Files can be created in a new directory before it's watched.
+                if mask & (IN_CREATE | IN_MOVED_TO) and _is_watched_dir(name):
+                    if any(path.startswith(tree + os.sep) for tree in self._trees):
+                        changed.update(self._add_tree(path))
+            elif self._is_watched_file(path):
+                changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def create_watcher(paths: Sequence[str]) -> Union[InotifyWatcher, PollingWatcher]:
+    """Return an `InotifyWatcher` if inotify is available, else a `PollingWatcher`."""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError):
+            # No inotify in libc, or out of watches.
+            pass
+    return PollingWatcher(paths)
+
+
+def _violation_key(record: Dict[str, Any]) -> Tuple[str, str]:
+    # Positions are not compared, so that e.g. inserting a line
+    # doesn't report all the following violations as changed.
+    return record["error_code"], record["message"]
+
+
+def violations_delta(
+    old: List[Dict[str, Any]], new: List[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Return the `(added, removed)` violation records between two lists
+    of records, each sorted by position.
+    """
+    matcher = difflib.SequenceMatcher(
+        None, [_violation_key(r) for r in old], [_violation_key(r) for r in new]
+    )
+    added = []
+    removed = []
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag != "equal":
+            removed += old[old_start:old_end]
+            added += new[new_start:new_end]
+    return added, removed
+
+
+def _sort_key(record: Dict[str, Any]) -> Tuple[int, int, str]:
+    return record["line"], record["column"], record["error_code"]
+
+
+def watch(
+    paths: Sequence[str],
+    transformer: TorchCodemod,
+    jobs: Optional[int] = None,
+    stderr: Optional[TextIO] = None,
+) -> None:
+    """
+    Lint `paths`, then re-lint the files that change, printing the violations
+    added (`+`) or removed (`-`) in each of them, until interrupted.
+
+    The worker pool and the visitors in it stay warm between runs.
+    Files are only checked, fixes are never written.
+    """
+    stderr = stderr or sys.stderr
+    # Without `report_only`, executing files writes the fixes back to them.
+    config = replace(transformer.config or TorchCodemodConfig(), report_only=True)
+    transformer = TorchCodemod(transformer.context, config)
+    watcher = create_watcher(paths)
+    # File name -> violation records sorted by position.
+    violations: Dict[str, List[Dict[str, Any]]] = {}
+
+    def lint(files: List[str], prefix: str) -> None:
+        existing = [f for f in files if os.path.isfile(f)]
+        new_violations: Dict[str, List[Dict[str, Any]]] = {f: [] for f in files}
+        for result in execute_files(
+            transformer,
+            list(filter_files(existing)),
+            jobs=jobs,
+            unified_diff=None,
+            pool=pool,
+        ):
+            if result.status == "failure":
+                print(f"Failed to check {result.filename}", file=stderr)
+            new_violations[result.filename] = sorted(result.violations, key=_sort_key)
+
+        for filename, new in sorted(new_violations.items()):
+            added, removed = violations_delta(violations.get(filename, []), new)
+            path = display_path(filename)
+            for record in removed:
+                print(f"-{path}{format_codemod_result(record)}")
+            for record in added:
+                print(f"{prefix}{path}{format_codemod_result(record)}")
+            if new:
+                violations[filename] = new
+            else:
+                violations.pop(filename, None)
+        sys.stdout.flush()
+
+    try:
+        with create_pool(jobs) as pool:
+            files = sorted({os.path.abspath(f) for f in codemod.gather_files(paths)})
+            lint(files, prefix="")
+            print(
+                f"Watching {len(files)} files for changes, press Ctrl+C to stop.",
+                file=stderr,
+            )
+            while True:
+                changed = watcher.wait()
+                while True:
+                    more = watcher.wait(DEBOUNCE_SECONDS)
+                    if not more:
+                        break
+                    changed |= more
+                lint(sorted(changed), prefix="+")
+    finally:
+        watcher.close()
@@ -0,0 +1,172 @@
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+from multiprocessing.connection import Connection
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class WorkerDiedError(Exception):
+    pass
+
+
+def _worker_main(
+    conn: Connection,
+    initializer: Callable[..., None],
+    initargs: Tuple,
+    should_retire: Callable[[], bool],
+) -> None:
+    initializer(*initargs)
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        func, args = task
+        try:
+            result = (True, func(*args))
+        except Exception as e:
+            result = (False, e)
+        retire = should_retire()
+        conn.send((*result, retire))
+        if retire:
+            break
+    conn.close()
+
+
+class RecyclingPool:
+    """
+    Process pool replacing workers that retire, e.g. after processing a number
+    of files or reaching a memory limit.
+
+    After each task, a worker calls `should_retire` and exits if it returns True;
+    a fresh worker is started for the next task.
+    Unlike `multiprocessing.Pool`, if a worker dies while running a task
+    (e.g. killed by the OOM killer), the task fails with `WorkerDiedError`
+    instead of never completing.
+
+    Only the subset of the `multiprocessing.Pool` interface
+    used by the executor is supported.
+    """
+
+    def __init__(
+        self,
+        processes: int,
+        initializer: Callable[..., None],
+        initargs: Tuple,
+        should_retire: Callable[[], bool],
+    ) -> None:
+        self._initializer = initializer
+        self._initargs = initargs
+        self._should_retire = should_retire
+        self._tasks: queue.SimpleQueue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._processes: List[multiprocessing.Process] = []
+        self._terminated = False
+        # One thread per worker process, feeding it tasks one at a time.
+        self._threads = [
+            threading.Thread(target=self._manage_worker, daemon=True)
+            for _ in range(processes)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def apply_async(
+        self,
+        func: Callable,
+        args: Tuple = (),
+        callback: Optional[Callable[[Any], None]] = None,
+        error_callback: Optional[Callable[[BaseException], None]] = None,
+    ) -> None:
+        self._tasks.put((func, args, callback, error_callback))
+
+    def _start_worker(self) -> Tuple[multiprocessing.Process, Connection]:
+        conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=_worker_main,
+            args=(child_conn, self._initializer, self._initargs, self._should_retire),
+            daemon=True,
+        )
+        with self._lock:
+            if self._terminated:
+                raise WorkerDiedError("Pool is terminated")
+            process.start()
+            self._processes.append(process)
+        # Only the worker should hold its end, to get EOF if it dies.
+        child_conn.close()
+        return process, conn
+
+    def _stop_worker(self, process: multiprocessing.Process, conn: Connection) -> None:
+        conn.close()
+        process.join()
+        with self._lock:
+            self._processes.remove(process)
+
+    def _manage_worker(self) -> None:
+        process: Optional[multiprocessing.Process] = None
+        conn: Optional[Connection] = None
+        for func, args, callback, error_callback in iter(self._tasks.get, None):
+            try:
+                if process is None or conn is None:
+                    process, conn = self._start_worker()
+                conn.send((func, args))
+                success, value, retire = conn.recv()
+            except (EOFError, OSError, WorkerDiedError) as e:
+                error: BaseException = e
+                if process is not None and conn is not None:
+                    self._stop_worker(process, conn)
+                    error = WorkerDiedError(
+                        f"Worker process died with exit code {process.exitcode}"
+                    )
+                    process = conn = None
+                if error_callback is not None:
+                    error_callback(error)
+                continue
+
+            if success:
+                if callback is not None:
+                    callback(value)
+            elif error_callback is not None:
+                error_callback(value)
+
+            if retire:
+                self._stop_worker(process, conn)
+                process = conn = None
+
+        if process is not None and conn is not None:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            self._stop_worker(process, conn)
+
+    def terminate(self) -> None:
+        with self._lock:
+            self._terminated = True
+            for process in self._processes:
+                process.terminate()
+        for _ in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self) -> "RecyclingPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.terminate()
+
+
+def current_rss() -> int:
+    """Resident set size of the current process, in bytes."""
+    try:
+        # Linux: the second field is the number of resident pages.
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        pass
+    # Peak rather than current RSS, in kilobytes on Linux and bytes on macOS.
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024